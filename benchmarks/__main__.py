@@ -0,0 +1,95 @@
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+
+from benchmarks import bench_memory, bench_protocol, bench_reports, bench_state
+
+""" Runs the joycontrol benchmarks, no Bluetooth hardware required.
+
+Results are printed and optionally written to a JSON file. Comparing against the JSON file of an earlier run reports
+regressions, the exit code is 1 if any benchmark got worse than the threshold.
+
+Usage:
+    python -m benchmarks [--quick] [--only <group>...] [--output <json_file>]
+                         [--compare <baseline_json_file>] [--threshold <ratio>]
+    python -m benchmarks -h | --help
+"""
+
+GROUPS = {
+    'reports': bench_reports,
+    'state': bench_state,
+    'memory': bench_memory,
+    'protocol': bench_protocol,
+}
+
+
+def compare(results, baseline, threshold):
+    """
+    :param results: list of result dicts
+    :param baseline: list of result dicts of an earlier run
+    :param threshold: allowed relative change, e.g. 0.1 for 10 %
+    :returns list of (name, baseline value, value, relative change) of regressed benchmarks
+    """
+    previous = {result['name']: result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result['name'])
+        if old is None or not old['value']:
+            continue
+        change = (result['value'] - old['value']) / old['value']
+        if result['higher_is_better']:
+            change = -change
+        if change > threshold:
+            regressions.append((result['name'], old['value'], result['value'], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quick', action='store_true', help='fewer repetitions and shorter runs')
+    parser.add_argument('--only', nargs='+', choices=sorted(GROUPS), default=None, help='run these groups only')
+    parser.add_argument('--output', help='write the results to a JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change counted as regression, default 0.1')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    results = []
+    for name, module in GROUPS.items():
+        if args.only is not None and name not in args.only:
+            continue
+        for result in module.run(quick=args.quick):
+            print(result)
+            results.append(result.to_dict())
+
+    report = {
+        'time': time.time(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=4)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print(f'REGRESSION {name}: {old:.3f} -> {new:.3f} ({change * 100:+.1f} %)')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions above {args.threshold * 100:.0f} %')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from benchmarks.common import time_call
+from joycontrol.memory import FlashMemory
+
+"""
+FlashMemory creation, loading of dumps and reads as done for SPI flash read requests.
+"""
+
+
+def run(quick=False):
+    repeat = 3 if quick else 5
+    results = []
+
+    results.append(time_call('memory.create_default', FlashMemory, repeat=repeat))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'spi_flash.bin')
+        with open(path, 'wb') as dump:
+            dump.write(bytes(FlashMemory().data))
+
+        def load():
+            FlashMemory.from_file(path).close()
+
+        results.append(time_call('memory.load_file', load, repeat=repeat))
+
+        memory = FlashMemory.from_file(path)
+        try:
+            results.append(time_call('memory.read_0x18', lambda: memory[0x6080:0x6098], repeat=repeat))
+            results.append(time_call('memory.read_0x18_bytes', lambda: bytes(memory[0x6080:0x6098]), repeat=repeat))
+        finally:
+            memory.close()
+    return results
@@ -0,0 +1,114 @@
+import asyncio
+import statistics
+import time
+
+from benchmarks.common import Result
+from joycontrol.controller import Controller
+from joycontrol.loopback import create_loopback_connection
+from joycontrol.protocol import controller_protocol_factory
+from joycontrol.report import SubCommand, SPI_FLASH_READ_REQUEST
+from joycontrol.scheduler import TickEngine, RATE_66HZ
+
+"""
+Sub command reply latency and sustained full input report mode rate, using the loopback transport.
+"""
+
+CONTROLLER_COUNTS = (1, 4, 16)
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(percentile * len(values)))]
+
+
+async def _close(connections):
+    for transport, protocol, console in connections:
+        await console.close()
+        await transport.close()
+
+
+async def _measure_replies(console, count):
+    latencies = []
+    for i in range(count):
+        # different offsets, identical requests are treated as repetitions of a lost reply (see HandshakePacer)
+        request = SPI_FLASH_READ_REQUEST.pack(0x6000 + (i % 0x100) * 0x10, 0x10)
+        start = time.perf_counter()
+        await console.send_sub_command(SubCommand.SPI_FLASH_READ, request)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _latency_results(name, latencies):
+    return [
+        Result(f'{name}.median', statistics.median(latencies) * 1e6, 'us', count=len(latencies)),
+        Result(f'{name}.p99', _percentile(latencies, 0.99) * 1e6, 'us', count=len(latencies)),
+    ]
+
+
+async def sub_command_latency(requests):
+    """
+    Reply latency of SPI flash reads before and in the full input report mode.
+    In the full mode replies are send with the next tick.
+    """
+    connection = await create_loopback_connection(controller_protocol_factory(Controller.PRO_CONTROLLER))
+    transport, protocol, console = connection
+    try:
+        results = _latency_results('protocol.sub_command_latency', await _measure_replies(console, requests))
+
+        await console.pair()
+        results += _latency_results('protocol.sub_command_latency_full_mode',
+                                    await _measure_replies(console, max(10, requests // 10)))
+        return results
+    finally:
+        await _close([connection])
+
+
+async def full_mode_rate(count, duration, rate=RATE_66HZ):
+    """
+    Sustained report rate of several controllers driven by one tick engine.
+    """
+    engine = TickEngine(rate=rate)
+    factory = controller_protocol_factory(Controller.PRO_CONTROLLER, tick_engine=engine)
+    connections = [await create_loopback_connection(factory) for _ in range(count)]
+    try:
+        await asyncio.gather(*(console.pair() for _, _, console in connections))
+        # the Switch sends rumble at the report rate
+        for _, _, console in connections:
+            console.start_rumble(1 / rate)
+
+        # let the pairing pacing settle
+        await asyncio.sleep(0.5)
+        for _, _, console in connections:
+            console.reset_statistics()
+        engine.timing.reset()
+        engine.scheduler.statistics.reset()
+
+        await asyncio.sleep(duration)
+
+        rates = [console.get_report_rate() for _, _, console in connections]
+        max_interval = max(console.report_intervals.max for _, _, console in connections)
+        name = f'protocol.full_mode_{count}'
+        return [
+            Result(f'{name}.min_rate', min(rates), 'Hz', higher_is_better=True, target=rate),
+            Result(f'{name}.mean_rate', statistics.mean(rates), 'Hz', higher_is_better=True, target=rate),
+            Result(f'{name}.max_interval', max_interval * 1e3, 'ms', target=1e3 / rate),
+            Result(f'{name}.mean_tick_time', engine.timing.get_mean_tick_time() * 1e6, 'us',
+                   max_prepare=engine.timing.max_prepare_time * 1e6, max_send=engine.timing.max_send_time * 1e6),
+            Result(f'{name}.mean_lateness', engine.scheduler.statistics.get_mean_lateness() * 1e6, 'us',
+                   max_lateness=engine.scheduler.statistics.max_lateness * 1e6,
+                   skipped_ticks=engine.scheduler.statistics.skipped_ticks),
+        ]
+    finally:
+        engine.stop()
+        await _close(connections)
+
+
+async def run_async(quick=False):
+    results = await sub_command_latency(100 if quick else 1000)
+    for count in CONTROLLER_COUNTS:
+        results += await full_mode_rate(count, 2 if quick else 10)
+    return results
+
+
+def run(quick=False):
+    return asyncio.get_event_loop().run_until_complete(run_async(quick))
@@ -0,0 +1,67 @@
+from benchmarks.common import time_call
+from joycontrol.controller import Controller
+from joycontrol.controller_state import ButtonState, StickState
+from joycontrol.report import InputReport, OutputReport, SubCommand, SPI_FLASH_READ_REQUEST, \
+    classify_output_report, create_sub_command_reply
+from joycontrol.rumble import NEUTRAL_RUMBLE_DATA
+
+"""
+InputReport construction and serialization, OutputReport parsing.
+"""
+
+
+def _output_report(data):
+    report = bytearray(50)
+    report[0:2] = b'\xA2\x01'
+    report[3:11] = NEUTRAL_RUMBLE_DATA
+    report[11:11 + len(data)] = data
+    return bytes(report)
+
+
+def run(quick=False):
+    repeat = 3 if quick else 5
+    results = []
+
+    results.append(time_call('reports.input_report_create', InputReport, repeat=repeat))
+    results.append(time_call('reports.sub_command_reply_create',
+                             lambda: create_sub_command_reply(0x80, SubCommand.SET_PLAYER_LIGHTS), repeat=repeat))
+
+    # serialization of a full mode report with a changing button, as done once per tick
+    button_state = ButtonState(Controller.PRO_CONTROLLER)
+    l_stick = StickState()
+    r_stick = StickState()
+    report = InputReport()
+    report.set_input_report_id(0x30)
+    report.set_vibrator_input()
+    report.set_misc()
+    timer = [0]
+
+    def update_changed():
+        button_state.set_button('a', not button_state.get_button('a'))
+        report.update_controller_status(button_state, l_stick, r_stick)
+        timer[0] = (timer[0] + 1) % 0x100
+        report.set_timer(timer[0])
+        return report.get_view()
+
+    def update_unchanged():
+        report.update_controller_status(button_state, l_stick, r_stick)
+        report.set_timer(0)
+        return report.get_view()
+
+    results.append(time_call('reports.input_report_update_changed', update_changed, repeat=repeat))
+    results.append(time_call('reports.input_report_update_unchanged', update_unchanged, repeat=repeat))
+    results.append(time_call('reports.input_report_bytes', lambda: bytes(report), repeat=repeat))
+
+    # parsing of received output reports
+    rumble = bytes(b'\xA2\x10\x00' + NEUTRAL_RUMBLE_DATA)
+    spi_read = _output_report(bytes([SubCommand.SPI_FLASH_READ.value]) + SPI_FLASH_READ_REQUEST.pack(0x6000, 0x10))
+
+    def parse_sub_command():
+        output_report = OutputReport(spi_read)
+        output_report.get_sub_command_id()
+        return SPI_FLASH_READ_REQUEST.unpack_from(output_report.get_sub_command_data())
+
+    results.append(time_call('reports.output_report_classify', lambda: classify_output_report(rumble),
+                             repeat=repeat))
+    results.append(time_call('reports.output_report_parse_sub_command', parse_sub_command, repeat=repeat))
+    return results
@@ -0,0 +1,46 @@
+from benchmarks.common import time_call
+from joycontrol.controller import Controller
+from joycontrol.controller_state import ButtonState, StickState
+
+"""
+ButtonState and StickState updates and encoding.
+"""
+
+
+def run(quick=False):
+    repeat = 3 if quick else 5
+    results = []
+
+    button_state = ButtonState(Controller.PRO_CONTROLLER)
+    mask = button_state.get_mask('a', 'b', 'zr')
+
+    def toggle_button():
+        button_state.set_button('a', not button_state.get_button('a'))
+
+    def toggle_mask():
+        button_state.set_mask(mask, not button_state.get_button('b'))
+
+    def toggle_and_encode():
+        button_state.set_button('a', not button_state.get_button('a'))
+        return bytes(button_state)
+
+    results.append(time_call('state.button_set_button', toggle_button, repeat=repeat))
+    results.append(time_call('state.button_set_mask', toggle_mask, repeat=repeat))
+    results.append(time_call('state.button_set_and_encode', toggle_and_encode, repeat=repeat))
+    results.append(time_call('state.button_encode_cached', lambda: bytes(button_state), repeat=repeat))
+
+    stick_state = StickState()
+    position = [0]
+
+    def move_stick():
+        position[0] = (position[0] + 1) % 0x1000
+        stick_state.set_position(position[0], 0x1000 - 1 - position[0])
+
+    def move_and_encode():
+        move_stick()
+        return bytes(stick_state)
+
+    results.append(time_call('state.stick_set_position', move_stick, repeat=repeat))
+    results.append(time_call('state.stick_set_and_encode', move_and_encode, repeat=repeat))
+    results.append(time_call('state.stick_encode_cached', lambda: bytes(stick_state), repeat=repeat))
+    return results
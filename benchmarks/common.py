@@ -0,0 +1,47 @@
+import statistics
+import timeit
+
+"""
+Helpers shared by the benchmark modules. Every module provides run(quick) returning a list of Results.
+"""
+
+
+class Result:
+    """
+    Result of a benchmark.
+    """
+    def __init__(self, name, value, unit, higher_is_better=False, **extra):
+        """
+        :param name: dotted name, e.g. reports.input_report_create
+        :param value: compared against baselines, e.g. median time per call
+        :param unit: unit of value
+        :param higher_is_better: True for rates, False for durations
+        :param extra: further JSON serializable details
+        """
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+        self.extra = extra
+
+    def to_dict(self):
+        return dict(name=self.name, value=self.value, unit=self.unit, higher_is_better=self.higher_is_better,
+                    **self.extra)
+
+    def __str__(self):
+        return f'{self.name:<50} {self.value:>14.3f} {self.unit}'
+
+
+def time_call(name, function, repeat=5, min_time=0.2):
+    """
+    Measures the time per call of a function without arguments.
+    :param repeat: number of measurements, the median is reported
+    :param min_time: minimal seconds per measurement, the number of calls is chosen accordingly
+    :returns Result in nanoseconds per call
+    """
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    times = [t / number * 1e9 for t in timer.repeat(repeat=repeat, number=number)]
+    return Result(name, statistics.median(times), 'ns', best=min(times), calls=number)
@@ -0,0 +1,281 @@
+import collections
+import mmap
+
+from joycontrol.capture import CaptureReader, CAPTURE_VERSION, RECORD_HEADER, INPUT, OUTPUT, INDEX_MAGIC
+
+try:
+    import numpy as np
+except ImportError as err:
+    raise ImportError('joycontrol.analysis requires numpy. Install it using "pip install joycontrol[analysis]".') \
+        from err
+
+"""
+Vectorized analysis of joycontrol captures.
+
+Captures are loaded into numpy structured arrays with one row per report, see RECORD_DTYPE.
+"""
+
+RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('direction', 'u1'),
+    ('report_id', 'u1'),
+    # sub command of output reports with id 0x01, replied sub command of input reports with id 0x21, otherwise 0
+    ('sub_command', 'u1'),
+    ('timer', 'u1'),
+    # 24 bit button state of input reports
+    ('buttons', '<u4'),
+    # 12 bit stick axes of input reports
+    ('l_stick_h', '<u2'),
+    ('l_stick_v', '<u2'),
+    ('r_stick_h', '<u2'),
+    ('r_stick_v', '<u2'),
+])
+
+# Number of leading report bytes needed to decode the fields
+_HEAD_SIZE = 16
+
+TimerGaps = collections.namedtuple('TimerGaps', ['positions', 'sizes', 'lost'])
+
+
+def load_capture(path):
+    """
+    Loads a capture file into a structured array.
+    :param path: path of the capture file
+    :returns numpy array of RECORD_DTYPE, sorted by time
+    """
+    with open(path, 'rb') as file:
+        reader = CaptureReader(file)
+        if reader.version != CAPTURE_VERSION:
+            return _load_sequential(reader)
+
+        first, last = reader.get_record_range()
+        if file.seek(0, 2) == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            offsets = _scan_record_offsets(buffer, first, last)
+            raw = np.frombuffer(buffer, dtype=np.uint8)
+            try:
+                return _decode_records(raw, offsets)
+            finally:
+                # release the buffer before the map is closed
+                del raw
+
+
+def _scan_record_offsets(buffer, first, last):
+    """
+    Walks the record headers. This is the only per record Python loop, all decoding is vectorized.
+    :param last: offset after the last record, None if unknown
+    :returns int64 array of record offsets
+    """
+    offsets = []
+    unpack_from = RECORD_HEADER.unpack_from
+    header_size = RECORD_HEADER.size
+
+    # the index offset was not stored in the header (e.g. not seekable file), the records end at the index
+    stop_at_index = last is None
+    if last is None:
+        last = len(buffer)
+
+    pos = first
+    while pos + header_size <= last:
+        if stop_at_index and buffer[pos:pos + len(INDEX_MAGIC)] == INDEX_MAGIC:
+            break
+        size = unpack_from(buffer, pos)[2]
+        if pos + header_size + size > last:
+            # truncated record
+            break
+        offsets.append(pos)
+        pos += header_size + size
+
+    return np.array(offsets, dtype=np.int64)
+
+
+def _decode_records(raw, offsets):
+    """
+    :param raw: uint8 array of the capture
+    :param offsets: record offsets in raw
+    """
+    records = np.zeros(len(offsets), dtype=RECORD_DTYPE)
+    if not len(offsets):
+        return records
+
+    header = raw[offsets[:, None] + np.arange(RECORD_HEADER.size)]
+    records['time'] = header[:, 0:8].copy().view('<f8')[:, 0]
+    records['direction'] = header[:, 8]
+    sizes = header[:, 9:11].copy().view('<u2')[:, 0]
+
+    # leading report bytes, zero padded for short reports
+    columns = np.arange(_HEAD_SIZE)
+    valid = columns[None, :] < sizes[:, None]
+    index = np.where(valid, offsets[:, None] + RECORD_HEADER.size + columns, 0)
+    head = np.where(valid, raw[index], 0).astype(np.uint8)
+
+    _decode_heads(records, head)
+    return records
+
+
+def _load_sequential(reader):
+    """
+    Loads captures which cannot be mapped (e.g. version 1 captures) record by record.
+    """
+    times = []
+    directions = []
+    heads = bytearray()
+    for record in reader.records():
+        times.append(record.time)
+        directions.append(record.direction)
+        head = bytes(record.data[:_HEAD_SIZE])
+        heads += head + bytes(_HEAD_SIZE - len(head))
+
+    records = np.zeros(len(times), dtype=RECORD_DTYPE)
+    records['time'] = times
+    records['direction'] = directions
+    _decode_heads(records, np.frombuffer(bytes(heads), dtype=np.uint8).reshape(-1, _HEAD_SIZE))
+    return records
+
+
+def _decode_heads(records, head):
+    """
+    Decodes report fields of all records at once.
+    :param head: (N, 16) uint8 array of the leading report bytes
+    """
+    direction = records['direction']
+    report_id = head[:, 1]
+    records['report_id'] = report_id
+
+    is_input = direction == INPUT
+    is_output = direction == OUTPUT
+
+    # output report timers are 4 bit
+    records['timer'] = np.where(is_output, head[:, 2] & 0x0F, head[:, 2])
+
+    is_sub_command = is_output & (report_id == 0x01)
+    is_reply = is_input & (report_id == 0x21)
+    records['sub_command'] = np.where(is_sub_command, head[:, 11], np.where(is_reply, head[:, 15], 0))
+
+    # standard input reports contain buttons and sticks
+    has_state = is_input & np.isin(report_id, (0x21, 0x30, 0x31))
+    h = head.astype(np.uint32)
+    buttons = h[:, 4] | (h[:, 5] << 8) | (h[:, 6] << 16)
+    records['buttons'] = np.where(has_state, buttons, 0)
+    records['l_stick_h'] = np.where(has_state, h[:, 7] | ((h[:, 8] & 0xF) << 8), 0)
+    records['l_stick_v'] = np.where(has_state, (h[:, 8] >> 4) | (h[:, 9] << 4), 0)
+    records['r_stick_h'] = np.where(has_state, h[:, 10] | ((h[:, 11] & 0xF) << 8), 0)
+    records['r_stick_v'] = np.where(has_state, (h[:, 11] >> 4) | (h[:, 12] << 4), 0)
+
+
+def select(records, direction=None, report_id=None):
+    """
+    :returns records matching the given direction and report id
+    """
+    mask = np.ones(len(records), dtype=bool)
+    if direction is not None:
+        mask &= records['direction'] == direction
+    if report_id is not None:
+        mask &= records['report_id'] == report_id
+    return records[mask]
+
+
+def intervals(records, direction=INPUT, report_id=0x30):
+    """
+    :returns seconds between consecutive reports of the given direction and report id
+    """
+    return np.diff(select(records, direction, report_id)['time'])
+
+
+def interval_histogram(records, direction=INPUT, report_id=0x30, bins=50, max_interval=None):
+    """
+    Histogram of the inter report intervals in milliseconds.
+    :param bins: number of bins or bin edges in milliseconds
+    :param max_interval: upper limit of the histogram in milliseconds, defaults to the largest interval
+    :returns (counts, bin edges) as returned by numpy.histogram
+    """
+    values = intervals(records, direction, report_id) * 1000
+    value_range = None if max_interval is None else (0, max_interval)
+    return np.histogram(values, bins=bins, range=value_range)
+
+
+def timer_gaps(records, direction=INPUT):
+    """
+    Detects lost reports using the timer byte.
+    Input report timers increase by one per report (8 bit), output report timers per report (4 bit).
+    :returns TimerGaps(positions, sizes, lost): indices of reports preceded by a gap in the selected records,
+             number of missing reports before each of them and the total number of lost reports
+    """
+    timers = select(records, direction)['timer'].astype(np.int16)
+    modulo = 0x100 if direction == INPUT else 0x10
+    steps = (timers[1:] - timers[:-1]) % modulo
+    gap = steps != 1
+    # a step of 0 is a repeated timer value, not a loss
+    sizes = np.where(steps[gap] == 0, 0, steps[gap] - 1)
+    positions = np.nonzero(gap)[0] + 1
+    return TimerGaps(positions, sizes, int(sizes.sum()))
+
+
+def sub_command_latencies(records):
+    """
+    Matches sub command requests of the console to the first following reply with the same sub command.
+    :returns structured array with fields time (request time), sub_command and latency in seconds,
+             latency is NaN for requests without reply
+    """
+    requests = select(records, OUTPUT, 0x01)
+    replies = select(records, INPUT, 0x21)
+
+    result = np.zeros(len(requests), dtype=[('time', '<f8'), ('sub_command', 'u1'), ('latency', '<f8')])
+    result['time'] = requests['time']
+    result['sub_command'] = requests['sub_command']
+    result['latency'] = np.nan
+
+    for sub_command in np.unique(requests['sub_command']):
+        request_mask = requests['sub_command'] == sub_command
+        reply_times = replies['time'][replies['sub_command'] == sub_command]
+        if not len(reply_times):
+            continue
+
+        request_times = requests['time'][request_mask]
+        i = np.searchsorted(reply_times, request_times, side='left')
+        answered = i < len(reply_times)
+        latency = np.full(len(request_times), np.nan)
+        latency[answered] = reply_times[i[answered]] - request_times[answered]
+        result['latency'][request_mask] = latency
+
+    return result
+
+
+def jitter_percentiles(values, period=None, percentiles=(50, 90, 99, 99.9)):
+    """
+    :param values: intervals or latencies in seconds
+    :param period: nominal value, defaults to the median of the values
+    :param percentiles: percentiles to compute
+    :returns dict mapping percentiles to the absolute deviation from the nominal value in seconds
+    """
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {p: np.nan for p in percentiles}
+    if period is None:
+        period = np.median(values)
+    deviation = np.abs(values - period)
+    return dict(zip(percentiles, np.percentile(deviation, percentiles)))
+
+
+def summary(records):
+    """
+    :returns dict of key figures of a capture
+    """
+    input_intervals = intervals(records)
+    gaps = timer_gaps(records)
+    latencies = sub_command_latencies(records)['latency']
+    answered = latencies[~np.isnan(latencies)]
+
+    return {
+        'duration': float(records['time'][-1] - records['time'][0]) if len(records) else 0.0,
+        'input_reports': int(np.count_nonzero(records['direction'] == INPUT)),
+        'output_reports': int(np.count_nonzero(records['direction'] == OUTPUT)),
+        'mean_input_interval': float(input_intervals.mean()) if len(input_intervals) else np.nan,
+        'input_interval_jitter': jitter_percentiles(input_intervals),
+        'lost_input_reports': gaps.lost,
+        'sub_command_requests': len(latencies),
+        'unanswered_sub_commands': int(len(latencies) - len(answered)),
+        'sub_command_latency': jitter_percentiles(answered, period=0),
+    }
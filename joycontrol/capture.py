@@ -0,0 +1,384 @@
+import bisect
+import collections
+import enum
+import logging
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+"""
+Capture file format of joycontrol.
+
+Version 2 layout (little endian):
+    header:     magic b'JCAP', version (uint16), reserved (uint16),
+                wall clock start time (double), offset of the index (uint64, 0 if the capture has no index)
+    records:    time since start on the monotonic clock (double), direction (uint8), size (uint16), data
+    index:      magic b'JIDX', number of entries (uint64),
+                entries of record time (double) and record offset (uint64)
+
+An index entry is written every index_interval records, the index itself is appended when the capture is closed.
+Captures without index (e.g. if the process was killed) can still be read sequentially.
+
+Version 1 captures (records of native time.time() double, int size and data) are read as well.
+"""
+
+CAPTURE_MAGIC = b'JCAP'
+# start of the index appended to a closed capture, ends the records
+INDEX_MAGIC = b'JIDX'
+CAPTURE_VERSION = 2
+
+# Direction of a record
+INPUT = 0  # input report, send by the controller
+OUTPUT = 1  # output report, received from the console
+
+_HEADER = struct.Struct('<4sHHdQ')
+RECORD_HEADER = struct.Struct('<dBH')
+_INDEX_HEADER = struct.Struct('<4sQ')
+_INDEX_ENTRY = struct.Struct('<dQ')
+_INDEX_OFFSET_POSITION = 16
+
+_V1_RECORD = struct.Struct('di')
+
+CaptureRecord = collections.namedtuple('CaptureRecord', ['time', 'direction', 'data'])
+
+
+class CaptureWriter:
+    """
+    Writes input and output reports to a capture file.
+    """
+    def __init__(self, file, index_interval=256, clock=time.monotonic):
+        """
+        :param file: file opened for binary writing, positioned at the start
+        :param index_interval: number of records between index entries
+        :param clock: monotonic clock function returning seconds
+        """
+        self._file = file
+        self._index_interval = index_interval
+        self._clock = clock
+
+        self._start = clock()
+        self._index = []
+        self._records = 0
+        self._is_closed = False
+
+        header = _HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, 0, time.time(), 0)
+        self._write(header)
+        self._offset = len(header)
+
+    def write_input(self, data):
+        """
+        Records an input report send to the console.
+        """
+        self.record(INPUT, data)
+
+    def write_output(self, data):
+        """
+        Records an output report received from the console.
+        """
+        self.record(OUTPUT, data)
+
+    def record(self, direction, data):
+        """
+        :param direction: INPUT or OUTPUT
+        :param data: bytes like report data
+        """
+        _time = self._clock() - self._start
+        record = RECORD_HEADER.pack(_time, direction, len(data)) + data
+        if not self._write(record):
+            return
+
+        if self._records % self._index_interval == 0:
+            self._index.append((_time, self._offset))
+        self._records += 1
+        self._offset += len(record)
+
+    def get_record_count(self):
+        return self._records
+
+    def _write(self, data, force=False):
+        """
+        :param force: if True, the data must not be dropped
+        :returns True if the data was written
+        """
+        self._file.write(data)
+        return True
+
+    def close(self):
+        """
+        Appends the index and stores its offset in the header if the file is seekable.
+        Does not close the underlying file.
+        """
+        if self._is_closed:
+            return
+        self._is_closed = True
+
+        self._write_index()
+        self._store_index_offset()
+
+    def _write_index(self):
+        index = [_INDEX_HEADER.pack(INDEX_MAGIC, len(self._index))]
+        index.extend(_INDEX_ENTRY.pack(_time, offset) for _time, offset in self._index)
+        self._write(b''.join(index), force=True)
+
+    def _store_index_offset(self):
+        try:
+            if self._file.seekable():
+                self._file.seek(_INDEX_OFFSET_POSITION)
+                self._file.write(struct.pack('<Q', self._offset))
+                self._file.seek(0, 2)
+        except (AttributeError, OSError) as err:
+            logger.warning(f'Could not store capture index offset: {err}')
+        self._file.flush()
+
+
+class OverflowPolicy(enum.Enum):
+    # Discard records if the buffer is full
+    DROP = 0
+    # Wait for the writer thread to make space. Note: This blocks the event loop.
+    BLOCK = 1
+
+
+class BufferedCaptureWriter(CaptureWriter):
+    """
+    Capture writer which keeps file I/O off the event loop.
+
+    Records are appended to a bounded in-memory buffer and written to the file
+    in batches by a background thread.
+    """
+    def __init__(self, file, max_buffer_size=0x100000, overflow_policy=OverflowPolicy.DROP, flush_interval=1.0,
+                 index_interval=256, clock=time.monotonic):
+        """
+        :param file: file opened for binary writing, positioned at the start
+        :param max_buffer_size: memory budget of the buffer in bytes
+        :param overflow_policy: OverflowPolicy applied if the buffer is full
+        :param flush_interval: max seconds between writes of the background thread
+        :param index_interval: number of records between index entries
+        :param clock: monotonic clock function returning seconds
+        """
+        self._max_buffer_size = max_buffer_size
+        self._overflow_policy = overflow_policy
+        self._flush_interval = flush_interval
+
+        self._buffer = collections.deque()
+        self._buffer_size = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        # True while the background thread writes a batch
+        self._writing = False
+
+        # statistics
+        self.dropped_records = 0
+        self.dropped_bytes = 0
+        self.max_buffer_usage = 0
+        self.batches_written = 0
+
+        self._flush_thread = threading.Thread(target=self._flush_loop, name='capture-writer', daemon=True)
+        self._flush_thread.start()
+
+        super().__init__(file, index_interval=index_interval, clock=clock)
+
+    def _write(self, data, force=False):
+        size = len(data)
+        with self._condition:
+            if self._buffer_size + size > self._max_buffer_size and self._buffer_size > 0:
+                if self._overflow_policy == OverflowPolicy.DROP and not force:
+                    self.dropped_records += 1
+                    self.dropped_bytes += size
+                    return False
+                # wait until the writer thread emptied the buffer
+                self._condition.notify_all()
+                while self._buffer_size > 0 and not self._stopping:
+                    self._condition.wait()
+
+            self._buffer.append(data)
+            self._buffer_size += size
+            if self._buffer_size > self.max_buffer_usage:
+                self.max_buffer_usage = self._buffer_size
+
+            # wake up the writer early if half of the budget is used
+            if self._buffer_size * 2 >= self._max_buffer_size:
+                self._condition.notify_all()
+        return True
+
+    def _flush_loop(self):
+        while True:
+            with self._condition:
+                if not self._buffer and not self._stopping:
+                    self._condition.wait(self._flush_interval)
+                batch = list(self._buffer)
+                self._buffer.clear()
+                self._buffer_size = 0
+                stopping = self._stopping
+                self._writing = bool(batch)
+                # wake up blocked producers
+                self._condition.notify_all()
+
+            if batch:
+                try:
+                    self._file.write(b''.join(batch))
+                    self._file.flush()
+                    self.batches_written += 1
+                except (OSError, ValueError) as err:
+                    logger.error(f'Failed to write capture: {err}')
+
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+            if stopping:
+                with self._condition:
+                    if not self._buffer:
+                        break
+
+    def flush(self):
+        """
+        Waits until all buffered records are written.
+        """
+        with self._condition:
+            self._condition.notify_all()
+            while (self._buffer or self._writing) and self._flush_thread.is_alive():
+                self._condition.wait(self._flush_interval)
+
+    def close(self):
+        """
+        Writes all buffered records and the index, stops the background thread.
+        Does not close the underlying file.
+        """
+        if self._is_closed:
+            return
+        self._is_closed = True
+
+        self._write_index()
+
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._flush_thread.join()
+
+        self._store_index_offset()
+
+        if self.dropped_records:
+            logger.warning(f'Capture dropped {self.dropped_records} records ({self.dropped_bytes} bytes)')
+
+
+class CaptureReader:
+    """
+    Streams records of a capture file without loading the capture into memory.
+
+    Example:
+        with open(path, 'rb') as file:
+            for record in CaptureReader(file).records(start=60, end=120, direction=OUTPUT):
+                ...
+    """
+    def __init__(self, file):
+        """
+        :param file: capture file opened for binary reading
+        """
+        self._file = file
+
+        header = file.read(_HEADER.size)
+        if header[:4] == CAPTURE_MAGIC:
+            magic, self.version, _, self.start_time, self._index_offset = _HEADER.unpack(header)
+            if self.version != CAPTURE_VERSION:
+                raise ValueError(f'Unsupported capture version {self.version}')
+            self._data_offset = _HEADER.size
+        else:
+            # legacy capture without header
+            self.version = 1
+            self.start_time = _V1_RECORD.unpack_from(header)[0] if len(header) >= _V1_RECORD.size else None
+            self._index_offset = 0
+            self._data_offset = 0
+
+        self._index = None
+
+    def get_record_range(self):
+        """
+        :returns (offset of the first record, offset after the last record or None if unknown)
+        """
+        return self._data_offset, self._index_offset or None
+
+    def get_index(self):
+        """
+        :returns list of (time, offset) tuples, empty if the capture has no index
+        """
+        if self._index is None:
+            self._index = []
+            if self._index_offset:
+                self._file.seek(self._index_offset)
+                magic, count = _INDEX_HEADER.unpack(self._file.read(_INDEX_HEADER.size))
+                if magic != INDEX_MAGIC:
+                    raise ValueError('Capture index is corrupted')
+                entries = self._file.read(count * _INDEX_ENTRY.size)
+                self._index = list(_INDEX_ENTRY.iter_unpack(entries))
+        return self._index
+
+    def records(self, start=None, end=None, direction=None, report_ids=None):
+        """
+        Generator over the records of the capture.
+        :param start: Skip records before this time in seconds since the capture start.
+                      Uses the index to seek if available.
+        :param end: Stop at records after this time in seconds since the capture start
+        :param direction: only yield records of the given direction (INPUT or OUTPUT)
+        :param report_ids: only yield records with a report id (second byte) in the given collection
+        :returns generator of CaptureRecord(time, direction, data)
+        """
+        if self.version == 1:
+            records = self._v1_records()
+        else:
+            offset = self._data_offset
+            if start is not None:
+                index = self.get_index()
+                i = bisect.bisect_right(index, (start, float('inf'))) - 1
+                if i >= 0:
+                    offset = index[i][1]
+            records = self._v2_records(offset)
+
+        for record in records:
+            if start is not None and record.time < start:
+                continue
+            if end is not None and record.time > end:
+                break
+            if direction is not None and record.direction != direction:
+                continue
+            if report_ids is not None and (len(record.data) < 2 or record.data[1] not in report_ids):
+                continue
+            yield record
+
+    def __iter__(self):
+        return self.records()
+
+    def _v2_records(self, offset):
+        file = self._file
+        file.seek(offset)
+        end_offset = self._index_offset or None
+
+        while end_offset is None or file.tell() < end_offset:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            if end_offset is None and header[:4] == INDEX_MAGIC:
+                # start of an index which offset was not stored in the header
+                return
+            _time, direction, size = RECORD_HEADER.unpack(header)
+            data = file.read(size)
+            if len(data) < size:
+                # truncated capture
+                return
+            yield CaptureRecord(_time, direction, data)
+
+    def _v1_records(self):
+        file = self._file
+        file.seek(0)
+
+        while True:
+            header = file.read(_V1_RECORD.size)
+            if len(header) < _V1_RECORD.size:
+                return
+            _time, size = _V1_RECORD.unpack(header)
+            data = file.read(size)
+            if len(data) < size:
+                return
+            direction = INPUT if data[0] == 0xA1 else OUTPUT
+            yield CaptureRecord(_time - self.start_time, direction, data)
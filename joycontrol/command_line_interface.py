@@ -1,3 +1,4 @@
+import asyncio
 import inspect
 import logging
 import shlex
@@ -5,10 +6,15 @@ import shlex
 from aioconsole import ainput
 
 from joycontrol.controller_state import button_push, ControllerState
+from joycontrol.macro import Timeline, load as load_macro, play_macro
+from joycontrol.trajectory import LinearRamp, Circle
 from joycontrol.transport import NotConnectedError
 
 logger = logging.getLogger(__name__)
 
+# seconds commands requiring the full input report mode wait for it
+FULL_MODE_TIMEOUT = 5
+
 
 def _print_doc(string):
     """
@@ -104,7 +110,7 @@ class ControllerCLI(CLI):
 
     async def cmd_help(self):
         print('Button commands:')
-        print(', '.join(self.controller_state.button_state.get_available_buttons()))
+        print(', '.join(sorted(self.controller_state.button_state.get_available_buttons())))
         print()
         await super().cmd_help()
 
@@ -141,6 +147,26 @@ class ControllerCLI(CLI):
 
         return f'{stick.__class__.__name__} was set to ({stick.get_h()}, {stick.get_v()}).'
 
+    async def _wait_for_full_mode(self):
+        try:
+            await asyncio.wait_for(self.controller_state.wait_for_full_input_report_mode(), FULL_MODE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ValueError('Full input report mode is not active, the Switch did not request it yet.')
+
+    @staticmethod
+    async def _wait_for_player(future):
+        """
+        Waits for the future of a player (see ControllerState.start_player).
+        Raises ValueError if the player was cancelled, e.g. because the full input report mode stopped.
+        """
+        try:
+            # a cancellation of the command must not be confused with a cancellation of the player
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                raise ValueError('Cancelled, the full input report mode stopped or the connection was lost.')
+            raise
+
     async def cmd_stick(self, side, direction, value=None):
         """
         stick - Command to set stick positions.
@@ -158,6 +184,63 @@ class ControllerCLI(CLI):
         else:
             raise ValueError('Value of side must be "l", "left" or "r", "right"')
 
+    async def cmd_move(self, side, shape, *args):
+        """
+        move - Command to move sticks over time. Requires the full input report mode.
+
+        Usage:
+            move <side> to <h> <v> <seconds>         Linear motion from the current position to (h, v)
+            move <side> circle <seconds> [<radius>]  Counter clockwise circle around the calibrated center,
+                                                     radius defaults to the calibrated maximum
+        """
+        if side in ('l', 'left'):
+            name, stick = 'Left stick', self.controller_state.l_stick_state
+        elif side in ('r', 'right'):
+            name, stick = 'Right stick', self.controller_state.r_stick_state
+        else:
+            raise ValueError('Value of side must be "l", "left" or "r", "right"')
+        if stick is None:
+            raise ValueError(f'Controller has no {name.lower()}')
+
+        try:
+            if shape == 'to' and len(args) == 3:
+                h, v, sec = int(args[0]), int(args[1]), float(args[2])
+                trajectory = LinearRamp((stick.get_h(), stick.get_v()), (h, v), sec)
+            elif shape == 'circle' and len(args) in (1, 2):
+                calibration = stick.get_calibration()
+                sec = float(args[0])
+                radius = int(args[1]) if len(args) == 2 else min(calibration.h_max_above_center,
+                                                                 calibration.v_max_above_center)
+                trajectory = Circle((calibration.h_center, calibration.v_center), radius, sec)
+            else:
+                raise ValueError(f'Unexpected arguments "{shape} {" ".join(args)}"')
+        except ValueError as err:
+            raise ValueError(f'Invalid move command: {err}')
+
+        await self._wait_for_full_mode()
+        await self._wait_for_player(self.controller_state.play_trajectory(trajectory, stick=side))
+        return f'{name} was moved to ({stick.get_h()}, {stick.get_v()}).'
+
+    async def cmd_macro(self, file_name):
+        """
+        macro - Plays a macro file, see joycontrol.macro for the format. Requires the full input report mode.
+                Binary timelines created by scripts/capture_to_macro.py are replayed as well.
+
+        Usage:
+            macro <file_name>
+        """
+        macro = load_macro(file_name)
+        if isinstance(macro, Timeline):
+            timeline = macro.resample(self.controller_state.get_tick_period())
+        else:
+            timeline = macro.compile(self.controller_state.get_controller(), self.controller_state.get_tick_period())
+
+        # wait until controller is fully connected and reports are send per tick
+        await self.controller_state.connect()
+        await self._wait_for_full_mode()
+        await self._wait_for_player(play_macro(self.controller_state, timeline))
+        return f'Played macro of {timeline.get_duration():.2f} seconds.'
+
     async def run(self):
         while True:
             user_input = await ainput(prompt='cmd >> ')
@@ -172,8 +255,6 @@ class ControllerCLI(CLI):
                 if cmd == 'exit':
                     return
 
-                available_buttons = self.controller_state.button_state.get_available_buttons()
-
                 if hasattr(self, f'cmd_{cmd}'):
                     try:
                         result = await getattr(self, f'cmd_{cmd}')(*args)
@@ -188,7 +269,7 @@ class ControllerCLI(CLI):
                             print(result)
                     except Exception as e:
                         print(e)
-                elif cmd in available_buttons:
+                elif self.controller_state.button_state.has_button(cmd):
                     buttons_to_push.append(cmd)
                 else:
                     print('command', cmd, 'not found, call help for help.')
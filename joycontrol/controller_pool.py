@@ -0,0 +1,78 @@
+import logging
+
+from joycontrol.controller import Controller
+from joycontrol.protocol import controller_protocol_factory
+from joycontrol.scheduler import TickEngine, LatePolicy, RATE_66HZ
+from joycontrol.server import create_hid_server
+
+logger = logging.getLogger(__name__)
+
+
+class ControllerPool:
+    """
+    Emulates several controllers in one process. Each controller is bound to its own Bluetooth adapter, both when
+    waiting for the Switch to pair and when reconnecting to a previously paired Switch.
+
+    A single tick engine drives the full input report mode of all controllers,
+    each tick emits the input reports of every controller in the pool in one pass.
+
+    Example:
+        pool = ControllerPool()
+        protocol_1 = await pool.add_controller(Controller.PRO_CONTROLLER, device_id='hci0')
+        protocol_2 = await pool.add_controller(Controller.PRO_CONTROLLER, device_id='hci1')
+        ...
+        await pool.close()
+    """
+    def __init__(self, report_rate=RATE_66HZ, late_policy=LatePolicy.CATCH_UP):
+        """
+        :param report_rate: rate in Hz of input reports in full input report mode
+        :param late_policy: how to handle missed report deadlines, see joycontrol.scheduler.LatePolicy
+        """
+        self.tick_engine = TickEngine(rate=report_rate, late_policy=late_policy)
+
+        self._protocols = []
+
+    async def add_controller(self, controller: Controller, device_id=None, spi_flash=None, reconnect_bt_addr=None,
+                             ctl_psm=17, itr_psm=19, capture_file=None):
+        """
+        Creates an emulated controller and waits for the Switch to connect.
+        Controllers can be added concurrently, e.g. using asyncio.gather.
+
+        :param controller: controller type to emulate
+        :param device_id: ID of the bluetooth adapter the controller is bound to, see create_hid_server.
+                          Every controller of the pool requires its own adapter. If None, the default adapter is used.
+        :param spi_flash: flash memory of the controller
+        :param reconnect_bt_addr: Bluetooth address of a previously connected console, see create_hid_server
+        :param ctl_psm: hid control channel port
+        :param itr_psm: hid interrupt channel port
+        :param capture_file: opened file to log incoming and outgoing messages of this controller
+        :returns protocol of the connected controller
+        """
+        factory = controller_protocol_factory(controller, spi_flash=spi_flash, tick_engine=self.tick_engine)
+        transport, protocol = await create_hid_server(factory, ctl_psm=ctl_psm, itr_psm=itr_psm, device_id=device_id,
+                                                      reconnect_bt_addr=reconnect_bt_addr, capture_file=capture_file)
+        self._protocols.append(protocol)
+        return protocol
+
+    def get_protocols(self):
+        """
+        :returns list of protocols of all controllers in the pool
+        """
+        return list(self._protocols)
+
+    def get_controller_states(self):
+        """
+        :returns list of controller states of all controllers in the pool
+        """
+        return [protocol.get_controller_state() for protocol in self._protocols]
+
+    async def close(self):
+        """
+        Stops the full input report mode of all controllers and closes their transports.
+        """
+        self.tick_engine.stop()
+
+        for protocol in self._protocols:
+            if protocol.transport is not None:
+                await protocol.transport.close()
+        self._protocols.clear()
@@ -1,8 +1,9 @@
 import asyncio
+import itertools
 
-from joycontrol import utils
 from joycontrol.controller import Controller
 from joycontrol.memory import FlashMemory
+from joycontrol.trajectory import TrajectoryPlayer
 
 
 class ControllerState:
@@ -44,8 +45,18 @@ class ControllerState:
             if calibration is not None:
                 self.r_stick_state.set_center()
 
+        # Set after an input report was send, cleared whenever a caller waits for the next report
+        # (see ControllerProtocol.get_send_future). Prefer send(), which returns once the state was send.
         self.sig_is_send = asyncio.Event()
 
+        # accelerometer and gyroscope data of 0x30 input reports, see set_imu_source
+        self.imu_source = None
+
+        # called once per input report tick of the full input report mode, see advance_tick
+        self._tick_hooks = {}
+        # players registered as tick hooks, see start_player
+        self._players = {}
+
     def get_controller(self):
         return self._controller
 
@@ -62,8 +73,9 @@ class ControllerState:
         """
         Invokes protocol.send_controller_state(). Returns after the controller state was send.
         Raises NotConnected exception if the connection was lost.
+        :returns sequence number of the input report containing the state
         """
-        await self._protocol.send_controller_state()
+        return await self._protocol.send_controller_state()
 
     async def connect(self):
         """
@@ -71,6 +83,152 @@ class ControllerState:
         """
         await self._protocol.sig_set_player_lights.wait()
 
+    def is_full_input_report_mode(self):
+        """
+        :returns True if the full input report mode is active, tick hooks only progress in this mode
+        """
+        return self._protocol.is_full_input_report_mode()
+
+    async def wait_for_full_input_report_mode(self):
+        """
+        Waits until the full input report mode is active, returns immediately if it is.
+        """
+        await self._protocol.wait_for_full_input_report_mode()
+
+    def set_imu_source(self, imu_source):
+        """
+        :param imu_source: joycontrol.imu.ImuSource providing the IMU data of 0x30 input reports,
+                           None to send reports without IMU data
+        """
+        self.imu_source = imu_source
+
+    def subscribe_rumble(self):
+        """
+        :returns joycontrol.rumble.RumbleSubscription receiving changes of the rumble data send by the Switch
+        """
+        return self._protocol.rumble.subscribe()
+
+    def set_tick_hook(self, key, hook):
+        """
+        Registers a hook which is called once per tick of the full input report mode, right before the controller
+        state is written into the input report. The hook is removed once it returns True.
+        Hooks must be cheap, they run inside the report loop.
+        :param key: a hook registered with the same key is replaced
+        :param hook: callable without arguments returning True if it is finished
+        :returns the replaced hook or None
+        """
+        previous = self._tick_hooks.pop(key, None)
+        self._tick_hooks[key] = hook
+        return previous
+
+    def remove_tick_hook(self, key):
+        """
+        :returns the removed hook or None
+        """
+        return self._tick_hooks.pop(key, None)
+
+    def clear_tick_hooks(self):
+        """
+        Removes all tick hooks and cancels running players, called when the full input report mode stops.
+        """
+        self._tick_hooks.clear()
+        for player in self._players.values():
+            player.cancel()
+        self._players.clear()
+
+    def start_player(self, key, player):
+        """
+        Registers the advance method of a player (e.g. TrajectoryPlayer) as tick hook.
+        A running player with the same key is cancelled.
+        :returns future of the player
+        """
+        previous = self._players.pop(key, None)
+        if previous is not None:
+            previous.cancel()
+        self._players[key] = player
+        self.set_tick_hook(key, player.advance)
+        return player.future
+
+    def advance_tick(self):
+        """
+        Called by the protocol once per input report tick before the controller state is serialized.
+        """
+        if not self._tick_hooks:
+            return
+        for key, hook in list(self._tick_hooks.items()):
+            if hook():
+                # the hook may have been replaced in the meantime
+                if self._tick_hooks.get(key) is hook:
+                    del self._tick_hooks[key]
+
+    def play_trajectory(self, trajectory, stick='l'):
+        """
+        Moves a stick along a trajectory, one compiled position per input report.
+        Only progresses in the full input report mode. A running trajectory of the same stick is cancelled.
+        :param trajectory: joycontrol.trajectory.Trajectory
+        :param stick: 'l' or 'r'
+        :returns future which is resolved after the last position was written into an input report
+        """
+        if stick in ('l', 'left'):
+            stick, stick_state = 'l', self.l_stick_state
+        elif stick in ('r', 'right'):
+            stick, stick_state = 'r', self.r_stick_state
+        else:
+            raise ValueError('Value of stick must be "l", "left" or "r", "right"')
+        if stick_state is None:
+            raise ValueError(f'{self._controller.device_name()} has no {stick} stick')
+
+        positions = trajectory.compile(self.get_tick_period())
+        return self.start_player(('trajectory', stick), TrajectoryPlayer(stick_state, positions))
+
+    def get_tick_period(self):
+        """
+        :returns seconds between input reports in the full input report mode
+        """
+        return self._protocol.scheduler.get_period()
+
+
+# Revision numbers of button and stick states. They are unique across all states, so an input report can tell
+# whether it already contains the current state of any given state object, see InputReport.update_controller_status
+_revisions = itertools.count(1)
+
+# Button positions per controller: name -> (byte index, bit mask) in the 3 button bytes of the input report
+_BUTTON_TABLES = {
+    Controller.PRO_CONTROLLER: {
+        'y': (0, 0x01), 'x': (0, 0x02), 'b': (0, 0x04), 'a': (0, 0x08), 'r': (0, 0x40), 'zr': (0, 0x80),
+        'minus': (1, 0x01), 'plus': (1, 0x02), 'r_stick': (1, 0x04), 'l_stick': (1, 0x08), 'home': (1, 0x10),
+        'capture': (1, 0x20),
+        'down': (2, 0x01), 'up': (2, 0x02), 'right': (2, 0x04), 'left': (2, 0x08), 'l': (2, 0x40), 'zl': (2, 0x80)
+    },
+    Controller.JOYCON_R: {
+        'y': (0, 0x01), 'x': (0, 0x02), 'b': (0, 0x04), 'a': (0, 0x08), 'sr': (0, 0x10), 'sl': (0, 0x20),
+        'r': (0, 0x40), 'zr': (0, 0x80),
+        'minus': (1, 0x01), 'plus': (1, 0x02), 'r_stick': (1, 0x04), 'l_stick': (1, 0x08), 'home': (1, 0x10)
+    },
+    Controller.JOYCON_L: {
+        'minus': (1, 0x01), 'plus': (1, 0x02), 'r_stick': (1, 0x04), 'l_stick': (1, 0x08), 'capture': (1, 0x20),
+        'down': (2, 0x01), 'up': (2, 0x02), 'right': (2, 0x04), 'left': (2, 0x08), 'sr': (2, 0x10), 'sl': (2, 0x20),
+        'l': (2, 0x40), 'zl': (2, 0x80)
+    }
+}
+
+# Buttons which are not part of the controller, but have bits in the input report (kept for compatibility)
+_HIDDEN_BUTTONS = {
+    Controller.JOYCON_R: {'minus', 'l_stick'},
+    Controller.JOYCON_L: {'plus', 'r_stick'}
+}
+
+# name -> mask in the 24 bit button state
+_BUTTON_MASKS = {
+    controller: {name: mask << (8 * byte) for name, (byte, mask) in table.items()}
+    for controller, table in _BUTTON_TABLES.items()
+}
+
+_AVAILABLE_BUTTONS = {
+    controller: frozenset(table) - _HIDDEN_BUTTONS.get(controller, frozenset())
+    for controller, table in _BUTTON_TABLES.items()
+}
+
 
 class ButtonState:
     """
@@ -81,93 +239,105 @@ class ButtonState:
     2       Minus 	Plus 	R Stick L Stick Home 	Capture
     3       Down 	Up 	    Right 	Left 	SR 	    SL 	    L 	    ZL
 
-    Example for generated methods: home button (byte_2, 4)
+    The three bytes are stored as a single 24 bit integer (byte 1 in the lowest bits).
+    Several buttons can be changed at once using masks, see get_mask and set_mask.
+
+    Each button of the controller also has generated methods, e.g. for the home button:
 
     def home(self, pushed=True):
-        if pushed != utils.get_bit(self.byte_2, 4):
-            self.byte_2 = utils.flip_bit(self.byte_2, 4)
+        self.set_mask(self._masks['home'], pushed)
 
     def home_is_set(self):
-        return get_bit(self.byte_2, 4)
+        return (self._buttons & self._masks['home']) != 0
+
+    Unlike set_button and get_button, the methods also work for the hidden buttons of a Joy-Con (see _HIDDEN_BUTTONS).
+    The methods of buttons missing in the button table of the controller raise AttributeError on access,
+    e.g. hasattr(ButtonState(Controller.JOYCON_L), 'home') is False.
     """
+    __slots__ = ('controller', '_buttons', '_masks', '_available_buttons', '_revision', '_bytes')
+
     def __init__(self, controller: Controller):
         self.controller = controller
 
         # 3 bytes
-        self._byte_1 = 0
-        self._byte_2 = 0
-        self._byte_3 = 0
-
-        # generating methods for each button
-        def button_method_factory(byte, bit):
-            def setter(pushed=True):
-                _byte = getattr(self, byte)
-
-                if pushed != utils.get_bit(_byte, bit):
-                    setattr(self, byte, utils.flip_bit(_byte, bit))
-
-            def getter():
-                return utils.get_bit(getattr(self, byte), bit)
-            return setter, getter
-
-        if self.controller == Controller.PRO_CONTROLLER:
-            self._available_buttons = {'y', 'x', 'b', 'a', 'r', 'zr',
-                                       'minus', 'plus', 'r_stick', 'l_stick', 'home', 'capture',
-                                       'down', 'up', 'right', 'left', 'l', 'zl'}
-        elif self.controller == Controller.JOYCON_R:
-            self._available_buttons = {'y', 'x', 'b', 'a', 'sr', 'sl', 'r', 'zr',
-                                       'plus', 'r_stick', 'home'}
-        elif self.controller == Controller.JOYCON_L:
-            self._available_buttons = {'minus', 'l_stick', 'capture',
-                                       'down', 'up', 'right', 'left', 'sr', 'sl', 'l', 'zl'}
-
-        # byte 1
-        if self.controller == Controller.PRO_CONTROLLER or self.controller == Controller.JOYCON_R:
-            self.y, self.y_is_set = button_method_factory('_byte_1', 0)
-            self.x, self.x_is_set = button_method_factory('_byte_1', 1)
-            self.b, self.b_is_set = button_method_factory('_byte_1', 2)
-            self.a, self.a_is_set = button_method_factory('_byte_1', 3)
-
-            if self.controller == Controller.JOYCON_R:
-                self.sr, self.sr_is_set = button_method_factory('_byte_1', 4)
-                self.sl, self.sl_is_set = button_method_factory('_byte_1', 5)
-
-            self.r, self.r_is_set = button_method_factory('_byte_1', 6)
-            self.zr, self.zr_is_set = button_method_factory('_byte_1', 7)
-
-        # byte 2
-        self.minus, self.minus_is_set = button_method_factory('_byte_2', 0)
-        self.plus, self.plus_is_set = button_method_factory('_byte_2', 1)
-        self.r_stick, self.r_stick_is_set = button_method_factory('_byte_2', 2)
-        self.l_stick, self.l_stick_is_set = button_method_factory('_byte_2', 3)
-        if self.controller == Controller.JOYCON_R or self.controller == Controller.PRO_CONTROLLER:
-            self.home, self.home_is_set = button_method_factory('_byte_2', 4)
-        if self.controller == Controller.JOYCON_L or self.controller == Controller.PRO_CONTROLLER:
-            self.capture, self.capture_is_set = button_method_factory('_byte_2', 5)
-
-        # byte 3
-        if self.controller == Controller.PRO_CONTROLLER or self.controller == Controller.JOYCON_L:
-            self.down, self.down_is_set = button_method_factory('_byte_3', 0)
-            self.up, self.up_is_set = button_method_factory('_byte_3', 1)
-            self.right, self.right_is_set = button_method_factory('_byte_3', 2)
-            self.left, self.left_is_set = button_method_factory('_byte_3', 3)
-
-            if self.controller == Controller.JOYCON_L:
-                self.sr, self.sr_is_set = button_method_factory('_byte_3', 4)
-                self.sl, self.sl_is_set = button_method_factory('_byte_3', 5)
-
-            self.l, self.l_is_set = button_method_factory('_byte_3', 6)
-            self.zl, self.zl_is_set = button_method_factory('_byte_3', 7)
+        self._buttons = 0
+
+        # changed on every modification, the encoded bytes are cached until then
+        self._revision = next(_revisions)
+        self._bytes = None
+
+        # constant tables shared by all instances
+        self._masks = _BUTTON_MASKS[controller]
+        self._available_buttons = _AVAILABLE_BUTTONS[controller]
 
     def set_button(self, button, pushed=True):
         if button not in self._available_buttons:
             raise ValueError(f'Given button "{button}" is not available to {self.controller.device_name()}.')
-        getattr(self, button)(pushed=pushed)
+        self.set_mask(self._masks[button], pushed=pushed)
 
     def get_button(self, button):
         if button not in self._available_buttons:
             raise ValueError(f'Given button "{button}" is not available to {self.controller.device_name()}.')
-        return getattr(self, f'{button}_is_set')()
+        return (self._buttons & self._masks[button]) != 0
+
+    def set_buttons(self, *buttons, pushed=True):
+        """
+        Sets any number of buttons at once.
+        """
+        self.set_mask(self.get_mask(*buttons), pushed=pushed)
+
+    def get_mask(self, *buttons):
+        """
+        :returns 24 bit mask of the given buttons, to be used with set_mask
+        """
+        mask = 0
+        for button in buttons:
+            if button not in self._available_buttons:
+                raise ValueError(f'Given button "{button}" is not available to {self.controller.device_name()}.')
+            mask |= self._masks[button]
+        return mask
+
+    def set_mask(self, mask, pushed=True):
+        """
+        Pushes or releases all buttons of the 24 bit mask.
+        """
+        if pushed:
+            self._set(self._buttons | mask)
+        else:
+            self._set(self._buttons & ~mask)
+
+    def get_bits(self):
+        """
+        :returns the button state as 24 bit integer
+        """
+        return self._buttons
+
+    def set_bits(self, bits):
+        """
+        Replaces the whole button state.
+        :param bits: 24 bit integer, e.g. a combination of masks returned by get_mask
+        """
+        if not 0 <= bits < 0x1000000:
+            raise ValueError('Button state must be a 24 bit value')
+        self._set(bits)
+
+    def _set(self, bits):
+        if bits != self._buttons:
+            self._buttons = bits
+            self._revision = next(_revisions)
+            self._bytes = None
+
+    def get_revision(self):
+        """
+        :returns number which changes whenever the button state changes
+        """
+        return self._revision
+
+    def has_button(self, button):
+        """
+        :returns True if the button is available to the controller
+        """
+        return button in self._available_buttons
 
     def get_available_buttons(self):
         """
@@ -179,12 +349,55 @@ class ButtonState:
         """
         :returns: iterator over the button bytes
         """
-        yield self._byte_1
-        yield self._byte_2
-        yield self._byte_3
+        yield self._buttons & 0xFF
+        yield (self._buttons >> 8) & 0xFF
+        yield self._buttons >> 16
+
+    def __bytes__(self):
+        if self._bytes is None:
+            self._bytes = self._buttons.to_bytes(3, 'little')
+        return self._bytes
 
     def clear(self):
-        self._byte_1 = self._byte_2 = self._byte_3 = 0
+        self._set(0)
+
+
+class _ButtonMethod:
+    """
+    Generated button method of ButtonState, only accessible on states of controllers with the button.
+    """
+    __slots__ = ('button', 'function')
+
+    def __init__(self, button, function):
+        self.button = button
+        self.function = function
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.function
+        if self.button not in instance._masks:
+            raise AttributeError(f'{instance.controller.device_name()} has no button "{self.button}"')
+        return self.function.__get__(instance, owner)
+
+
+def _button_method_factory(button):
+    def setter(self, pushed=True):
+        self.set_mask(self._masks[button], pushed=pushed)
+
+    def getter(self):
+        return (self._buttons & self._masks[button]) != 0
+
+    setter.__name__ = button
+    getter.__name__ = f'{button}_is_set'
+    return setter, getter
+
+
+# generating methods for each button
+for _button in sorted(set().union(*_BUTTON_TABLES.values())):
+    _setter, _getter = _button_method_factory(_button)
+    setattr(ButtonState, _setter.__name__, _ButtonMethod(_button, _setter))
+    setattr(ButtonState, _getter.__name__, _ButtonMethod(_button, _getter))
+del _button, _setter, _getter
 
 
 async def button_press(controller_state, *buttons):
@@ -196,11 +409,8 @@ async def button_press(controller_state, *buttons):
     if not buttons:
         raise ValueError('No Buttons were given.')
 
-    button_state = controller_state.button_state
-
-    for button in buttons:
-        # push button
-        button_state.set_button(button, pushed=True)
+    # push all buttons at once
+    controller_state.button_state.set_buttons(*buttons, pushed=True)
 
     # wait until report is send
     await controller_state.send()
@@ -215,11 +425,8 @@ async def button_release(controller_state, *buttons):
     if not buttons:
         raise ValueError('No Buttons were given.')
 
-    button_state = controller_state.button_state
-
-    for button in buttons:
-        # release button
-        button_state.set_button(button, pushed=False)
+    # release all buttons at once
+    controller_state.button_state.set_buttons(*buttons, pushed=False)
 
     # wait until report is send
     await controller_state.send()
@@ -292,30 +499,50 @@ class StickState:
 
         self._calibration = calibration
 
-    def set_h(self, value):
-        if not 0 <= value < 0x1000:
+        # changed on every modification, the encoded bytes are cached until then
+        self._revision = next(_revisions)
+        self._bytes = None
+
+    def _set_position(self, h, v):
+        if not (0 <= h < 0x1000 and 0 <= v < 0x1000):
             raise ValueError(f'Stick values must be in [0,{0x1000})')
-        self._h_stick = value
+        if h != self._h_stick or v != self._v_stick:
+            self._h_stick = h
+            self._v_stick = v
+            self._revision = next(_revisions)
+            self._bytes = None
+
+    def set_h(self, value):
+        self._set_position(value, self._v_stick)
 
     def get_h(self):
         return self._h_stick
 
     def set_v(self, value):
-        if not 0 <= value < 0x1000:
-            raise ValueError(f'Stick values must be in [0,{0x1000})')
-        self._v_stick = value
+        self._set_position(self._h_stick, value)
 
     def get_v(self):
         return self._v_stick
 
+    def set_position(self, h, v):
+        """
+        Sets both axes at once.
+        """
+        self._set_position(h, v)
+
+    def get_revision(self):
+        """
+        :returns number which changes whenever the stick position changes
+        """
+        return self._revision
+
     def set_center(self):
         """
         Sets stick to center position using the calibration data.
         """
         if self._calibration is None:
             raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center
-        self._v_stick = self._calibration.v_center
+        self._set_position(self._calibration.h_center, self._calibration.v_center)
 
     def is_center(self, radius=0):
         return self._calibration.h_center - radius <= self._h_stick <= self._calibration.h_center + radius and \
@@ -327,8 +554,8 @@ class StickState:
         """
         if self._calibration is None:
             raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center
-        self._v_stick = self._calibration.v_center + self._calibration.v_max_above_center
+        self._set_position(self._calibration.h_center,
+                           self._calibration.v_center + self._calibration.v_max_above_center)
 
     def set_down(self):
         """
@@ -336,8 +563,8 @@ class StickState:
         """
         if self._calibration is None:
             raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center
-        self._v_stick = self._calibration.v_center - self._calibration.v_max_below_center
+        self._set_position(self._calibration.h_center,
+                           self._calibration.v_center - self._calibration.v_max_below_center)
 
     def set_left(self):
         """
@@ -345,8 +572,8 @@ class StickState:
         """
         if self._calibration is None:
             raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center - self._calibration.h_max_below_center
-        self._v_stick = self._calibration.v_center
+        self._set_position(self._calibration.h_center - self._calibration.h_max_below_center,
+                           self._calibration.v_center)
 
     def set_right(self):
         """
@@ -354,8 +581,8 @@ class StickState:
         """
         if self._calibration is None:
             raise ValueError('No calibration data available.')
-        self._h_stick = self._calibration.h_center + self._calibration.h_max_above_center
-        self._v_stick = self._calibration.v_center
+        self._set_position(self._calibration.h_center + self._calibration.h_max_above_center,
+                           self._calibration.v_center)
 
     def set_calibration(self, calibration):
         self._calibration = calibration
@@ -373,8 +600,9 @@ class StickState:
         return StickState(h=stick_h, v=stick_v)
 
     def __bytes__(self):
-        byte_1 = 0xFF & self._h_stick
-        byte_2 = (self._h_stick >> 8) | ((0xF & self._v_stick) << 4)
-        byte_3 = self._v_stick >> 4
-        assert all(0 <= byte <= 0xFF for byte in (byte_1, byte_2, byte_3))
-        return bytes((byte_1, byte_2, byte_3))
+        if self._bytes is None:
+            # values are range checked when set
+            self._bytes = bytes((self._h_stick & 0xFF,
+                                 (self._h_stick >> 8) | ((self._v_stick & 0xF) << 4),
+                                 self._v_stick >> 4))
+        return self._bytes
@@ -0,0 +1,148 @@
+import struct
+
+from joycontrol.capture import CaptureReader, INPUT
+from joycontrol.report import IMU_DATA_SIZE
+
+"""
+Sources of accelerometer and gyroscope data for 0x30 input reports.
+
+Each input report contains three samples (taken 5 ms apart at the default report rate) of
+accelerometer x, y, z and gyroscope x, y, z as signed 16 bit integers in raw sensor units.
+https://github.com/dekuNukem/Nintendo_Switch_Reverse_Engineering/blob/master/imu_sensor_notes.md
+
+All sources pack their data once when they are created, the report loop copies one precomputed
+36 byte frame per report into the report buffer (see ControllerState.set_imu_source).
+
+Example:
+    # controller lying flat on the table
+    controller_state.set_imu_source(StaticImu(accel=(0, 0, ACCEL_1G)))
+"""
+
+SAMPLES_PER_REPORT = 3
+
+# Approximate raw values of the default sensor sensitivity
+ACCEL_1G = 4096  # accelerometer, +-8 G range
+GYRO_1DPS = 1 / 0.07  # gyroscope, +-2000 degrees per second range
+
+_SAMPLE = struct.Struct('<6h')
+
+
+def _pack_sample(sample):
+    if len(sample) != 6:
+        raise ValueError('IMU samples consist of accel x, y, z and gyro x, y, z')
+    try:
+        return _SAMPLE.pack(*(int(round(value)) for value in sample))
+    except struct.error:
+        raise ValueError(f'IMU sample values must be in [{-0x8000}, {0x8000})')
+
+
+class ImuSource:
+    """
+    Plays precomputed frames of three samples, one frame per input report.
+    """
+    def __init__(self, data, loop=True):
+        """
+        :param data: packed samples, the length must be a multiple of 36 bytes (three samples)
+        :param loop: if True, the frames are repeated. Otherwise the last frame is kept.
+        """
+        if not data or len(data) % IMU_DATA_SIZE != 0:
+            raise ValueError(f'IMU data must be a non empty multiple of {IMU_DATA_SIZE} bytes')
+        self._data = memoryview(bytes(data))
+        # views of the frames are created once, no copies are made per report
+        self._frames = [self._data[i:i + IMU_DATA_SIZE] for i in range(0, len(self._data), IMU_DATA_SIZE)]
+        self._loop = loop
+        self._index = 0
+
+    @classmethod
+    def from_samples(cls, samples, loop=True):
+        """
+        :param samples: sequence of (accel x, y, z, gyro x, y, z) samples in raw units. Missing samples of the last
+                        frame are filled with the last sample.
+                        Numpy arrays of shape (N, 6) are packed without a Python loop.
+        """
+        if hasattr(samples, 'astype'):
+            # numpy array
+            if len(samples.shape) != 2 or samples.shape[1] != 6:
+                raise ValueError('IMU sample arrays must be of shape (N, 6)')
+            if not len(samples):
+                raise ValueError('No samples given')
+            samples = samples.round()
+            # astype wraps around silently, check the range like struct.pack does (fails for NaN as well)
+            if not ((samples >= -0x8000) & (samples < 0x8000)).all():
+                raise ValueError(f'IMU sample values must be in [{-0x8000}, {0x8000})')
+            data = samples.astype('<i2').tobytes()
+            last = data[-_SAMPLE.size:]
+        else:
+            packed = [_pack_sample(sample) for sample in samples]
+            if not packed:
+                raise ValueError('No samples given')
+            data = b''.join(packed)
+            last = packed[-1]
+
+        missing = -(len(data) // _SAMPLE.size) % SAMPLES_PER_REPORT
+        return cls(data + last * missing, loop=loop)
+
+    def get_frame_count(self):
+        return len(self._frames)
+
+    def reset(self):
+        self._index = 0
+
+    def next_frame(self):
+        """
+        :returns 36 bytes of IMU data for the next input report
+        """
+        frame = self._frames[self._index]
+        self._index += 1
+        if self._index == len(self._frames):
+            self._index = 0 if self._loop else self._index - 1
+        return frame
+
+
+class StaticImu(ImuSource):
+    """
+    Constant pose, e.g. the controller lying on a table or held still.
+    """
+    def __init__(self, accel=(0, 0, ACCEL_1G), gyro=(0, 0, 0)):
+        """
+        :param accel: accelerometer x, y, z in raw units
+        :param gyro: gyroscope x, y, z in raw units
+        """
+        super().__init__(_pack_sample(tuple(accel) + tuple(gyro)) * SAMPLES_PER_REPORT)
+
+
+class CurveImu(ImuSource):
+    """
+    Motion given by a function of time, sampled once at creation.
+    """
+    def __init__(self, function, duration, period, loop=True):
+        """
+        :param function: maps seconds to a (accel x, y, z, gyro x, y, z) tuple in raw units
+        :param duration: seconds to sample
+        :param period: seconds between input reports, see TickScheduler.get_period
+        :param loop: repeat the motion after duration seconds
+        """
+        sample_period = period / SAMPLES_PER_REPORT
+        count = max(1, int(round(duration / sample_period)))
+        count += -count % SAMPLES_PER_REPORT
+        super().__init__(b''.join(_pack_sample(function(i * sample_period)) for i in range(count)), loop=loop)
+
+
+class RecordedImu(ImuSource):
+    """
+    Sensor data recorded from a real controller.
+    """
+    @classmethod
+    def from_capture(cls, file, start=None, end=None, loop=True):
+        """
+        Extracts the IMU data of the 0x30 input reports of a capture, e.g. recorded with the relay script.
+        :param file: capture file opened for binary reading, see joycontrol.capture
+        :param start: ignore reports before this time in seconds since the start of the capture
+        :param end: ignore reports after this time in seconds since the start of the capture
+        """
+        frames = [record.data[14:14 + IMU_DATA_SIZE]
+                  for record in CaptureReader(file).records(start=start, end=end, direction=INPUT, report_ids=(0x30,))
+                  if len(record.data) >= 14 + IMU_DATA_SIZE]
+        if not frames:
+            raise ValueError('Capture contains no IMU data')
+        return cls(b''.join(frames), loop=loop)
@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+"""
+Persistent cache of the link state negotiated with a console.
+
+The cache is a small JSON file mapping keys (e.g. controller type and bluetooth adapter) to entries:
+    {
+        "console_address": "FF:FF:FF:FF:FF:FF",
+        "input_report_mode": 48,
+        "player_lights": 1,
+        "updated": 1600000000.0
+    }
+A restarted process can reconnect to the cached console address and restore the input report mode and player lights
+without waiting for the console to repeat the handshake (see ControllerProtocol.restore_link_state).
+"""
+
+
+class LinkCache:
+    def __init__(self, path, key='default'):
+        """
+        :param path: path of the JSON file, created on the first save
+        :param key: entry of this link, allows several controllers to share a cache file
+        """
+        self.path = path
+        self.key = key
+
+    def _read(self):
+        try:
+            with open(self.path) as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            logger.warning(f'Ignoring unreadable link cache {self.path}: {err}')
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def load(self):
+        """
+        :returns cached entry (dict) of this link or None
+        """
+        entry = self._read().get(self.key)
+        if not isinstance(entry, dict) or not entry.get('console_address'):
+            return None
+        return entry
+
+    def save(self, console_address, input_report_mode=None, player_lights=None):
+        """
+        Stores the entry of this link. The file is replaced atomically, other entries are kept.
+        """
+        entries = self._read()
+        entries[self.key] = {
+            'console_address': console_address,
+            'input_report_mode': input_report_mode,
+            'player_lights': player_lights,
+            'updated': time.time()
+        }
+
+        self._write(entries)
+
+    def _write(self, entries):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(entries, file, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """
+        Removes the entry of this link, e.g. if the console rejects the reconnection.
+        """
+        entries = self._read()
+        if entries.pop(self.key, None) is not None:
+            self._write(entries)
+
+    def restore(self, protocol):
+        """
+        Restores the cached input report mode and player lights of a reconnected protocol.
+        :returns True if a cached entry was applied
+        """
+        entry = self.load()
+        if entry is None:
+            return False
+        protocol.restore_link_state(input_report_mode=entry.get('input_report_mode'),
+                                    player_lights=entry.get('player_lights'))
+        return True
+
+    async def record(self, protocol):
+        """
+        Waits until the console accepted the controller (player lights set) and stores the link state.
+        :param protocol: connected ControllerProtocol
+        """
+        await protocol.sig_set_player_lights.wait()
+        if protocol.transport is None:
+            return
+        console_address = protocol.transport.get_extra_info('peername')[0]
+        self.save(console_address, input_report_mode=protocol.get_input_report_mode(),
+                  player_lights=protocol.get_player_lights())
+        logger.info(f'Stored link state of {console_address} in {self.path}')
@@ -0,0 +1,266 @@
+import asyncio
+import collections
+import logging
+import socket
+import time
+
+from joycontrol import utils
+from joycontrol.metrics import Histogram
+from joycontrol.report import OutputReport, OutputReportID, SubCommand, SPI_FLASH_READ_REQUEST
+from joycontrol.rumble import NEUTRAL_RUMBLE_DATA, RUMBLE_DATA_OFFSET
+from joycontrol.transport import L2CAP_Transport, NotConnectedError
+
+logger = logging.getLogger(__name__)
+
+"""
+Runs a controller protocol without Bluetooth hardware.
+
+The protocol is connected to a VirtualConsole through Unix SOCK_SEQPACKET socket pairs, which keep the message
+boundaries of L2CAP channels. The virtual console replays the pairing sequence of a Switch and consumes the input
+reports at full rate, so the protocol can be benchmarked and regression tested on any Linux machine.
+
+Example:
+    transport, protocol, console = await create_loopback_connection(
+        controller_protocol_factory(Controller.PRO_CONTROLLER))
+    await console.pair()
+    await console.consume(10)
+    print(console.get_report_rate())
+"""
+
+DEFAULT_CONTROLLER_ADDRESS = '7C:BB:8A:00:00:01'
+DEFAULT_CONSOLE_ADDRESS = '98:B6:E9:00:00:01'
+
+# Sub commands send by the Switch when pairing a Pro Controller, (sub command, data)
+# https://github.com/timmeh87/switchnotes/blob/master/console_pairing_session
+PAIRING_SEQUENCE = (
+    (SubCommand.REQUEST_DEVICE_INFO, b''),
+    (SubCommand.SET_SHIPMENT_STATE, b'\x00'),
+    (SubCommand.SPI_FLASH_READ, SPI_FLASH_READ_REQUEST.pack(0x6000, 0x10)),
+    (SubCommand.SPI_FLASH_READ, SPI_FLASH_READ_REQUEST.pack(0x6050, 0x0D)),
+    (SubCommand.SET_INPUT_REPORT_MODE, b'\x30'),
+    (SubCommand.TRIGGER_BUTTONS_ELAPSED_TIME, b''),
+    (SubCommand.SPI_FLASH_READ, SPI_FLASH_READ_REQUEST.pack(0x6080, 0x18)),
+    (SubCommand.SPI_FLASH_READ, SPI_FLASH_READ_REQUEST.pack(0x6098, 0x12)),
+    (SubCommand.SPI_FLASH_READ, SPI_FLASH_READ_REQUEST.pack(0x8010, 0x18)),
+    (SubCommand.SPI_FLASH_READ, SPI_FLASH_READ_REQUEST.pack(0x603D, 0x19)),
+    (SubCommand.SPI_FLASH_READ, SPI_FLASH_READ_REQUEST.pack(0x6020, 0x18)),
+    (SubCommand.ENABLE_6AXIS_SENSOR, b'\x01'),
+    (SubCommand.ENABLE_VIBRATION, b'\x01'),
+    (SubCommand.SET_PLAYER_LIGHTS, b'\x01'),
+)
+
+
+def _socket_pair():
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+
+class LoopbackTransport(L2CAP_Transport):
+    """
+    L2CAP transport on Unix sockets, reporting Bluetooth addresses as socket names.
+    """
+    def __init__(self, loop, protocol, itr_sock, ctr_sock, read_buffer_size, capture_file=None, metrics=None,
+                 sockname=(DEFAULT_CONTROLLER_ADDRESS, 19), peername=(DEFAULT_CONSOLE_ADDRESS, 19)):
+        super().__init__(loop, protocol, itr_sock, ctr_sock, read_buffer_size, capture_file=capture_file,
+                         metrics=metrics)
+        self._extra_info['sockname'] = sockname
+        self._extra_info['peername'] = peername
+
+
+class VirtualConsole:
+    """
+    Scripted Switch peer. A background reader receives all input reports of the controller, replies to sub commands
+    are matched to the pending requests.
+    """
+    def __init__(self, itr_sock, ctl_sock, reply_timeout=1.0, retries=3, clock=time.perf_counter):
+        """
+        :param itr_sock: console end of the interrupt channel, non blocking
+        :param ctl_sock: console end of the control channel
+        :param reply_timeout: seconds to wait for a sub command reply before the request is repeated
+        :param retries: number of repetitions before a request fails
+        :param clock: clock function returning seconds
+        """
+        self._itr_sock = itr_sock
+        self._ctl_sock = ctl_sock
+        self.reply_timeout = reply_timeout
+        self.retries = retries
+        self._clock = clock
+
+        self._timer = 0
+        # sub command id -> futures waiting for the reply
+        self._pending = collections.defaultdict(collections.deque)
+        self._reader = None
+        self._rumble_task = None
+
+        # statistics
+        self.reports = collections.Counter()
+        self.report_intervals = Histogram()
+        self.reply_latency = Histogram()
+        self.repeated_requests = 0
+        self._last_report_time = None
+        self._first_report_time = None
+        self._full_mode_reports = 0
+
+    def start(self):
+        if self._reader is None:
+            self._reader = asyncio.ensure_future(self._read_reports())
+            self._reader.add_done_callback(utils.create_error_check_callback(ignore=asyncio.CancelledError))
+
+    async def _read_reports(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            data = await loop.sock_recv(self._itr_sock, 400)
+            if not data:
+                raise NotConnectedError('Controller closed the connection.')
+            now = self._clock()
+            report_id = data[1] if len(data) > 1 else None
+            self.reports[report_id] += 1
+
+            if report_id in (0x30, 0x31):
+                if self._last_report_time is None:
+                    self._first_report_time = now
+                else:
+                    self.report_intervals.observe(now - self._last_report_time)
+                self._last_report_time = now
+                self._full_mode_reports += 1
+            elif report_id == 0x21 and len(data) > 15:
+                waiters = self._pending.get(data[15])
+                while waiters:
+                    future = waiters.popleft()
+                    if not future.done():
+                        future.set_result(data)
+                        break
+
+    def _next_timer(self):
+        timer = self._timer
+        self._timer = (timer + 1) % 0x10
+        return timer
+
+    async def send_output_report(self, report: OutputReport):
+        report.set_timer(self._next_timer())
+        await asyncio.get_event_loop().sock_sendall(self._itr_sock, bytes(report.data))
+
+    def _create_report(self, report_id):
+        report = OutputReport()
+        report.set_output_report_id(report_id)
+        report.data[RUMBLE_DATA_OFFSET:RUMBLE_DATA_OFFSET + len(NEUTRAL_RUMBLE_DATA)] = NEUTRAL_RUMBLE_DATA
+        return report
+
+    async def send_sub_command(self, sub_command, data=b''):
+        """
+        Sends a sub command request and waits for the reply, the request is repeated if the reply times out.
+        :param sub_command: SubCommand or raw id
+        :param data: sub command data
+        :returns the 0x21 reply including the 0xA1 prefix
+        """
+        self.start()
+        sub_command_id = sub_command.value if isinstance(sub_command, SubCommand) else sub_command
+
+        report = self._create_report(OutputReportID.SUB_COMMAND)
+        report.set_sub_command(sub_command_id)
+        report.set_sub_command_data(data)
+
+        for attempt in range(self.retries + 1):
+            future = asyncio.get_event_loop().create_future()
+            self._pending[sub_command_id].append(future)
+            start = self._clock()
+            await self.send_output_report(report)
+            try:
+                reply = await asyncio.wait_for(future, self.reply_timeout)
+            except asyncio.TimeoutError:
+                self.repeated_requests += 1
+                continue
+            self.reply_latency.observe(self._clock() - start)
+            return reply
+        raise asyncio.TimeoutError(f'No reply to sub command 0x{sub_command_id:02x}')
+
+    async def pair(self, sequence=PAIRING_SEQUENCE):
+        """
+        Replays the sub commands of a pairing, the controller is in full input report mode afterwards.
+        :param sequence: (sub command, data) tuples
+        """
+        for sub_command, data in sequence:
+            await self.send_sub_command(sub_command, data)
+
+    def start_rumble(self, period=0.015):
+        """
+        Sends neutral rumble output reports periodically, like a Switch does while connected.
+        """
+        if self._rumble_task is None:
+            self._rumble_task = asyncio.ensure_future(self._send_rumble(period))
+            self._rumble_task.add_done_callback(utils.create_error_check_callback(ignore=asyncio.CancelledError))
+
+    async def _send_rumble(self, period):
+        report = self._create_report(OutputReportID.RUMBLE_ONLY)
+        deadline = self._clock()
+        while True:
+            await self.send_output_report(report)
+            deadline += period
+            await asyncio.sleep(max(0, deadline - self._clock()))
+
+    def reset_statistics(self):
+        self.reports.clear()
+        self.report_intervals.reset()
+        self.reply_latency.reset()
+        self.repeated_requests = 0
+        self._last_report_time = None
+        self._first_report_time = None
+        self._full_mode_reports = 0
+
+    async def consume(self, duration):
+        """
+        Receives input reports for some time.
+        :param duration: seconds
+        :returns number of full mode input reports received meanwhile
+        """
+        self.start()
+        reports = self._full_mode_reports
+        await asyncio.sleep(duration)
+        return self._full_mode_reports - reports
+
+    def get_report_rate(self):
+        """
+        :returns mean rate in Hz of the full mode input reports received since the statistics were reset
+        """
+        if self._full_mode_reports < 2:
+            return 0
+        return (self._full_mode_reports - 1) / (self._last_report_time - self._first_report_time)
+
+    async def close(self):
+        for task in (self._reader, self._rumble_task):
+            if task is not None and task.cancel():
+                try:
+                    await task
+                except (asyncio.CancelledError, NotConnectedError):
+                    pass
+        self._reader = None
+        self._rumble_task = None
+        self._itr_sock.close()
+        self._ctl_sock.close()
+
+
+async def create_loopback_connection(protocol_factory, capture_file=None, controller_address=DEFAULT_CONTROLLER_ADDRESS,
+                                     console_address=DEFAULT_CONSOLE_ADDRESS, **console_args):
+    """
+    Connects a new protocol to a virtual console, counterpart of create_hid_server.
+    :param protocol_factory: Factory function returning a ControllerProtocol instance
+    :param capture_file: opened file or joycontrol.capture.CaptureWriter to log incoming and outgoing messages
+    :param controller_address: Bluetooth address reported by the transport as socket name
+    :param console_address: Bluetooth address reported by the transport as peer name
+    :param console_args: arguments of VirtualConsole
+    :returns transport, protocol and the VirtualConsole
+    """
+    protocol = protocol_factory()
+
+    controller_itr, console_itr = _socket_pair()
+    controller_ctl, console_ctl = _socket_pair()
+    for sock in (controller_itr, console_itr, controller_ctl, console_ctl):
+        sock.setblocking(False)
+
+    transport = LoopbackTransport(asyncio.get_event_loop(), protocol, controller_itr, controller_ctl, 50,
+                                  capture_file=capture_file, metrics=protocol.metrics,
+                                  sockname=(controller_address, 19), peername=(console_address, 19))
+    protocol.connection_made(transport)
+
+    console = VirtualConsole(console_itr, console_ctl, **console_args)
+    console.start()
+    return transport, protocol, console
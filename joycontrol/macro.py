@@ -0,0 +1,563 @@
+import asyncio
+import collections
+import shlex
+import struct
+
+from joycontrol.capture import CaptureReader, INPUT
+from joycontrol.controller import Controller
+from joycontrol.controller_state import ButtonState
+from joycontrol.trajectory import LinearRamp
+
+"""
+Input macros played back in sync with the input reports.
+
+A macro is a list of steps, either built using the Macro methods or parsed from text:
+
+    # comments start with "#"
+    press a b                   # push buttons down
+    release a                   # release buttons
+    push a 0.2                  # push buttons, wait (default 0.1 seconds) and release them
+    wait 1.5                    # wait seconds
+    stick l 0x800 0xFFF         # set raw 12 bit stick position of the left ("l") or right ("r") stick
+    ramp r 0 0x800 0xFFF 0x800 0.5   # linear stick motion from (h, v) to (h, v) in seconds
+    repeat 3                    # repeat the block until the matching "end" n times
+        push x
+        wait 0.5
+    end
+
+Macros are compiled into a Timeline of key frames per input report tick (see Macro.compile), the report loop applies
+the key frames without any further scheduling (see play_macro).
+
+Timelines can also be extracted from the input reports of captures (see Timeline.from_capture) and stored in a
+compact binary format to replay recorded sessions.
+"""
+
+# Seconds a button is held by the "push" step if no duration is given
+DEFAULT_PUSH_DURATION = 0.1
+
+# Changes of the controller state at a tick.
+# press, release: 24 bit button masks, see ButtonState.get_mask. Released buttons are cleared before pressed ones
+#                 are set.
+# l_stick, r_stick: (h, v) position or None if the stick does not change
+Keyframe = collections.namedtuple('Keyframe', ['tick', 'press', 'release', 'l_stick', 'r_stick'])
+
+
+# Binary timeline files (little endian):
+#   header:     magic b'JTML', version (uint16), period (double), length in ticks (uint32), number of key frames (uint32)
+#   key frames: ticks since the previous key frame (uint32), flags (uint8),
+#               press and release masks (2 x 3 bytes) if flags & _HAS_BUTTONS,
+#               left stick if flags & _HAS_L_STICK, right stick if flags & _HAS_R_STICK (3 bytes, 12 bit packed)
+TIMELINE_MAGIC = b'JTML'
+TIMELINE_VERSION = 1
+_TIMELINE_HEADER = struct.Struct('<4sHdII')
+_KEYFRAME_HEADER = struct.Struct('<IB')
+_HAS_BUTTONS = 0x01
+_HAS_L_STICK = 0x02
+_HAS_R_STICK = 0x04
+
+
+def _pack_stick(position):
+    h, v = position
+    return bytes((h & 0xFF, (h >> 8) | ((v & 0xF) << 4), v >> 4))
+
+
+def _unpack_stick(data, offset):
+    return data[offset] | ((data[offset + 1] & 0xF) << 8), (data[offset + 1] >> 4) | (data[offset + 2] << 4)
+
+
+def _merge_keyframes(first, second):
+    """
+    :returns key frame with the combined effect of applying first and then second
+    """
+    return Keyframe(first.tick,
+                    (first.press & ~second.release) | second.press,
+                    first.release | second.release,
+                    first.l_stick if second.l_stick is None else second.l_stick,
+                    first.r_stick if second.r_stick is None else second.r_stick)
+
+
+class Timeline:
+    """
+    Compiled macro. Key frames are sorted by tick, ticks are relative to the start of the playback.
+    """
+    def __init__(self, keyframes, length, period):
+        """
+        :param keyframes: list of Keyframe
+        :param length: number of ticks of the timeline, the last key frame is at tick length at the latest
+        :param period: seconds between ticks the timeline was compiled for
+        """
+        self.keyframes = keyframes
+        self.length = length
+        self.period = period
+
+    def get_duration(self):
+        """
+        :returns duration in seconds
+        """
+        return self.length * self.period
+
+    def resample(self, period):
+        """
+        Converts the timeline to another report period keeping the timing in seconds.
+        Key frames falling into the same tick are merged, unless a button press would be lost.
+        In this case the later key frame is delayed by a tick.
+        :returns new Timeline
+        """
+        keyframes = []
+        for keyframe in self.keyframes:
+            tick = int(round(keyframe.tick * self.period / period))
+            if keyframes:
+                last = keyframes[-1]
+                tick = max(tick, last.tick)
+                if tick == last.tick and last.press & keyframe.release:
+                    tick += 1
+            keyframe = keyframe._replace(tick=tick)
+            if keyframes and keyframes[-1].tick == tick:
+                keyframes[-1] = _merge_keyframes(keyframes[-1], keyframe)
+            else:
+                keyframes.append(keyframe)
+        length = max(int(round(self.length * self.period / period)), keyframes[-1].tick if keyframes else 0)
+        return Timeline(keyframes, length, period)
+
+    @staticmethod
+    def from_capture(file, period, start=None, end=None, report_ids=(0x30,), stick_tolerance=0):
+        """
+        Extracts the button and stick states of the input reports of a capture, e.g. recorded with the relay script.
+        Only changes of the state are stored, runs of identical reports result in a single key frame.
+        :param file: capture file opened for binary reading, see joycontrol.capture
+        :param period: seconds between ticks of the timeline, reports are assigned to the nearest tick
+        :param start: ignore reports before this time in seconds since the start of the capture
+        :param end: ignore reports after this time in seconds since the start of the capture
+        :param report_ids: input report ids to extract the state from
+        :param stick_tolerance: stick changes up to this value (per axis in raw units) are ignored to reduce noise
+        :returns Timeline starting at the first extracted report
+        """
+        keyframes = []
+        first_time = None
+        buttons = l_stick = r_stick = None
+        tick = 0
+
+        for record in CaptureReader(file).records(start=start, end=end, direction=INPUT, report_ids=report_ids):
+            data = record.data
+            if len(data) < 13:
+                continue
+            if first_time is None:
+                first_time = record.time
+            tick = int(round((record.time - first_time) / period))
+
+            new_buttons = data[4] | (data[5] << 8) | (data[6] << 16)
+            new_l_stick = _unpack_stick(data, 7)
+            new_r_stick = _unpack_stick(data, 10)
+
+            press = release = 0
+            changed_l_stick = changed_r_stick = None
+            if buttons is None:
+                # the first key frame sets the absolute state
+                press, release = new_buttons, 0xFFFFFF & ~new_buttons
+                changed_l_stick, changed_r_stick = new_l_stick, new_r_stick
+            else:
+                press = new_buttons & ~buttons
+                release = buttons & ~new_buttons
+                if max(abs(new_l_stick[0] - l_stick[0]), abs(new_l_stick[1] - l_stick[1])) > stick_tolerance:
+                    changed_l_stick = new_l_stick
+                if max(abs(new_r_stick[0] - r_stick[0]), abs(new_r_stick[1] - r_stick[1])) > stick_tolerance:
+                    changed_r_stick = new_r_stick
+
+            if not (press or release or changed_l_stick or changed_r_stick):
+                continue
+
+            buttons = new_buttons
+            if changed_l_stick is not None:
+                l_stick = changed_l_stick
+            if changed_r_stick is not None:
+                r_stick = changed_r_stick
+
+            keyframe = Keyframe(tick, press, release, changed_l_stick, changed_r_stick)
+            if keyframes and keyframes[-1].tick == tick:
+                keyframes[-1] = _merge_keyframes(keyframes[-1], keyframe)
+            else:
+                keyframes.append(keyframe)
+
+        return Timeline(keyframes, tick, period)
+
+    def save(self, file):
+        """
+        Writes the timeline in the binary timeline format.
+        :param file: file opened for binary writing
+        """
+        chunks = [_TIMELINE_HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, self.period, self.length,
+                                        len(self.keyframes))]
+        previous_tick = 0
+        for tick, press, release, l_stick, r_stick in self.keyframes:
+            flags = (_HAS_BUTTONS if press or release else 0) | \
+                    (_HAS_L_STICK if l_stick is not None else 0) | \
+                    (_HAS_R_STICK if r_stick is not None else 0)
+            chunks.append(_KEYFRAME_HEADER.pack(tick - previous_tick, flags))
+            if flags & _HAS_BUTTONS:
+                chunks.append(press.to_bytes(3, 'little') + release.to_bytes(3, 'little'))
+            if l_stick is not None:
+                chunks.append(_pack_stick(l_stick))
+            if r_stick is not None:
+                chunks.append(_pack_stick(r_stick))
+            previous_tick = tick
+        file.write(b''.join(chunks))
+
+    @staticmethod
+    def load(file):
+        """
+        Reads a timeline in the binary timeline format.
+        :param file: file opened for binary reading
+        :returns Timeline
+        """
+        data = file.read()
+        if len(data) < _TIMELINE_HEADER.size or data[:4] != TIMELINE_MAGIC:
+            raise ValueError('Not a timeline file')
+        magic, version, period, length, count = _TIMELINE_HEADER.unpack_from(data)
+        if version != TIMELINE_VERSION:
+            raise ValueError(f'Unsupported timeline version {version}')
+
+        keyframes = []
+        offset = _TIMELINE_HEADER.size
+        tick = 0
+        try:
+            for _ in range(count):
+                delta, flags = _KEYFRAME_HEADER.unpack_from(data, offset)
+                offset += _KEYFRAME_HEADER.size
+                tick += delta
+
+                press = release = 0
+                l_stick = r_stick = None
+                if flags & _HAS_BUTTONS:
+                    press = int.from_bytes(data[offset:offset + 3], 'little')
+                    release = int.from_bytes(data[offset + 3:offset + 6], 'little')
+                    offset += 6
+                if flags & _HAS_L_STICK:
+                    l_stick = _unpack_stick(data, offset)
+                    offset += 3
+                if flags & _HAS_R_STICK:
+                    r_stick = _unpack_stick(data, offset)
+                    offset += 3
+                keyframes.append(Keyframe(tick, press, release, l_stick, r_stick))
+        except (struct.error, IndexError):
+            raise ValueError('Timeline file is truncated')
+
+        return Timeline(keyframes, length, period)
+
+    def __len__(self):
+        return len(self.keyframes)
+
+    def __iter__(self):
+        return iter(self.keyframes)
+
+
+class _TimelineBuilder:
+    def __init__(self, controller, period):
+        self._button_state = ButtonState(controller)
+        self.period = period
+        # tick -> [press, release, l_stick, r_stick]
+        self._frames = {}
+        # seconds since the start, rounded to ticks only when frames are added to avoid accumulating rounding errors
+        self.time = 0.0
+
+    def get_tick(self):
+        return int(round(self.time / self.period))
+
+    def wait(self, sec):
+        if sec < 0:
+            raise ValueError('Durations must not be negative')
+        self.time += sec
+
+    def _frame(self, tick):
+        frame = self._frames.get(tick)
+        if frame is None:
+            frame = self._frames[tick] = [0, 0, None, None]
+        return frame
+
+    def press(self, buttons):
+        mask = self._button_state.get_mask(*buttons)
+        tick = self.get_tick()
+        frame = self._frames.get(tick)
+        if frame is not None and frame[1] & mask:
+            # the buttons are released at this tick, pressing them in the same key frame would keep them held.
+            # Press them a tick later (like Timeline.resample), the following steps are delayed as well.
+            tick += 1
+            self.time = tick * self.period
+        self._frame(tick)[0] |= mask
+
+    def release(self, buttons, tick=None):
+        frame = self._frame(self.get_tick() if tick is None else tick)
+        mask = self._button_state.get_mask(*buttons)
+        # a release after a press in the same tick cancels the press
+        frame[0] &= ~mask
+        frame[1] |= mask
+
+    def stick(self, side, position, tick=None):
+        frame = self._frame(self.get_tick() if tick is None else tick)
+        frame[2 if side == 'l' else 3] = position
+
+    def build(self):
+        keyframes = [Keyframe(tick, press, release, l_stick, r_stick)
+                     for tick, (press, release, l_stick, r_stick) in sorted(self._frames.items())]
+        length = max(self.get_tick(), keyframes[-1].tick if keyframes else 0)
+        return Timeline(keyframes, length, self.period)
+
+
+def _parse_side(side):
+    if side in ('l', 'left'):
+        return 'l'
+    elif side in ('r', 'right'):
+        return 'r'
+    raise ValueError(f'Value of side must be "l", "left" or "r", "right", not "{side}"')
+
+
+def _parse_position(h, v):
+    position = int(h, 0), int(v, 0)
+    if not all(0 <= value < 0x1000 for value in position):
+        raise ValueError(f'Stick values must be in [0,{0x1000})')
+    return position
+
+
+class Macro:
+    """
+    Builder of macros. Methods return the macro to allow chaining:
+
+        macro = Macro().push('a').wait(1).repeat(3, Macro().push('b').wait(0.5))
+        await play_macro(controller_state, macro)
+    """
+    def __init__(self):
+        # list of (operation, arguments) tuples
+        self._steps = []
+
+    def press(self, *buttons):
+        if not buttons:
+            raise ValueError('No Buttons were given.')
+        self._steps.append(('press', buttons))
+        return self
+
+    def release(self, *buttons):
+        if not buttons:
+            raise ValueError('No Buttons were given.')
+        self._steps.append(('release', buttons))
+        return self
+
+    def push(self, *buttons, sec=DEFAULT_PUSH_DURATION):
+        """
+        Pushes the buttons for sec seconds, at least for one tick.
+        """
+        if not buttons:
+            raise ValueError('No Buttons were given.')
+        self._steps.append(('push', (buttons, sec)))
+        return self
+
+    def wait(self, sec):
+        self._steps.append(('wait', sec))
+        return self
+
+    def stick(self, side, h, v):
+        """
+        Sets the raw stick position.
+        :param side: 'l' or 'r'
+        """
+        if not (0 <= h < 0x1000 and 0 <= v < 0x1000):
+            raise ValueError(f'Stick values must be in [0,{0x1000})')
+        self._steps.append(('stick', (_parse_side(side), (h, v))))
+        return self
+
+    def trajectory(self, side, trajectory):
+        """
+        Moves a stick along a trajectory (see joycontrol.trajectory), the macro continues after the trajectory.
+        :param side: 'l' or 'r'
+        """
+        self._steps.append(('trajectory', (_parse_side(side), trajectory)))
+        return self
+
+    def repeat(self, count, macro):
+        """
+        Appends the steps of another macro count times.
+        """
+        if count < 0:
+            raise ValueError('Repeat count must not be negative')
+        self._steps.append(('repeat', (count, macro)))
+        return self
+
+    def compile(self, controller: Controller, period):
+        """
+        :param controller: controller type the macro is played on, used to resolve buttons
+        :param period: seconds between input reports, see TickScheduler.get_period
+        :returns Timeline
+        """
+        builder = _TimelineBuilder(controller, period)
+        self._compile(builder)
+        return builder.build()
+
+    def _compile(self, builder):
+        for op, args in self._steps:
+            if op == 'press':
+                builder.press(args)
+            elif op == 'release':
+                builder.release(args)
+            elif op == 'push':
+                buttons, sec = args
+                builder.press(buttons)
+                # the press may have been delayed by a tick
+                tick = builder.get_tick()
+                builder.wait(sec)
+                # buttons are pushed for at least one report
+                if builder.get_tick() <= tick:
+                    builder.time = (tick + 1) * builder.period
+                builder.release(buttons)
+            elif op == 'wait':
+                builder.wait(args)
+            elif op == 'stick':
+                builder.stick(*args)
+            elif op == 'trajectory':
+                side, trajectory = args
+                tick = builder.get_tick()
+                positions = trajectory.compile(builder.period)
+                for i, position in enumerate(positions):
+                    builder.stick(side, position, tick=tick + i)
+                builder.wait(len(positions) * builder.period)
+            elif op == 'repeat':
+                count, macro = args
+                for _ in range(count):
+                    macro._compile(builder)
+            else:
+                raise ValueError(f'Unknown macro step "{op}"')
+
+    @staticmethod
+    def parse(text):
+        """
+        Parses a macro in the text format described in the module documentation.
+        :returns Macro
+        """
+        # stack of macros of the open repeat blocks
+        stack = [(None, Macro())]
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            try:
+                tokens = shlex.split(line, comments=True)
+            except ValueError as err:
+                raise ValueError(f'Line {line_number}: {err}')
+            if not tokens:
+                continue
+            op, *args = tokens
+            macro = stack[-1][1]
+
+            try:
+                if op == 'press':
+                    macro.press(*args)
+                elif op == 'release':
+                    macro.release(*args)
+                elif op == 'push':
+                    sec = DEFAULT_PUSH_DURATION
+                    if len(args) > 1:
+                        try:
+                            sec = float(args[-1])
+                            args = args[:-1]
+                        except ValueError:
+                            pass
+                    macro.push(*args, sec=sec)
+                elif op == 'wait' and len(args) == 1:
+                    macro.wait(float(args[0]))
+                elif op == 'stick' and len(args) == 3:
+                    macro.stick(args[0], *_parse_position(args[1], args[2]))
+                elif op == 'ramp' and len(args) == 6:
+                    ramp = LinearRamp(_parse_position(args[1], args[2]), _parse_position(args[3], args[4]),
+                                      float(args[5]))
+                    macro.trajectory(args[0], ramp)
+                elif op == 'repeat' and len(args) == 1:
+                    stack.append((int(args[0]), Macro()))
+                elif op == 'end' and not args:
+                    if len(stack) == 1:
+                        raise ValueError('"end" without "repeat"')
+                    count, block = stack.pop()
+                    stack[-1][1].repeat(count, block)
+                else:
+                    raise ValueError(f'Invalid step "{line.strip()}"')
+            except ValueError as err:
+                raise ValueError(f'Line {line_number}: {err}')
+
+        if len(stack) > 1:
+            raise ValueError('Missing "end" of "repeat" block')
+        return stack[0][1]
+
+    @staticmethod
+    def load(path):
+        with open(path) as file:
+            return Macro.parse(file.read())
+
+
+class MacroPlayer:
+    """
+    Applies the key frames of a timeline to a controller state, one tick per call of advance.
+    Used as tick hook of the controller state, see play_macro.
+    """
+    def __init__(self, controller_state, timeline: Timeline, loop=None):
+        self._button_state = controller_state.button_state
+        self._l_stick_state = controller_state.l_stick_state
+        self._r_stick_state = controller_state.r_stick_state
+        self._keyframes = timeline.keyframes
+        self._length = timeline.length
+
+        self._tick = 0
+        self._index = 0
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        # resolved after the last tick of the timeline was written into an input report
+        self.future = loop.create_future()
+
+    def advance(self):
+        """
+        :returns True if the player is finished and can be removed
+        """
+        if self.future.done():
+            return True
+        if self._tick > self._length:
+            self.future.set_result(None)
+            return True
+
+        keyframes = self._keyframes
+        tick = self._tick
+        while self._index < len(keyframes) and keyframes[self._index].tick == tick:
+            _, press, release, l_stick, r_stick = keyframes[self._index]
+            if press or release:
+                button_state = self._button_state
+                button_state.set_bits((button_state.get_bits() & ~release) | press)
+            if l_stick is not None and self._l_stick_state is not None:
+                self._l_stick_state.set_position(*l_stick)
+            if r_stick is not None and self._r_stick_state is not None:
+                self._r_stick_state.set_position(*r_stick)
+            self._index += 1
+
+        self._tick += 1
+        return False
+
+    def cancel(self):
+        self.future.cancel()
+
+
+def play_macro(controller_state, macro):
+    """
+    Plays a macro in the full input report mode, one tick per input report. A running macro is cancelled.
+    :param controller_state: ControllerState of the connected controller
+    :param macro: Macro or Timeline, timelines of another report rate are resampled
+    :returns future which is resolved after the last tick of the macro was written into an input report
+    """
+    period = controller_state.get_tick_period()
+    if isinstance(macro, Timeline):
+        timeline = macro if abs(macro.period - period) < 1e-9 else macro.resample(period)
+    else:
+        timeline = macro.compile(controller_state.get_controller(), period)
+    return controller_state.start_player('macro', MacroPlayer(controller_state, timeline))
+
+
+def load(path):
+    """
+    Loads a macro text file or a binary timeline file (e.g. created by scripts/capture_to_macro.py).
+    :returns Macro or Timeline
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(TIMELINE_MAGIC)) == TIMELINE_MAGIC:
+            file.seek(0)
+            return Timeline.load(file)
+    return Macro.load(path)
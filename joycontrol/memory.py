@@ -1,43 +1,95 @@
+import mmap
+
+# Factory default stick calibration
+_DEFAULT_L_STICK_CALIBRATION = bytes([0x00, 0x07, 0x70, 0x00, 0x08, 0x80, 0x00, 0x07, 0x70])
+_DEFAULT_R_STICK_CALIBRATION = bytes([0x00, 0x08, 0x80, 0x00, 0x07, 0x70, 0x00, 0x07, 0x70])
+
 
 class FlashMemory:
     def __init__(self, spi_flash_memory_data=None, default_stick_cal=False, size=0x80000):
         """
         :param spi_flash_memory_data: data from a memory dump (can be created using dump_spi_flash.py).
+                                      Any bytes like object or list of ints. Mutable buffers (bytearray, mmap)
+                                      are used without copying.
         :param default_stick_cal: If True, override stick calibration bytes with factory default
         :param size of the memory dump, should be constant
         """
+        self._mmap = None
+
         if spi_flash_memory_data is None:
-            spi_flash_memory_data = [0xFF] * size  # Blank data is all 0xFF
+            spi_flash_memory_data = bytearray(b'\xFF') * size  # Blank data is all 0xFF
             default_stick_cal = True
 
         if len(spi_flash_memory_data) != size:
             raise ValueError(f'Given data size {len(spi_flash_memory_data)} does not match size {size}.')
-        if isinstance(spi_flash_memory_data, bytes):
-            spi_flash_memory_data = list(spi_flash_memory_data)
+        if isinstance(spi_flash_memory_data, mmap.mmap):
+            self._mmap = spi_flash_memory_data
+        elif not isinstance(spi_flash_memory_data, bytearray):
+            spi_flash_memory_data = bytearray(spi_flash_memory_data)
+
+        # reads return views into the memory instead of copies
+        self.data = memoryview(spi_flash_memory_data)
 
         # set default controller stick calibration
         if default_stick_cal:
             # L-stick factory calibration
-            spi_flash_memory_data[0x603D:0x6046] = [0x00, 0x07, 0x70, 0x00, 0x08, 0x80, 0x00, 0x07, 0x70]
+            self.data[0x603D:0x6046] = _DEFAULT_L_STICK_CALIBRATION
             # R-stick factory calibration
-            spi_flash_memory_data[0x6046:0x604F] = [0x00, 0x08, 0x80, 0x00, 0x07, 0x70, 0x00, 0x07, 0x70]
+            self.data[0x6046:0x604F] = _DEFAULT_R_STICK_CALIBRATION
 
-        self.data = spi_flash_memory_data
+    @staticmethod
+    def from_file(path, default_stick_cal=False, size=0x80000):
+        """
+        Maps a memory dump file into memory. Pages are only loaded when read.
+        Changes (e.g. the default stick calibration) are copy-on-write and never written back to the file.
+        :param path: path of the memory dump
+        :param default_stick_cal: If True, override stick calibration bytes with factory default
+        :param size: size of the memory dump
+        """
+        with open(path, 'rb') as dump:
+            # the mapping stays valid after the file is closed
+            data = mmap.mmap(dump.fileno(), 0, access=mmap.ACCESS_COPY)
+        try:
+            return FlashMemory(data, default_stick_cal=default_stick_cal, size=size)
+        except ValueError:
+            data.close()
+            raise
+
+    def close(self):
+        """
+        Releases the memory map if the memory was created using from_file.
+        Slices which are still referenced stay valid, the map is released once they are garbage collected.
+        """
+        try:
+            self.data.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            # slices are still exported
+            pass
+        self._mmap = None
 
     def __getitem__(self, item):
+        """
+        :returns int for an index, zero-copy memoryview for a slice. Release slices which are kept around,
+                 see close.
+        """
         return self.data[item]
 
+    def __len__(self):
+        return len(self.data)
+
     def get_factory_l_stick_calibration(self):
         """
         :returns 9 left stick factory calibration bytes
         """
-        return self.data[0x603D:0x6046]
+        return bytes(self.data[0x603D:0x6046])
 
     def get_factory_r_stick_calibration(self):
         """
         :returns 9 right stick factory calibration bytes
         """
-        return self.data[0x6046:0x604F]
+        return bytes(self.data[0x6046:0x604F])
 
     def get_user_l_stick_calibration(self):
         """
@@ -45,7 +97,7 @@ class FlashMemory:
         """
         # check if calibration data is available:
         if self.data[0x8010] == 0xB2 and self.data[0x8011] == 0xA1:
-            return self.data[0x8012:0x801B]
+            return bytes(self.data[0x8012:0x801B])
         else:
             return None
 
@@ -55,6 +107,6 @@ class FlashMemory:
         """
         # check if calibration data is available:
         if self.data[0x801B] == 0xB2 and self.data[0x801C] == 0xA1:
-            return self.data[0x801D:0x8026]
+            return bytes(self.data[0x801D:0x8026])
         else:
             return None
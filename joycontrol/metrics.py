@@ -0,0 +1,262 @@
+import asyncio
+import bisect
+import collections
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+"""
+Runtime metrics of the protocol and transport.
+
+Every ControllerProtocol owns a LinkMetrics instance (protocol.metrics), which is shared with its transports, so
+counters continue across reconnections. Updating a metric is a plain integer increment or a bisect of a short tuple,
+the hot paths stay cheap.
+
+Metrics of several controllers are collected by a MetricsRegistry and exported as JSON or in the Prometheus text
+format, optionally served over a Unix socket:
+    registry = MetricsRegistry()
+    registry.add(protocol.metrics, controller='hci0')
+    server = await MetricsServer(registry, '/run/joycontrol/metrics.sock').start()
+
+    $ curl --unix-socket /run/joycontrol/metrics.sock http://localhost/metrics
+    $ curl --unix-socket /run/joycontrol/metrics.sock http://localhost/metrics.json
+"""
+
+# upper bounds in seconds, suited for the 15 ms report period
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets.
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        """
+        :param bounds: sorted upper bounds of the buckets, values above the last bound are counted in an extra bucket
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def get_mean(self):
+        return self.sum / self.count if self.count else 0
+
+    def get_quantile(self, quantile):
+        """
+        :param quantile: in [0, 1]
+        :returns upper bound of the bucket containing the quantile, max if it is in the last bucket
+        """
+        if not self.count:
+            return 0
+        rank = quantile * self.count
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'buckets': dict(zip([str(bound) for bound in self.bounds] + ['+Inf'], self.counts))
+        }
+
+
+class LinkMetrics:
+    """
+    Counters and histograms of one emulated controller. Times are in seconds.
+    """
+    # name, type, label of keyed counters, description
+    METRICS = (
+        ('input_reports_sent', 'counter', 'report_id', 'Input reports send to the console'),
+        ('output_reports_received', 'counter', 'report_id', 'Output reports received from the console'),
+        ('sub_commands', 'counter', 'sub_command', 'Sub command requests received from the console'),
+        ('bytes_sent', 'counter', None, 'Bytes send to the console'),
+        ('bytes_received', 'counter', None, 'Bytes received from the console'),
+        ('parse_errors', 'counter', None, 'Invalid or unknown output reports'),
+        ('send_errors', 'counter', None, 'Failed socket sends'),
+        ('disconnects', 'counter', None, 'Lost connections'),
+        ('reconnects', 'counter', None, 'Successful reconnections'),
+        ('send_latency', 'histogram', None, 'Duration of socket sends'),
+        ('sub_command_latency', 'histogram', None, 'Time from receiving a sub command request to sending the reply'),
+        ('tick_lateness', 'histogram', None, 'Lateness of the full input report mode ticks'),
+    )
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+
+        self.input_reports_sent = collections.Counter()
+        self.output_reports_received = collections.Counter()
+        self.sub_commands = collections.Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.parse_errors = 0
+        self.send_errors = 0
+        self.disconnects = 0
+        self.reconnects = 0
+
+        self.send_latency = Histogram()
+        self.sub_command_latency = Histogram()
+        self.tick_lateness = Histogram()
+
+        # clock time of the last received output report
+        self.last_receive_time = None
+
+    def reset(self):
+        self.__init__(clock=self.clock)
+
+    def snapshot(self):
+        """
+        :returns JSON serializable dict of all metrics, keyed counters map hex ids to counts
+        """
+        result = {}
+        for name, kind, label, _ in self.METRICS:
+            value = getattr(self, name)
+            if kind == 'histogram':
+                result[name] = value.snapshot()
+            elif label is not None:
+                result[name] = {f'0x{key:02x}': count for key, count in sorted(value.items())}
+            else:
+                result[name] = value
+        return result
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+class MetricsRegistry:
+    """
+    Collects the metrics of several controllers.
+    """
+    def __init__(self, prefix='joycontrol'):
+        self.prefix = prefix
+        self._sources = []
+
+    def add(self, metrics: LinkMetrics, **labels):
+        """
+        :param metrics: e.g. protocol.metrics
+        :param labels: labels identifying the controller, e.g. controller='hci0'
+        """
+        self._sources.append((labels, metrics))
+
+    def remove(self, metrics: LinkMetrics):
+        self._sources = [(labels, source) for labels, source in self._sources if source is not metrics]
+
+    def snapshot(self):
+        """
+        :returns list of dicts with the labels and the metrics of every controller
+        """
+        return [{'labels': dict(labels), 'metrics': metrics.snapshot()} for labels, metrics in self._sources]
+
+    def to_json(self):
+        return json.dumps({'time': time.time(), 'controllers': self.snapshot()})
+
+    def to_prometheus(self):
+        """
+        :returns metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for name, kind, label, description in LinkMetrics.METRICS:
+            full_name = f'{self.prefix}_{name}' + ('_total' if kind == 'counter' else '')
+            if kind == 'histogram':
+                full_name = f'{self.prefix}_{name}_seconds'
+            lines.append(f'# HELP {full_name} {description}')
+            lines.append(f'# TYPE {full_name} {kind}')
+
+            for labels, metrics in self._sources:
+                value = getattr(metrics, name)
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(value.bounds + ('+Inf',), value.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(dict(labels, le=bound))
+                        lines.append(f'{full_name}_bucket{bucket_labels} {cumulative}')
+                    lines.append(f'{full_name}_sum{_format_labels(labels)} {value.sum}')
+                    lines.append(f'{full_name}_count{_format_labels(labels)} {value.count}')
+                elif label is not None:
+                    for key, count in sorted(value.items()):
+                        lines.append(f'{full_name}{_format_labels(dict(labels, **{label: f"0x{key:02x}"}))} {count}')
+                else:
+                    lines.append(f'{full_name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Serves the metrics of a registry over HTTP on a Unix socket.
+    GET /metrics returns the Prometheus text format, GET /metrics.json returns JSON.
+    """
+    def __init__(self, registry: MetricsRegistry, path):
+        self.registry = registry
+        self.path = path
+        self._server = None
+
+    async def start(self):
+        """
+        Starts listening, an existing socket file is replaced.
+        :returns self
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info(f'Serving metrics on {self.path}')
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # skip the request headers
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+
+            parts = request_line.decode('ascii', errors='replace').split()
+            path = parts[1] if len(parts) > 1 else '/metrics'
+            if path.endswith('.json'):
+                status, content_type, body = '200 OK', 'application/json', self.registry.to_json()
+            elif path.rstrip('/') in ('', '/metrics'):
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4', self.registry.to_prometheus()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', 'Not found\n'
+
+            body = body.encode()
+            writer.write(f'HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n'
+                         f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as err:
+            logger.debug(f'Metrics request failed: {err}')
+        finally:
+            writer.close()
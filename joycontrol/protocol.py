@@ -1,6 +1,6 @@
 import asyncio
+import collections
 import logging
-import time
 from asyncio import BaseTransport, BaseProtocol
 from contextlib import suppress
 from typing import Optional, Union, Tuple, Text
@@ -9,91 +9,205 @@ from joycontrol import utils
 from joycontrol.controller import Controller
 from joycontrol.controller_state import ControllerState
 from joycontrol.memory import FlashMemory
-from joycontrol.report import OutputReport, SubCommand, InputReport, OutputReportID
+from joycontrol.metrics import LinkMetrics
+from joycontrol.report import OutputReport, SubCommand, InputReport, OutputReportID, classify_output_report, \
+    lookup_sub_command, create_sub_command_reply, SPI_FLASH_READ_REQUEST
+from joycontrol.rumble import RumbleDecoder
+from joycontrol.scheduler import TickEngine, LatePolicy, HandshakePacer, RATE_66HZ
 from joycontrol.transport import NotConnectedError
 
 logger = logging.getLogger(__name__)
 
 
-def controller_protocol_factory(controller: Controller, spi_flash=None):
+def controller_protocol_factory(controller: Controller, spi_flash=None, report_rate=RATE_66HZ,
+                                late_policy=LatePolicy.CATCH_UP, tick_engine=None):
     if isinstance(spi_flash, bytes):
         spi_flash = FlashMemory(spi_flash_memory_data=spi_flash)
 
     def create_controller_protocol():
-        return ControllerProtocol(controller, spi_flash=spi_flash)
+        return ControllerProtocol(controller, spi_flash=spi_flash, report_rate=report_rate, late_policy=late_policy,
+                                  tick_engine=tick_engine)
 
     return create_controller_protocol
 
 
 class ControllerProtocol(BaseProtocol):
-    def __init__(self, controller: Controller, spi_flash: FlashMemory = None):
+    def __init__(self, controller: Controller, spi_flash: FlashMemory = None, report_rate=RATE_66HZ,
+                 late_policy=LatePolicy.CATCH_UP, tick_engine=None):
+        """
+        :param controller: controller type to emulate
+        :param spi_flash: flash memory of the emulated controller
+        :param report_rate: rate in Hz of input reports in full input report mode (0x30, 0x31)
+        :param late_policy: how to handle missed report deadlines, see joycontrol.scheduler.LatePolicy
+        :param tick_engine: Optional TickEngine shared by several protocols (see joycontrol.controller_pool).
+                            If None, the protocol creates its own engine using report_rate and late_policy.
+        """
         self.controller = controller
         self.spi_flash = spi_flash
 
         self.transport = None
 
+        # Sends input reports in full input report mode
+        if tick_engine is None:
+            tick_engine = TickEngine(rate=report_rate, late_policy=late_policy)
+        self._tick_engine = tick_engine
+        # Paces the reports, holds lateness statistics
+        self.scheduler = tick_engine.scheduler
+
+        # state of the full input report mode
+        self._full_mode_report = None
+        self._full_mode_reader = None
+
         # Increases for each input report send, should overflow at 0x100
         self._input_report_timer = 0x00
 
+        # counters and histograms, shared with the transports of this protocol
+        self.metrics = LinkMetrics()
+
         self._data_received = asyncio.Event()
+        self._connection_lost = asyncio.Event()
+        self._full_mode_started = asyncio.Event()
+
+        # Set by joycontrol.supervisor.SessionSupervisor. If True, tick hooks (e.g. a running macro) are suspended
+        # instead of cancelled when the connection is lost, the supervisor resumes them after reconnecting.
+        self.is_supervised = False
 
         self._controller_state = ControllerState(self, controller, spi_flash=spi_flash)
-        self._controller_state_sender = None
+
+        # sequence number of the last prepared input report and (sequence number, future) tuples of
+        # callers waiting for a report to be send, see get_send_future
+        self._report_sequence = 0
+        self._send_waiters = collections.deque()
 
         # None = Just answer to sub commands
         self._input_report_mode = None
 
         # This event gets triggered once the Switch assigns a player number to the controller and accepts user inputs
         self.sig_set_player_lights = asyncio.Event()
+        self._player_lights = None
+
+        # decodes rumble data of output reports, see ControllerState.subscribe_rumble
+        self.rumble = RumbleDecoder()
+
+        # paces input reports during the sub command handshake of the full input report mode
+        self.pacer = HandshakePacer()
+
+        # Prebuilt replies to sub commands, the content only depends on the controller
+        self._set_input_report_mode_reply = create_sub_command_reply(0x80, SubCommand.SET_INPUT_REPORT_MODE)
+        self._trigger_buttons_elapsed_time_reply = self._create_trigger_buttons_elapsed_time_reply()
+        self._set_nfc_ir_mcu_config_reply = self._create_set_nfc_ir_mcu_config_reply()
+        self._set_nfc_ir_mcu_state_reply = create_sub_command_reply(0x80, SubCommand.SET_NFC_IR_MCU_STATE)
+        self._set_player_lights_reply = create_sub_command_reply(0x80, SubCommand.SET_PLAYER_LIGHTS)
+        self._spi_flash_read_reply = create_sub_command_reply(0x90, SubCommand.SPI_FLASH_READ)
+
+        # maps raw sub command ids to coroutine functions answering them
+        self._sub_command_handlers = {}
+        self._register_default_sub_command_handlers()
 
     async def send_controller_state(self):
         """
         Waits for the controller state to be send.
 
+        In the full input report mode, waits for the next report of the tick engine.
+        Otherwise the state is send immediately once the Switch accepted the controller,
+        before that the state is send with the next sub command reply.
+
         Raises NotConnected exception if the transport is not connected or the connection was lost.
+        :returns sequence number of the input report containing the controller state, see get_send_future
+        """
+        if self.transport is None:
+            raise NotConnectedError('Transport not registered.')
+
+        if self._full_mode_report is None and self.sig_set_player_lights.is_set():
+            # a new report per call, concurrent callers must not modify a report while it is send
+            input_report = InputReport()
+            input_report.set_input_report_id(0x30)
+            input_report.set_vibrator_input()
+            input_report.set_misc()
+            await self.write(input_report)
+            return input_report.sequence
+
+        # the future is shared by all callers, cancelling one caller must not cancel it for the others
+        return await asyncio.shield(self.get_send_future())
+
+    def get_send_future(self):
         """
-        # TODO: Call write directly if in continuously sending input report mode
+        Returns a future which is resolved after the next input report prepared from now on was send.
+        All callers between two reports share the same future, so waiting is cheap even at high call rates.
+        Callers which may be cancelled (e.g. by asyncio.wait_for) must await it using asyncio.shield.
 
+        The result of the future is the sequence number of the report, sequence numbers increase by one for
+        every input report. Clears the sig_is_send event of the controller state.
+        Raises NotConnected exception if the transport is not connected or the connection was lost.
+        """
         if self.transport is None:
             raise NotConnectedError('Transport not registered.')
 
+        # set again by _send_report, waiters of the event see the next report as well
         self._controller_state.sig_is_send.clear()
 
-        # wrap into a future to be able to set an exception in case of a disconnect
-        self._controller_state_sender = asyncio.ensure_future(self._controller_state.sig_is_send.wait())
-        await self._controller_state_sender
-        self._controller_state_sender = None
+        sequence = self._report_sequence + 1
+        if self._send_waiters and self._send_waiters[-1][0] == sequence:
+            return self._send_waiters[-1][1]
+
+        future = asyncio.get_event_loop().create_future()
+        self._send_waiters.append((sequence, future))
+        return future
 
     async def write(self, input_report: InputReport):
         """
         Sets timer byte and current button state in the input report and sends it.
-        Fires sig_is_send event in the controller state afterwards.
+        Sets the sig_is_send event of the controller state and resolves the futures of get_send_future afterwards.
 
         Raises NotConnected exception if the transport is not connected or the connection was lost.
         """
+        self._prepare_report(input_report)
+        await self._send_report(input_report)
+
+    def _prepare_report(self, input_report: InputReport):
+        """
+        Sets timer byte and current button state in the input report.
+
+        Raises NotConnected exception if the transport is not connected.
+        """
         if self.transport is None:
             raise NotConnectedError('Transport not registered.')
 
-        # set button and stick data of input report
-        input_report.set_button_status(self._controller_state.button_state)
-        if self._controller_state.l_stick_state is None:
-            l_stick = [0x00, 0x00, 0x00]
-        else:
-            l_stick = self._controller_state.l_stick_state
-        if self._controller_state.r_stick_state is None:
-            r_stick = [0x00, 0x00, 0x00]
-        else:
-            r_stick = self._controller_state.r_stick_state
-        input_report.set_stick_status(l_stick, r_stick)
+        # set button and stick data of input report, unchanged states are not rewritten
+        controller_state = self._controller_state
+        input_report.update_controller_status(controller_state.button_state,
+                                              controller_state.l_stick_state,
+                                              controller_state.r_stick_state)
 
         # set timer byte of input report
         input_report.set_timer(self._input_report_timer)
         self._input_report_timer = (self._input_report_timer + 1) % 0x100
 
+        self._report_sequence += 1
+        input_report.sequence = self._report_sequence
+
+    async def _send_report(self, input_report: InputReport):
+        """
+        Sends a prepared input report. Sets the sig_is_send event of the controller state (cleared by
+        get_send_future) and resolves the futures of get_send_future afterwards.
+
+        Raises NotConnected exception if the transport is not connected or the connection was lost.
+        """
+        if self.transport is None:
+            raise NotConnectedError('Transport not registered.')
+
         await self.transport.write(input_report)
 
         self._controller_state.sig_is_send.set()
 
+        # wake up callers waiting for this or an earlier report
+        waiters = self._send_waiters
+        sequence = input_report.sequence
+        while waiters and waiters[0][0] <= sequence:
+            _, future = waiters.popleft()
+            if not future.done():
+                future.set_result(sequence)
+
     def get_controller_state(self) -> ControllerState:
         return self._controller_state
 
@@ -104,9 +218,28 @@ class ControllerProtocol(BaseProtocol):
         self._data_received.clear()
         await self._data_received.wait()
 
+    async def wait_for_connection_lost(self):
+        """
+        Waits until the connection to the Switch is lost.
+        """
+        await self._connection_lost.wait()
+
+    def is_full_input_report_mode(self):
+        """
+        :returns True while input reports are send by the tick engine (modes 0x30, 0x31)
+        """
+        return self._full_mode_report is not None
+
+    async def wait_for_full_input_report_mode(self):
+        """
+        Waits until the full input report mode is active, returns immediately if it is.
+        """
+        await self._full_mode_started.wait()
+
     def connection_made(self, transport: BaseTransport) -> None:
         logger.debug('Connection established.')
         self.transport = transport
+        self._connection_lost.clear()
 
     def connection_lost(self, exc: Optional[Exception] = None) -> None:
         if self.transport is not None:
@@ -114,8 +247,13 @@ class ControllerProtocol(BaseProtocol):
             asyncio.ensure_future(self.transport.close())
             self.transport = None
 
-            if self._controller_state_sender is not None:
-                self._controller_state_sender.set_exception(NotConnectedError)
+            while self._send_waiters:
+                _, future = self._send_waiters.popleft()
+                if not future.done():
+                    future.set_exception(NotConnectedError('Connection lost.'))
+
+            self.metrics.disconnects += 1
+            self._connection_lost.set()
 
     def error_received(self, exc: Exception) -> None:
         # TODO?
@@ -126,14 +264,14 @@ class ControllerProtocol(BaseProtocol):
         Continuously sends:
             0x30 input reports containing the controller state OR
             0x31 input reports containing the controller state and nfc data
+
+        Reports are send by the tick engine of this protocol.
         """
         if self.transport.is_reading():
             raise ValueError('Transport must be paused in full input report mode')
 
-        # send state at 66Hz
-        send_delay = 0.015
-        await asyncio.sleep(send_delay)
-        last_send_time = time.time()
+        # the input report mode is set after this reader was registered
+        await asyncio.sleep(self.scheduler.get_period())
 
         input_report = InputReport()
         input_report.set_vibrator_input()
@@ -142,192 +280,226 @@ class ControllerProtocol(BaseProtocol):
             raise ValueError('Input report mode is not set.')
         input_report.set_input_report_id(self._input_report_mode)
 
-        reader = asyncio.ensure_future(self.transport.read())
+        self._full_mode_report = input_report
+        self._full_mode_reader = asyncio.ensure_future(self._read_output_report())
+        self._full_mode_started.set()
 
         try:
-            while True:
-                reply_send = False
-                if reader.done():
-                    data = await reader
-
-                    reader = asyncio.ensure_future(self.transport.read())
-
-                    try:
-                        report = OutputReport(list(data))
-                        output_report_id = report.get_output_report_id()
-
-                        if output_report_id == OutputReportID.RUMBLE_ONLY:
-                            # TODO
-                            pass
-                        elif output_report_id == OutputReportID.SUB_COMMAND:
-                            reply_send = await self._reply_to_sub_command(report)
-                        elif output_report_id == OutputReportID.REQUEST_IR_NFC_MCU:
-                            # TODO NFC
-                            raise NotImplementedError('NFC communictation is not implemented.')                            
-                        else:
-                            logger.warning(f'Report unknown output report "{output_report_id}" - IGNORE')
-                    except ValueError as v_err:
-                        logger.warning(f'Report parsing error "{v_err}" - IGNORE')
-                    except NotImplementedError as err:
-                        logger.warning(err)
-
-                if reply_send:
-                    # Hack: Adding a delay here to avoid flooding during pairing
-                    await asyncio.sleep(0.3)
-                else:
-                    # write 0x30 input report.
-                    # TODO: set some sensor data
-                    input_report.set_6axis_data()
-
-                    # TODO NFC - set nfc data
-                    if input_report.get_input_report_id() == 0x31:
-                        pass
-
-                    await self.write(input_report)
-
-                # calculate delay
-                current_time = time.time()
-                time_delta = time.time() - last_send_time
-                sleep_time = send_delay - time_delta
-                last_send_time = current_time
-
-                if sleep_time < 0:
-                    # logger.warning(f'Code is running {abs(sleep_time)} s too slow!')
-                    sleep_time = 0
-
-                await asyncio.sleep(sleep_time)
-
+            # returns if the tick engine stops driving this protocol
+            await self._tick_engine.attach(self)
         except NotConnectedError as err:
             # Stop 0x30 input report mode if disconnected.
             logger.error(err)
         finally:
             # cleanup
             self._input_report_mode = None
+            self._full_mode_report = None
+            self._full_mode_started.clear()
+            # nothing progresses the tick hooks anymore, unless a supervisor restarts the mode after reconnecting
+            if self.transport is not None or not self.is_supervised:
+                self._controller_state.clear_tick_hooks()
             # cancel the reader
+            reader = self._full_mode_reader
+            self._full_mode_reader = None
             with suppress(asyncio.CancelledError, NotConnectedError):
                 if reader.cancel():
                     await reader
 
-    async def report_received(self, data: Union[bytes, Text], addr: Tuple[str, int]) -> None:
-        self._data_received.set()
+    async def _full_mode_prepare(self):
+        """
+        First phase of a tick of the full input report mode, called by the tick engine.
+        Answers a received sub command or writes the controller state into the input report.
 
-        try:
-            report = OutputReport(list(data))
-        except ValueError as v_err:
-            logger.warning(f'Report parsing error "{v_err}" - IGNORE')
-            return
+        Raises NotConnected exception if the connection was lost.
+        :returns the input report to send in the second phase of the tick, or None
+        """
+        # requests are answered right away, also while the pacer holds back input reports
+        reader = self._full_mode_reader
+        if reader.done():
+            data, receive_time = await reader
+
+            self._full_mode_reader = asyncio.ensure_future(self._read_output_report())
+
+            # classify without allocating a report, rumble is send by the Switch at the report rate
+            output_report_id = classify_output_report(data)
+
+            if output_report_id is OutputReportID.RUMBLE_ONLY:
+                self.rumble.feed(data)
+            elif output_report_id is OutputReportID.SUB_COMMAND:
+                # sub command reports contain rumble data as well
+                self.rumble.feed(data)
+                self.pacer.on_request(data)
+                try:
+                    if await self._reply_to_sub_command(OutputReport(data), receive_time):
+                        # Hold back input reports until the Switch had the chance to send its next request,
+                        # to avoid flooding during pairing. The schedule keeps running meanwhile.
+                        self.pacer.on_reply()
+                        return None
+                except ValueError as v_err:
+                    self.metrics.parse_errors += 1
+                    logger.warning(f'Report parsing error "{v_err}" - IGNORE')
+            elif output_report_id is OutputReportID.REQUEST_IR_NFC_MCU:
+                # TODO NFC
+                logger.warning('NFC communictation is not implemented.')
+            else:
+                self.metrics.parse_errors += 1
+                logger.warning(f'Report unknown output report "{bytes(data[:2]).hex()}" - IGNORE')
 
-        try:
-            output_report_id = report.get_output_report_id()
-        except NotImplementedError as err:
-            logger.warning(err)
-            return
+        if self.pacer.is_holding():
+            return None
 
-        if output_report_id == OutputReportID.SUB_COMMAND:
-            await self._reply_to_sub_command(report)
-        # elif output_report_id == OutputReportID.RUMBLE_ONLY:
-        #    pass
-        else:
-            logger.warning(f'Output report {output_report_id} not implemented - ignoring')
+        input_report = self._full_mode_report
+        self.metrics.tick_lateness.observe(self.scheduler.statistics.last_lateness)
 
-    async def _reply_to_sub_command(self, report):
-        # classify sub command
-        try:
-            sub_command = report.get_sub_command()
-        except NotImplementedError as err:
-            logger.warning(err)
-            return False
+        # progress trajectories etc. of the controller state by one tick
+        self._controller_state.advance_tick()
 
-        if sub_command is None:
-            raise ValueError('Received output report does not contain a sub command')
+        # write 0x30 input report.
+        imu_source = self._controller_state.imu_source
+        input_report.set_6axis_data(None if imu_source is None else imu_source.next_frame())
 
-        logging.info(f'received output report - Sub command {sub_command}')
+        # TODO NFC - set nfc data
+        if input_report.get_input_report_id() == 0x31:
+            pass
 
-        sub_command_data = report.get_sub_command_data()
-        assert sub_command_data is not None
+        self._prepare_report(input_report)
+        return input_report
 
-        try:
-            # answer to sub command
-            if sub_command == SubCommand.REQUEST_DEVICE_INFO:
-                await self._command_request_device_info(sub_command_data)
+    async def _read_output_report(self):
+        """
+        Reader of the full input report mode. The next output report may be received before this one is handled,
+        so the receive time is kept with the report.
+        :returns output report data and its receive time, see LinkMetrics.clock
+        """
+        data = await self.transport.read()
+        return data, self.metrics.clock()
 
-            elif sub_command == SubCommand.SET_SHIPMENT_STATE:
-                await self._command_set_shipment_state(sub_command_data)
+    async def report_received(self, data: Union[bytes, Text], addr: Tuple[str, int]) -> None:
+        receive_time = self.metrics.clock()
+        self._data_received.set()
 
-            elif sub_command == SubCommand.SPI_FLASH_READ:
-                await self._command_spi_flash_read(sub_command_data)
+        output_report_id = classify_output_report(data)
+
+        if output_report_id is OutputReportID.SUB_COMMAND:
+            self.rumble.feed(data)
+            self.pacer.on_request(data)
+            try:
+                if await self._reply_to_sub_command(OutputReport(data), receive_time):
+                    self.pacer.on_reply()
+            except ValueError as v_err:
+                self.metrics.parse_errors += 1
+                logger.warning(f'Report parsing error "{v_err}" - IGNORE')
+        elif output_report_id is OutputReportID.RUMBLE_ONLY:
+            self.rumble.feed(data)
+        elif output_report_id is None:
+            self.metrics.parse_errors += 1
+            logger.warning(f'Report unknown output report "{bytes(data[:2]).hex()}" - IGNORE')
+        else:
+            logger.warning(f'Output report {output_report_id} not implemented - ignoring')
 
-            elif sub_command == SubCommand.SET_INPUT_REPORT_MODE:
-                await self._command_set_input_report_mode(sub_command_data)
+    def register_sub_command_handler(self, sub_command, handler):
+        """
+        Registers a handler for a sub command, replacing the current one.
+        :param sub_command: SubCommand or raw sub command id
+        :param handler: coroutine function called with the sub command data (memoryview).
+                        The handler is responsible for sending the reply, e.g. by using
+                        report.create_sub_command_reply and the write method of this protocol.
+                        Raise NotImplementedError if the request cannot be answered.
+        """
+        if isinstance(sub_command, SubCommand):
+            sub_command = sub_command.value
+        self._sub_command_handlers[sub_command] = handler
 
-            elif sub_command == SubCommand.TRIGGER_BUTTONS_ELAPSED_TIME:
-                await self._command_trigger_buttons_elapsed_time(sub_command_data)
+    def register_sub_command_reply(self, sub_command, ack=0x80):
+        """
+        Registers a handler answering a sub command with a constant acknowledgement.
+        The reply is built once and reused for every request.
+        :param sub_command: SubCommand or raw sub command id
+        :param ack: ACK byte of the reply
+        """
+        reply = create_sub_command_reply(ack, sub_command)
+
+        async def reply_with_ack(sub_command_data):
+            await self.write(reply)
+
+        self.register_sub_command_handler(sub_command, reply_with_ack)
+
+    def unregister_sub_command_handler(self, sub_command):
+        if isinstance(sub_command, SubCommand):
+            sub_command = sub_command.value
+        self._sub_command_handlers.pop(sub_command, None)
+
+    def _register_default_sub_command_handlers(self):
+        self.register_sub_command_handler(SubCommand.REQUEST_DEVICE_INFO, self._command_request_device_info)
+        self.register_sub_command_reply(SubCommand.SET_SHIPMENT_STATE)
+        self.register_sub_command_handler(SubCommand.SPI_FLASH_READ, self._command_spi_flash_read)
+        self.register_sub_command_handler(SubCommand.SET_INPUT_REPORT_MODE, self._command_set_input_report_mode)
+        self.register_sub_command_handler(SubCommand.TRIGGER_BUTTONS_ELAPSED_TIME,
+                                          self._command_trigger_buttons_elapsed_time)
+        self.register_sub_command_reply(SubCommand.ENABLE_6AXIS_SENSOR)
+        self.register_sub_command_reply(SubCommand.ENABLE_VIBRATION)
+        self.register_sub_command_handler(SubCommand.SET_NFC_IR_MCU_CONFIG, self._command_set_nfc_ir_mcu_config)
+        self.register_sub_command_handler(SubCommand.SET_NFC_IR_MCU_STATE, self._command_set_nfc_ir_mcu_state)
+        self.register_sub_command_handler(SubCommand.SET_PLAYER_LIGHTS, self._command_set_player_lights)
+
+    async def _reply_to_sub_command(self, report, receive_time=None):
+        """
+        Dispatches the sub command of the report to the registered handler.
+        :param receive_time: time the report was received (see LinkMetrics.clock), start of the measured latency
+        :returns True if a reply was send, False otherwise
+        """
+        # classify sub command
+        sub_command_id = report.get_sub_command_id()
+        if sub_command_id is None:
+            raise ValueError('Received output report does not contain a sub command')
 
-            elif sub_command == SubCommand.ENABLE_6AXIS_SENSOR:
-                await self._command_enable_6axis_sensor(sub_command_data)
+        self.metrics.sub_commands[sub_command_id] += 1
 
-            elif sub_command == SubCommand.ENABLE_VIBRATION:
-                await self._command_enable_vibration(sub_command_data)
+        handler = self._sub_command_handlers.get(sub_command_id)
+        if handler is None:
+            logger.warning(f'Sub command 0x{sub_command_id:02x} not implemented - ignoring')
+            return False
 
-            elif sub_command == SubCommand.SET_NFC_IR_MCU_CONFIG:
-                await self._command_set_nfc_ir_mcu_config(sub_command_data)
+        sub_command = lookup_sub_command(sub_command_id) or f'0x{sub_command_id:02x}'
+        logger.info(f'received output report - Sub command {sub_command}')
 
-            elif sub_command == SubCommand.SET_NFC_IR_MCU_STATE:
-                await self._command_set_nfc_ir_mcu_state(sub_command_data)
+        sub_command_data = report.get_sub_command_data()
+        assert sub_command_data is not None
 
-            elif sub_command == SubCommand.SET_PLAYER_LIGHTS:
-                await self._command_set_player_lights(sub_command_data)
-            else:
-                logger.warning(f'Sub command 0x{sub_command.value:02x} not implemented - ignoring')
-                return False
+        try:
+            # answer to sub command
+            await handler(sub_command_data)
         except NotImplementedError as err:
             logger.error(f'Failed to answer {sub_command} - {err}')
             return False
+
+        if receive_time is not None:
+            self.metrics.sub_command_latency.observe(self.metrics.clock() - receive_time)
         return True
 
     async def _command_request_device_info(self, sub_command_data):
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
+        input_report = create_sub_command_reply(0x82, SubCommand.REQUEST_DEVICE_INFO)
 
         address = self.transport.get_extra_info('sockname')
         assert address is not None
         bd_address = list(map(lambda x: int(x, 16), address[0].split(':')))
 
-        input_report.set_ack(0x82)
         input_report.sub_0x02_device_info(bd_address, controller=self.controller)
 
         await self.write(input_report)
 
-    async def _command_set_shipment_state(self, sub_command_data):
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
-
-        input_report.set_ack(0x80)
-        input_report.reply_to_subcommand_id(0x08)
-
-        await self.write(input_report)
-
     async def _command_spi_flash_read(self, sub_command_data):
         """
         Replies with 0x21 input report containing requested data from the flash memory.
         :param sub_command_data: input report sub command data bytes
         """
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
-
+        input_report = self._spi_flash_read_reply
+        # remove data of the previous read
+        input_report.clear_sub_command()
         input_report.set_ack(0x90)
 
-        # parse offset
-        offset = 0
-        digit = 1
-        for i in range(4):
-            offset += sub_command_data[i] * digit
-            digit *= 0x100
-
-        size = sub_command_data[4]
+        # parse offset and size
+        offset, size = SPI_FLASH_READ_REQUEST.unpack_from(sub_command_data)
 
         if self.spi_flash is not None:
             spi_flash_data = self.spi_flash[offset: offset + size]
@@ -340,14 +512,27 @@ class ControllerProtocol(BaseProtocol):
 
     async def _command_set_input_report_mode(self, sub_command_data):
         if self._input_report_mode == sub_command_data[0]:
+            # e.g. repeated by the Switch after the mode was restored, restarting would cancel the tick hooks
             logger.warning(f'Already in input report mode {sub_command_data[0]} - ignoring request')
+            await self.write(self._set_input_report_mode_reply)
+            return
+
+        if not self._start_input_report_mode(sub_command_data[0]):
+            logger.error(f'input report mode {sub_command_data[0]} not implemented - ignoring request')
+            return
 
+        # Send acknowledgement
+        await self.write(self._set_input_report_mode_reply)
+
+    def _start_input_report_mode(self, mode):
+        """
+        :returns False if the mode is not implemented
+        """
         # Start input report reader
-        if sub_command_data[0] in (0x30, 0x31):
+        if mode in (0x30, 0x31):
             new_reader = asyncio.ensure_future(self.input_report_mode_full())
         else:
-            logger.error(f'input report mode {sub_command_data[0]} not implemented - ignoring request')
-            return
+            return False
 
         # Replace the currently running reader with the input report mode sender,
         # which will also handle incoming requests in the future
@@ -358,32 +543,56 @@ class ControllerProtocol(BaseProtocol):
         async def set_reader():
             await self.transport.set_reader(new_reader)
 
-            logger.info(f'Setting input report mode to {hex(sub_command_data[0])}...')
-            self._input_report_mode = sub_command_data[0]
+            logger.info(f'Setting input report mode to {hex(mode)}...')
+            self._input_report_mode = mode
 
             self.transport.resume_reading()
 
         asyncio.ensure_future(set_reader()).add_done_callback(
             utils.create_error_check_callback()
         )
+        return True
 
-        # Send acknowledgement
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
+    def get_input_report_mode(self):
+        """
+        :returns input report mode requested by the Switch, None if not set
+        """
+        return self._input_report_mode
+
+    def get_player_lights(self):
+        """
+        :returns player lights byte set by the Switch, None if not set
+        """
+        return self._player_lights
+
+    def restore_link_state(self, input_report_mode=None, player_lights=None):
+        """
+        Restores the state negotiated with the Switch during a previous connection (see joycontrol.link_cache),
+        so reports are send at full rate right after reconnecting instead of waiting for the Switch to repeat
+        the handshake. Does nothing for states which were already set by the Switch.
+        :param input_report_mode: e.g. 0x30
+        :param player_lights: player lights byte
+        """
+        if self.transport is None:
+            raise NotConnectedError('Transport not registered.')
 
-        input_report.set_ack(0x80)
-        input_report.reply_to_subcommand_id(0x03)
+        if player_lights is not None and self._player_lights is None:
+            self._player_lights = player_lights
+            self.sig_set_player_lights.set()
 
-        await self.write(input_report)
+        if input_report_mode is not None and self._input_report_mode is None and self._full_mode_report is None \
+                and self.transport.is_reading():
+            if not self._start_input_report_mode(input_report_mode):
+                logger.warning(f'Cannot restore input report mode {hex(input_report_mode)}')
 
     async def _command_trigger_buttons_elapsed_time(self, sub_command_data):
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
+        if self._trigger_buttons_elapsed_time_reply is None:
+            raise NotImplementedError(self.controller)
 
-        input_report.set_ack(0x83)
-        input_report.reply_to_subcommand_id(SubCommand.TRIGGER_BUTTONS_ELAPSED_TIME)
+        await self.write(self._trigger_buttons_elapsed_time_reply)
+
+    def _create_trigger_buttons_elapsed_time_reply(self):
+        input_report = create_sub_command_reply(0x83, SubCommand.TRIGGER_BUTTONS_ELAPSED_TIME)
         # Hack: We assume this command is only used during pairing - Set values so the Switch assigns a player number
         if self.controller == Controller.PRO_CONTROLLER:
             input_report.sub_0x04_trigger_buttons_elapsed_time(L_ms=3000, R_ms=3000)
@@ -391,73 +600,32 @@ class ControllerProtocol(BaseProtocol):
             # TODO: What do we do if we want to pair a combined JoyCon?
             input_report.sub_0x04_trigger_buttons_elapsed_time(SL_ms=3000, SR_ms=3000)
         else:
-            raise NotImplementedError(self.controller)
-
-        await self.write(input_report)
-
-    async def _command_enable_6axis_sensor(self, sub_command_data):
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
-
-        input_report.set_ack(0x80)
-        input_report.reply_to_subcommand_id(0x40)
-
-        await self.write(input_report)
-
-    async def _command_enable_vibration(self, sub_command_data):
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
-
-        input_report.set_ack(0x80)
-        input_report.reply_to_subcommand_id(SubCommand.ENABLE_VIBRATION.value)
-
-        await self.write(input_report)
+            return None
+        return input_report
 
     async def _command_set_nfc_ir_mcu_config(self, sub_command_data):
         # TODO NFC
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
+        await self.write(self._set_nfc_ir_mcu_config_reply)
 
-        input_report.set_ack(0xA0)
-        input_report.reply_to_subcommand_id(SubCommand.SET_NFC_IR_MCU_CONFIG.value)
+    @staticmethod
+    def _create_set_nfc_ir_mcu_config_reply():
+        input_report = create_sub_command_reply(0xA0, SubCommand.SET_NFC_IR_MCU_CONFIG)
 
         data = [1, 0, 255, 0, 8, 0, 27, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 200]
-        for i in range(len(data)):
-            input_report.data[16 + i] = data[i]
-
-        await self.write(input_report)
+        input_report.data[16:16 + len(data)] = bytes(data)
+        return input_report
 
     async def _command_set_nfc_ir_mcu_state(self, sub_command_data):
         # TODO NFC
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
-
-        if sub_command_data[0] == 0x01:
-            # 0x01 = Resume
-            input_report.set_ack(0x80)
-            input_report.reply_to_subcommand_id(SubCommand.SET_NFC_IR_MCU_STATE.value)
-        elif sub_command_data[0] == 0x00:
-            # 0x00 = Suspend
-            input_report.set_ack(0x80)
-            input_report.reply_to_subcommand_id(SubCommand.SET_NFC_IR_MCU_STATE.value)
+        if sub_command_data[0] in (0x00, 0x01):
+            # 0x00 = Suspend, 0x01 = Resume
+            await self.write(self._set_nfc_ir_mcu_state_reply)
         else:
             raise NotImplementedError(f'Argument {sub_command_data[0]} of {SubCommand.SET_NFC_IR_MCU_STATE} '
                                       f'not implemented.')
 
-        await self.write(input_report)
-
     async def _command_set_player_lights(self, sub_command_data):
-        input_report = InputReport()
-        input_report.set_input_report_id(0x21)
-        input_report.set_misc()
-
-        input_report.set_ack(0x80)
-        input_report.reply_to_subcommand_id(SubCommand.SET_PLAYER_LIGHTS.value)
-
-        await self.write(input_report)
+        self._player_lights = sub_command_data[0]
+        await self.write(self._set_player_lights_reply)
 
         self.sig_set_player_lights.set()
@@ -1,29 +1,65 @@
+import struct
 from enum import Enum
 
 from joycontrol.controller import Controller
 
+# Size of the input report buffer including the 0xA1 prefix
+INPUT_REPORT_SIZE = 364
+
+# Number of bytes send for each input report id (including the 0xA1 prefix)
+_INPUT_REPORT_LENGTHS = {
+    0x21: 51,
+    0x30: 14,
+    0x31: 363
+}
+_DEFAULT_INPUT_REPORT_LENGTH = 51
+# Length of 0x30 reports containing IMU data
+_IMU_INPUT_REPORT_LENGTH = 50
+
+# accelerometer and gyroscope data of three samples
+IMU_DATA_SIZE = 36
+
+_ZEROS = bytes(INPUT_REPORT_SIZE)
+
+# little endian address and size of spi flash read requests and replies
+SPI_FLASH_READ_REQUEST = struct.Struct('<IB')
+_ELAPSED_TIME = struct.Struct('<7H')
+
 
 class InputReport:
     """
     Class to create Input Reports. Reference:
     https://github.com/dekuNukem/Nintendo_Switch_Reverse_Engineering/blob/master/bluetooth_hid_notes.md
+
+    The report is backed by a fixed size bytearray, which is never resized. Fields are written in place,
+    the bytes to send can be obtained without copying using get_view().
     """
     def __init__(self, data=None):
         if not data:
-            self.data = [0x00] * 364
+            self.data = bytearray(INPUT_REPORT_SIZE)
             # all input reports are prepended with 0xA1
             self.data[0] = 0xA1
         else:
             if data[0] != 0xA1:
                 raise ValueError('Input reports must start with 0xA1')
-            self.data = data
+            self.data = bytearray(data)
+        self._view = memoryview(self.data)
+
+        # revisions of the button, left stick and right stick states contained in the report,
+        # see update_controller_status
+        self._revisions = [None, None, None]
+
+        # sequence number assigned by the protocol when the report is prepared for sending
+        self.sequence = None
+
+        # True if bytes 14-50 contain IMU data
+        self._has_imu_data = len(self.data) >= 50 and any(self.data[14:50])
 
     def clear_sub_command(self):
         """
         Clear sub command reply data of 0x21 input reports
         """
-        for i in range(14, 51):
-            self.data[i] = 0x00
+        self.data[14:51] = _ZEROS[14:51]
 
     def get_stick_data(self):
         # TODO: Not every input report has stick data
@@ -61,6 +97,7 @@ class InputReport:
         Sets the button status bytes
         """
         self.data[4:7] = iter(button_status)
+        self._revisions[0] = None
 
     def set_stick_status(self, left_stick, right_stick):
         """
@@ -69,6 +106,33 @@ class InputReport:
         self.set_left_analog_stick(bytes(left_stick))
         self.set_right_analog_stick(bytes(right_stick))
 
+    def update_controller_status(self, button_state, left_stick, right_stick):
+        """
+        Writes the button and stick states into the report. Only states which changed since the last update of
+        this report are written, states are compared by their revision (see ButtonState.get_revision).
+        :param button_state: ButtonState
+        :param left_stick: StickState or None if the controller has no left stick
+        :param right_stick: StickState or None if the controller has no right stick
+        """
+        revisions = self._revisions
+        data = self.data
+
+        revision = button_state.get_revision()
+        if revisions[0] != revision:
+            data[4:7] = bytes(button_state)
+            revisions[0] = revision
+
+        # revision 0 stands for a missing stick
+        revision = 0 if left_stick is None else left_stick.get_revision()
+        if revisions[1] != revision:
+            data[7:10] = _ZEROS[:3] if left_stick is None else bytes(left_stick)
+            revisions[1] = revision
+
+        revision = 0 if right_stick is None else right_stick.get_revision()
+        if revisions[2] != revision:
+            data[10:13] = _ZEROS[:3] if right_stick is None else bytes(right_stick)
+            revisions[2] = revision
+
     def set_left_analog_stick(self, left_stick_bytes):
         """
         Set left analog stick status bytes.
@@ -77,6 +141,7 @@ class InputReport:
         if len(left_stick_bytes) != 3:
             raise ValueError('Left stick status data must be exactly 3 bytes!')
         self.data[7:10] = left_stick_bytes
+        self._revisions[1] = None
 
     def set_right_analog_stick(self, right_stick_bytes):
         """
@@ -86,6 +151,7 @@ class InputReport:
         if len(right_stick_bytes) != 3:
             raise ValueError('Right stick status data must be exactly 3 bytes!')
         self.data[10:13] = right_stick_bytes
+        self._revisions[2] = None
 
     def set_vibrator_input(self):
         """
@@ -103,22 +169,28 @@ class InputReport:
     def get_ack(self):
         return self.data[14]
 
-    def set_6axis_data(self):
+    def set_6axis_data(self, data=None):
         """
-        Set accelerator and gyro of 0x30 input reports
-        TODO
+        Set accelerator and gyro of 0x30 input reports.
+        If data is given, 0x30 reports are send with the IMU data (50 instead of 14 bytes).
+        :param data: 36 bytes of three samples, see joycontrol.imu, or None to clear the IMU data
         """
-        # HACK: Set all 0 for now
-        for i in range(14, 50):
-            self.data[i] = 0x00
+        if data is None:
+            if self._has_imu_data:
+                self.data[14:50] = _ZEROS[14:50]
+                self._has_imu_data = False
+            return
+        if len(data) != IMU_DATA_SIZE:
+            raise ValueError(f'IMU data must be exactly {IMU_DATA_SIZE} bytes!')
+        self.data[14:50] = data
+        self._has_imu_data = True
 
     def set_ir_nfc_data(self, data):
         if 50 + len(data) > len(self.data):
             raise ValueError('Too much data.')
 
         # write to data
-        for i in range(len(data)):
-            self.data[50 + i] = data[i]
+        self.data[50:50 + len(data)] = data
 
     def reply_to_subcommand_id(self, _id):
         if isinstance(_id, SubCommand):
@@ -166,12 +238,8 @@ class InputReport:
 
         self.reply_to_subcommand_id(0x10)
 
-        # write offset to data
-        for i in range(16, 16 + 4):
-            self.data[i] = offset % 0x100
-            offset = offset // 0x100
-
-        self.data[20] = size
+        # write offset and size to data
+        SPI_FLASH_READ_REQUEST.pack_into(self.data, 16, offset, size)
         self.data[21:21+len(data)] = data
 
     def sub_0x04_trigger_buttons_elapsed_time(self, L_ms=0, R_ms=0, ZL_ms=0, ZR_ms=0, SL_ms=0, SR_ms=0, HOME_ms=0):
@@ -181,31 +249,27 @@ class InputReport:
         if any(ms > 10*0xffff for ms in (L_ms, R_ms, ZL_ms, ZR_ms, SL_ms, SR_ms, HOME_ms)):
             raise ValueError(f'Values can not exceed {10*0xffff} ms.')
 
-        def set(offset, ms):
-            # reply data offset
-            sub_command_offset = 16
-            value = int(ms // 10)
-            self.data[sub_command_offset + offset] = 0xff & value
-            self.data[sub_command_offset + offset + 1] = (0xff00 & value) >> 8
-
-        set(0, L_ms)
-        set(2, R_ms)
-        set(4, ZL_ms)
-        set(6, ZR_ms)
-        set(8, SL_ms)
-        set(10, SR_ms)
-        set(12, HOME_ms)
+        # values are stored in units of 10ms starting at the reply data offset
+        _ELAPSED_TIME.pack_into(self.data, 16, *(int(ms // 10) for ms in (L_ms, R_ms, ZL_ms, ZR_ms,
+                                                                           SL_ms, SR_ms, HOME_ms)))
+
+    def get_length(self):
+        """
+        :returns number of bytes to send for the current input report id
+        """
+        if self._has_imu_data and self.data[1] == 0x30:
+            return _IMU_INPUT_REPORT_LENGTH
+        return _INPUT_REPORT_LENGTHS.get(self.data[1], _DEFAULT_INPUT_REPORT_LENGTH)
+
+    def get_view(self):
+        """
+        :returns memoryview of the bytes to send, without copying.
+                 The view reflects later changes to the report.
+        """
+        return self._view[:self.get_length()]
 
     def __bytes__(self):
-        _id = self.get_input_report_id()
-        if _id == 0x21:
-            return bytes(self.data[:51])
-        elif _id == 0x30:
-            return bytes(self.data[:14])
-        elif _id == 0x31:
-            return bytes(self.data[:363])
-        else:
-            return bytes(self.data[:51])
+        return bytes(self.get_view())
 
     def __str__(self):
         _id = f'Input {self.get_input_report_id():x}'
@@ -230,26 +294,85 @@ class SubCommand(Enum):
     ENABLE_VIBRATION = 0x48
 
 
+def create_sub_command_reply(ack, sub_command):
+    """
+    Creates a 0x21 input report replying to a sub command.
+    :param ack: ACK byte of the reply
+    :param sub_command: SubCommand or raw id of the sub command to reply to
+    """
+    input_report = InputReport()
+    input_report.set_input_report_id(0x21)
+    input_report.set_misc()
+
+    input_report.set_ack(ack)
+    input_report.reply_to_subcommand_id(sub_command)
+    return input_report
+
+
 class OutputReportID(Enum):
     SUB_COMMAND = 0x01
     RUMBLE_ONLY = 0x10
     REQUEST_IR_NFC_MCU = 0x11
 
 
+# Lookup tables to classify raw ids without raising exceptions
+_OUTPUT_REPORT_IDS = {_id.value: _id for _id in OutputReportID}
+_SUB_COMMANDS = {_id.value: _id for _id in SubCommand}
+
+# 0xA2 prefix, output report id, timer
+_OUTPUT_REPORT_HEADER = struct.Struct('<BBB')
+_RUMBLE_DATA = struct.Struct('8s')
+_SUB_COMMAND_OFFSET = 11
+
+
+def classify_output_report(data):
+    """
+    Classifies received output report data without copying or raising exceptions.
+    :param data: received bytes including the 0xA2 prefix
+    :returns OutputReportID or None if the data is malformed or the id is unknown
+    """
+    if len(data) < 3 or data[0] != 0xA2:
+        return None
+    return _OUTPUT_REPORT_IDS.get(data[1])
+
+
+def get_sub_command_id(data):
+    """
+    :param data: received bytes of a sub command output report including the 0xA2 prefix
+    :returns raw sub command id or None if the data is too short
+    """
+    if len(data) <= _SUB_COMMAND_OFFSET:
+        return None
+    return data[_SUB_COMMAND_OFFSET]
+
+
+def lookup_sub_command(sub_command_id):
+    """
+    :returns SubCommand matching the raw id or None if the id is unknown
+    """
+    return _SUB_COMMANDS.get(sub_command_id)
+
+
 class OutputReport:
     def __init__(self, data=None):
+        """
+        :param data: Output report data including the 0xA2 prefix. Bytes like objects are wrapped without copying,
+                     pass a bytearray to be able to modify the report. If None, an empty report is created.
+        """
         if not data:
-            data = 50 * [0x00]
+            data = bytearray(50)
             data[0] = 0xA2
         elif data[0] != 0xA2:
             raise ValueError('Output reports must start with a 0xA2 byte!')
+        elif not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytearray(data)
         self.data = data
 
     def get_output_report_id(self):
-        try:
-            return OutputReportID(self.data[1])
-        except ValueError:
+        _id = _OUTPUT_REPORT_IDS.get(self.data[1])
+        if _id is None:
             raise NotImplementedError(f'Output report id {hex(self.data[1])} not implemented')
+        return _id
 
     def set_output_report_id(self, _id):
         if isinstance(_id, OutputReportID):
@@ -258,7 +381,7 @@ class OutputReport:
             self.data[1] = _id
 
     def get_timer(self):
-        return OutputReportID(self.data[2])
+        return _OUTPUT_REPORT_HEADER.unpack_from(self.data)[2] & 0x0F
 
     def set_timer(self, timer):
         """
@@ -267,15 +390,22 @@ class OutputReport:
         self.data[2] = timer % 0x10
 
     def get_rumble_data(self):
-        return self.data[3:11]
+        return _RUMBLE_DATA.unpack_from(self.data, 3)[0]
+
+    def get_sub_command_id(self):
+        """
+        :returns raw sub command id or None if the report is too short
+        """
+        return get_sub_command_id(self.data)
 
     def get_sub_command(self):
-        if len(self.data) < 12:
+        _id = get_sub_command_id(self.data)
+        if _id is None:
             return None
-        try:
-            return SubCommand(self.data[11])
-        except ValueError:
-            raise NotImplementedError(f'Sub command id {hex(self.data[11])} not implemented')
+        sub_command = _SUB_COMMANDS.get(_id)
+        if sub_command is None:
+            raise NotImplementedError(f'Sub command id {hex(_id)} not implemented')
+        return sub_command
 
     def set_sub_command(self, _id):
         if isinstance(_id, SubCommand):
@@ -286,9 +416,12 @@ class OutputReport:
             raise ValueError('id must be int or SubCommand')
 
     def get_sub_command_data(self):
+        """
+        :returns memoryview of the sub command data, without copying
+        """
         if len(self.data) < 13:
             return None
-        return self.data[12:]
+        return memoryview(self.data)[12:]
 
     def set_sub_command_data(self, data):
         for i, _byte in enumerate(data):
@@ -308,12 +441,8 @@ class OutputReport:
         self.set_output_report_id(OutputReportID.SUB_COMMAND)
         self.set_sub_command(SubCommand.SPI_FLASH_READ)
 
-        # write offset to data
-        for i in range(12, 12+4):
-            self.data[i] = offset % 0x100
-            offset = offset // 0x100
-
-        self.data[16] = size
+        # write offset and size to data
+        SPI_FLASH_READ_REQUEST.pack_into(self.data, 12, offset, size)
 
     def __bytes__(self):
         return bytes(self.data)
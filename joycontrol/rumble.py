@@ -0,0 +1,210 @@
+import asyncio
+import collections
+import struct
+
+"""
+Decoding of HD rumble data send by the Switch.
+https://github.com/dekuNukem/Nintendo_Switch_Reverse_Engineering/blob/master/rumble_data_table.md
+
+Output reports 0x01 and 0x10 contain 8 bytes of rumble data after the timer byte, 4 bytes for the left and 4 bytes
+for the right motor:
+    byte 0, bit 0 of byte 1:    high band frequency, (encoded frequency - 0x60) * 4
+    bits 1-7 of byte 1:         high band amplitude code
+    bits 0-6 of byte 2:         low band frequency, encoded frequency - 0x40
+    bit 7 of byte 2, byte 3:    low band amplitude code, (code >> 1) + 0x40 in byte 3 and the lowest bit in byte 2
+Encoded frequencies are round(log2(frequency / 10) * 32).
+"""
+
+# Offset of the rumble data in output reports (0xA2 prefix, report id, timer)
+RUMBLE_DATA_OFFSET = 3
+RUMBLE_DATA_SIZE = 8
+
+_RUMBLE_DATA = struct.Struct('<Q')
+
+# Rumble data of motors at rest, send by the Switch if nothing vibrates
+NEUTRAL_RUMBLE_DATA = bytes((0x00, 0x01, 0x40, 0x40) * 2)
+
+
+def _decode_frequency(encoded):
+    return 10 * 2 ** (encoded / 32)
+
+
+def _decode_amplitude(code):
+    """
+    Inverse of the piecewise amplitude encoding of the rumble data table, codes are in [0, 100] for amplitudes up to 1.
+    """
+    if code == 0:
+        return 0.0
+    elif code < 16:
+        return 0.0083605 * 2 ** (code / 4)
+    elif code < 32:
+        return 2 ** (code / 16) / 17
+    return 2 ** (code / 32) / 8.7
+
+
+# Decoding tables, indexed by the raw bits of the rumble data
+_HIGH_FREQUENCIES = tuple(_decode_frequency(hf // 4 + 0x60) for hf in range(0x200))
+_LOW_FREQUENCIES = tuple(_decode_frequency(lf + 0x40) for lf in range(0x80))
+_HIGH_AMPLITUDES = tuple(_decode_amplitude(code) for code in range(0x80))
+# indexed by (byte 3 << 1) | (byte 2 >> 7), byte 3 values below 0x40 are invalid and decoded as 0
+_LOW_AMPLITUDES = tuple(_decode_amplitude(max(0, index - 0x80)) for index in range(0x200))
+
+Vibration = collections.namedtuple('Vibration', ['high_frequency', 'high_amplitude', 'low_frequency',
+                                                 'low_amplitude'])
+Rumble = collections.namedtuple('Rumble', ['left', 'right'])
+
+
+def decode_vibration(data, offset=0):
+    """
+    Decodes the 4 bytes rumble data of a single motor using lookup tables.
+    :param data: bytes like object
+    :param offset: position of the 4 bytes in data
+    :returns Vibration with frequencies in Hz and amplitudes in [0, ~1]
+    """
+    byte_0, byte_1, byte_2, byte_3 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+    return Vibration(_HIGH_FREQUENCIES[((byte_1 & 0x01) << 8) | byte_0],
+                     _HIGH_AMPLITUDES[byte_1 >> 1],
+                     _LOW_FREQUENCIES[byte_2 & 0x7F],
+                     _LOW_AMPLITUDES[(byte_3 << 1) | (byte_2 >> 7)])
+
+
+def decode_rumble(data, offset=0):
+    """
+    :param data: 8 bytes rumble data, e.g. OutputReport.get_rumble_data()
+    :returns Rumble of the left and right motor
+    """
+    return Rumble(decode_vibration(data, offset), decode_vibration(data, offset + 4))
+
+
+def is_vibrating(vibration: Vibration):
+    return vibration.high_amplitude > 0 or vibration.low_amplitude > 0
+
+
+class RumbleSubscription:
+    """
+    Receives decoded rumble changes. Only the latest change is kept, a slow subscriber never delays the
+    report loop, it just skips intermediate values (counted in coalesced).
+
+    Example:
+        subscription = controller_state.subscribe_rumble()
+        async for rumble in subscription:
+            if is_vibrating(rumble.left):
+                ...
+    """
+    def __init__(self, decoder):
+        self._decoder = decoder
+        self._rumble = None
+        self._waiter = None
+        self._is_closed = False
+
+        # number of changes which were replaced by a newer one before they were received
+        self.coalesced = 0
+
+    def _publish(self, rumble):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            self._waiter = None
+            waiter.set_result(rumble)
+            return
+        if self._rumble is not None:
+            self.coalesced += 1
+        self._rumble = rumble
+
+    def get_nowait(self):
+        """
+        :returns the latest unreceived change or None
+        """
+        rumble, self._rumble = self._rumble, None
+        return rumble
+
+    async def get(self):
+        """
+        Waits for the next change.
+        :returns Rumble
+        """
+        if self._rumble is not None:
+            return self.get_nowait()
+        if self._is_closed:
+            raise ValueError('Subscription is closed')
+
+        self._waiter = asyncio.get_event_loop().create_future()
+        return await self._waiter
+
+    def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        self._decoder._unsubscribe(self)
+        if self._waiter is not None:
+            self._waiter.cancel()
+            self._waiter = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except (ValueError, asyncio.CancelledError):
+            if self._is_closed:
+                raise StopAsyncIteration
+            raise
+
+
+class RumbleDecoder:
+    """
+    Decodes the rumble data of output reports and publishes changes to subscribers.
+    Repeated rumble data (the Switch sends rumble at the report rate) is detected by comparing the raw 8 bytes,
+    only changes are decoded.
+    """
+    def __init__(self):
+        self._raw = _RUMBLE_DATA.unpack(NEUTRAL_RUMBLE_DATA)[0]
+        self._rumble = decode_rumble(NEUTRAL_RUMBLE_DATA)
+        self._subscriptions = []
+
+        # statistics
+        self.reports = 0
+        self.changes = 0
+
+    def feed(self, data):
+        """
+        :param data: output report 0x01 or 0x10 including the 0xA2 prefix
+        """
+        if len(data) < RUMBLE_DATA_OFFSET + RUMBLE_DATA_SIZE:
+            return
+        self.reports += 1
+
+        raw = _RUMBLE_DATA.unpack_from(data, RUMBLE_DATA_OFFSET)[0]
+        if raw == self._raw:
+            return
+        self._raw = raw
+        self.changes += 1
+
+        self._rumble = decode_rumble(data, RUMBLE_DATA_OFFSET)
+        for subscription in self._subscriptions:
+            subscription._publish(self._rumble)
+
+    def get_rumble(self):
+        """
+        :returns the current Rumble
+        """
+        return self._rumble
+
+    def subscribe(self):
+        """
+        :returns RumbleSubscription receiving all following changes
+        """
+        subscription = RumbleSubscription(self)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        # replaced instead of modified, feed may iterate over the list
+        self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+
+    def close(self):
+        """
+        Closes all subscriptions.
+        """
+        for subscription in list(self._subscriptions):
+            subscription.close()
@@ -0,0 +1,411 @@
+import asyncio
+import enum
+import time
+
+# Common input report rates
+RATE_60HZ = 60
+RATE_66HZ = 1 / 0.015
+RATE_120HZ = 120
+
+
+class LatePolicy(enum.Enum):
+    # Send missed ticks back to back until the schedule is met again
+    CATCH_UP = 0
+    # Drop missed ticks and continue with the next deadline in the future
+    SKIP = 1
+
+
+class TickStatistics:
+    """
+    Lateness statistics of a tick scheduler. All times are in seconds.
+    """
+    def __init__(self):
+        self.ticks = 0
+        self.late_ticks = 0
+        self.skipped_ticks = 0
+        self.total_lateness = 0
+        self.max_lateness = 0
+        self.last_lateness = 0
+
+    def add(self, lateness):
+        self.ticks += 1
+        self.last_lateness = lateness
+        if lateness > 0:
+            self.late_ticks += 1
+            self.total_lateness += lateness
+            if lateness > self.max_lateness:
+                self.max_lateness = lateness
+
+    def get_mean_lateness(self):
+        """
+        :returns mean lateness over all ticks
+        """
+        if not self.ticks:
+            return 0
+        return self.total_lateness / self.ticks
+
+    def reset(self):
+        self.__init__()
+
+    def __str__(self):
+        return f'ticks:{self.ticks} late:{self.late_ticks} skipped:{self.skipped_ticks} ' \
+               f'mean_lateness:{self.get_mean_lateness() * 1000:.3f}ms max_lateness:{self.max_lateness * 1000:.3f}ms'
+
+
+class TickScheduler:
+    """
+    Paces a loop at a fixed rate using absolute deadlines on the monotonic clock.
+
+    Deadlines are computed as start + n * period, so the time spent between two ticks
+    does not shift the schedule and jitter does not accumulate.
+    """
+    def __init__(self, rate=RATE_66HZ, late_policy=LatePolicy.CATCH_UP, clock=time.monotonic):
+        """
+        :param rate: target tick rate in Hz
+        :param late_policy: LatePolicy applied if a deadline was missed by more than one period
+        :param clock: monotonic clock function returning seconds
+        """
+        if rate <= 0:
+            raise ValueError(f'Tick rate must be positive, got {rate}')
+
+        self._period = 1 / rate
+        self._late_policy = late_policy
+        self._clock = clock
+
+        self._start = None
+        self._tick = 0
+
+        self.statistics = TickStatistics()
+
+    def get_rate(self):
+        return 1 / self._period
+
+    def get_period(self):
+        return self._period
+
+    def get_tick(self):
+        """
+        :returns number of the next tick
+        """
+        return self._tick
+
+    def get_deadline(self):
+        """
+        :returns clock time of the next tick
+        """
+        if self._start is None:
+            return None
+        return self._start + self._tick * self._period
+
+    def reset(self, delay=0):
+        """
+        Re-anchors the schedule. The next tick is due after the given delay.
+        :param delay: seconds until the next tick
+        """
+        self._start = self._clock() + delay
+        self._tick = 0
+
+    def _advance(self):
+        """
+        Advances the schedule by one tick, applying the late policy.
+        :returns deadline of the tick
+        """
+        if self._start is None:
+            self.reset()
+
+        deadline = self._start + self._tick * self._period
+        lateness = self._clock() - deadline
+
+        if lateness >= self._period and self._late_policy == LatePolicy.SKIP:
+            # skip all ticks that are already over
+            skipped = int(lateness // self._period)
+            self.statistics.skipped_ticks += skipped
+            self._tick += skipped
+            deadline += skipped * self._period
+
+        self._tick += 1
+        return deadline
+
+    async def wait_next(self):
+        """
+        Waits until the next tick is due and records its lateness.
+        :returns number of the tick
+        """
+        deadline = self._advance()
+
+        # always yield to the event loop, even if we are late
+        await asyncio.sleep(max(deadline - self._clock(), 0))
+
+        self.statistics.add(self._clock() - deadline)
+        return self._tick - 1
+
+
+class TickTiming:
+    """
+    Timing of the ticks of a tick engine. All times are in seconds.
+    """
+    def __init__(self):
+        self.ticks = 0
+        self.reports = 0
+        # time to serialize the reports of all controllers
+        self.last_prepare_time = 0
+        self.total_prepare_time = 0
+        self.max_prepare_time = 0
+        # time to issue all socket sends
+        self.last_send_time = 0
+        self.total_send_time = 0
+        self.max_send_time = 0
+
+    def add(self, prepare_time, send_time, reports):
+        self.ticks += 1
+        self.reports += reports
+
+        self.last_prepare_time = prepare_time
+        self.total_prepare_time += prepare_time
+        if prepare_time > self.max_prepare_time:
+            self.max_prepare_time = prepare_time
+
+        self.last_send_time = send_time
+        self.total_send_time += send_time
+        if send_time > self.max_send_time:
+            self.max_send_time = send_time
+
+    def get_mean_tick_time(self):
+        """
+        :returns mean time spent per tick
+        """
+        if not self.ticks:
+            return 0
+        return (self.total_prepare_time + self.total_send_time) / self.ticks
+
+    def reset(self):
+        self.__init__()
+
+    def __str__(self):
+        if not self.ticks:
+            return 'ticks:0'
+        return f'ticks:{self.ticks} reports:{self.reports} ' \
+               f'mean_prepare:{self.total_prepare_time / self.ticks * 1000:.3f}ms ' \
+               f'max_prepare:{self.max_prepare_time * 1000:.3f}ms ' \
+               f'mean_send:{self.total_send_time / self.ticks * 1000:.3f}ms ' \
+               f'max_send:{self.max_send_time * 1000:.3f}ms'
+
+
+class TickEngine:
+    """
+    Drives the full input report mode of any number of controller protocols with a single scheduler.
+
+    On each tick, the engine first lets every attached protocol handle received requests and serialize its
+    controller state into its report buffer. Afterwards all reports are send in one pass.
+    The event loop is woken up once per tick, regardless of the number of controllers.
+    """
+    def __init__(self, rate=RATE_66HZ, late_policy=LatePolicy.CATCH_UP, clock=time.monotonic):
+        """
+        :param rate: target tick rate in Hz
+        :param late_policy: LatePolicy applied if a deadline was missed by more than one period
+        :param clock: monotonic clock function returning seconds
+        """
+        self.scheduler = TickScheduler(rate=rate, late_policy=late_policy, clock=clock)
+        self.timing = TickTiming()
+
+        self._clock = clock
+
+        # attached protocols mapped to a future which is set if the engine stops driving the protocol
+        self._attached = {}
+        self._tick_task = None
+
+    def get_attached_count(self):
+        return len(self._attached)
+
+    async def attach(self, protocol):
+        """
+        Drives the full input report mode of the given protocol until it fails or the engine is stopped.
+        Called by ControllerProtocol.input_report_mode_full.
+
+        Raises NotConnected exception if the connection of the protocol was lost,
+        RuntimeError if the full input report mode of the protocol or the engine was cancelled.
+        """
+        stopped = asyncio.get_event_loop().create_future()
+        self._attached[protocol] = stopped
+
+        if self._tick_task is None:
+            # start ticking once the first protocol is attached
+            self.scheduler.reset()
+            self._tick_task = asyncio.ensure_future(self._tick_loop())
+
+        try:
+            await stopped
+        finally:
+            self._attached.pop(protocol, None)
+
+    def stop(self):
+        """
+        Stops driving all attached protocols.
+        """
+        for stopped in self._attached.values():
+            if not stopped.done():
+                stopped.set_result(None)
+
+    def _is_cancelling(self):
+        """
+        :returns True if the tick task itself is being cancelled, False if only a future awaited by a protocol was
+                 cancelled. Python < 3.11 can't tell both apart, every cancellation stops the engine there.
+        """
+        cancelling = getattr(self._tick_task, 'cancelling', None)
+        return cancelling is None or cancelling() > 0
+
+    def _fail(self, stopped, err):
+        """
+        Stops driving a protocol, the error is raised in its input_report_mode_full.
+        """
+        if isinstance(err, asyncio.CancelledError):
+            if self._is_cancelling():
+                raise err
+            # e.g. a cancelled read future of the protocol, only this protocol is affected
+            error = RuntimeError('Full input report mode was cancelled')
+            error.__cause__ = err
+            err = error
+        stopped.set_exception(err)
+
+    async def _tick_loop(self):
+        clock = self._clock
+        reports = []
+        error = None
+        try:
+            while self._attached:
+                await self.scheduler.wait_next()
+
+                # 1. phase: handle incoming requests and serialize the controller states
+                start = clock()
+                for protocol, stopped in list(self._attached.items()):
+                    if stopped.done():
+                        continue
+                    try:
+                        report = await protocol._full_mode_prepare()
+                    except (Exception, asyncio.CancelledError) as err:
+                        self._fail(stopped, err)
+                        continue
+                    if report is not None:
+                        reports.append((protocol, stopped, report))
+                prepared = clock()
+
+                # 2. phase: send all reports
+                for protocol, stopped, report in reports:
+                    if stopped.done():
+                        continue
+                    try:
+                        await protocol._send_report(report)
+                    except (Exception, asyncio.CancelledError) as err:
+                        self._fail(stopped, err)
+                sent = clock()
+
+                self.timing.add(prepared - start, sent - prepared, len(reports))
+                reports.clear()
+        except Exception as err:
+            # raised in the input_report_mode_full of all attached protocols instead
+            error = err
+        finally:
+            self._tick_task = None
+            # the engine stopped ticking (error or cancellation), none of the attached protocols progresses anymore
+            for stopped in self._attached.values():
+                if not stopped.done():
+                    stopped.set_exception(error if error is not None else RuntimeError('Tick engine was cancelled'))
+
+
+class HandshakePacer:
+    """
+    Decides how long input reports are held back after a sub command reply in the full input report mode.
+
+    During pairing the Switch sends a sequence of sub commands and expects the replies without 0x30 reports in
+    between. The pacer measures the time between a reply and the next request of the Switch and holds reports for
+    a multiple of this latency. If the Switch repeats a request (the reply got lost between the 0x30 reports),
+    the hold time is increased, no matter whether the repetition arrives while holding or after the 0x30 reports
+    resumed.
+    """
+    def __init__(self, initial_hold=0.05, min_hold=0.015, max_hold=0.3, latency_factor=2.0, repeat_window=1.0,
+                 clock=time.monotonic):
+        """
+        :param initial_hold: seconds to hold before the first latency was measured
+        :param min_hold: lower limit of the hold time in seconds
+        :param max_hold: upper limit of the hold time in seconds
+        :param latency_factor: hold time as multiple of the mean request latency
+        :param repeat_window: seconds after a reply in which the same request counts as repetition
+        :param clock: monotonic clock function returning seconds
+        """
+        self.min_hold = min_hold
+        self.max_hold = max_hold
+        self.latency_factor = latency_factor
+        self.repeat_window = repeat_window
+        self._clock = clock
+
+        self._initial_hold = initial_hold
+        self._hold = initial_hold
+        self._backoff = 1.0
+        self._hold_until = None
+        self._last_reply = None
+        self._last_request = None
+
+        # statistics
+        self.mean_latency = None
+        self.requests = 0
+        self.repeated_requests = 0
+
+    def get_hold(self):
+        """
+        :returns current hold time in seconds
+        """
+        return self._hold
+
+    def on_request(self, data):
+        """
+        Called when a sub command request is received.
+        :param data: output report data including the 0xA2 prefix
+        """
+        now = self._clock()
+        self.requests += 1
+        # ignore timer and rumble data
+        request = bytes(data[11:])
+
+        is_repeated = request == self._last_request and self._last_reply is not None \
+            and now - self._last_reply < self.repeat_window
+        if is_repeated:
+            # the Switch did not receive the reply in time, increase the hold time
+            self.repeated_requests += 1
+            self._backoff = min(self._backoff * 2, self.max_hold / max(self.min_hold, 1e-3))
+        else:
+            self._backoff = max(1.0, self._backoff * 0.75)
+            if self._last_reply is not None and self._hold_until is not None:
+                # only latencies of requests arriving while holding belong to the handshake
+                latency = now - self._last_reply
+                if self.mean_latency is None:
+                    self.mean_latency = latency
+                else:
+                    self.mean_latency += 0.25 * (latency - self.mean_latency)
+
+        if self.mean_latency is not None:
+            base = self.latency_factor * self.mean_latency
+        else:
+            base = self._initial_hold
+        self._hold = min(self.max_hold, max(self.min_hold, base * self._backoff))
+
+        self._last_request = request
+        # the Switch is ready, the reply is send right away
+        self._hold_until = None
+
+    def on_reply(self):
+        """
+        Called after a sub command reply was send, starts holding back input reports.
+        """
+        self._last_reply = self._clock()
+        self._hold_until = self._last_reply + self._hold
+
+    def is_holding(self):
+        """
+        :returns True if input reports should be held back
+        """
+        if self._hold_until is None:
+            return False
+        if self._clock() < self._hold_until:
+            return True
+        self._hold_until = None
+        return False
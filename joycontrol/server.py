@@ -13,16 +13,86 @@ from joycontrol.transport import L2CAP_Transport
 PROFILE_PATH = pkg_resources.resource_filename('joycontrol', 'profile/sdp_record_hid.xml')
 logger = logging.getLogger(__name__)
 
+# The SDP record is registered once per process and shared by all emulated controllers
+_sdp_record_registered = False
 
-async def _send_empty_input_reports(transport):
+
+def _register_sdp_record():
+    global _sdp_record_registered
+    if _sdp_record_registered:
+        return
+
+    logger.info('Advertising the Bluetooth SDP record...')
+    try:
+        HidDevice.register_sdp_record(PROFILE_PATH)
+    except dbus.exceptions.DBusException as dbus_err:
+        # Already registered (e.g. by another process)
+        logger.debug(dbus_err)
+    _sdp_record_registered = True
+
+
+async def _send_empty_input_reports(transport, first_interval=0.05, max_interval=1.0, max_duration=10):
+    """
+    Sends empty input reports until the Switch replies (the task is cancelled by then).
+    Intervals start short and are doubled up to max_interval to avoid flooding the Switch.
+    """
     report = InputReport()
-    for i in range(10):
+    interval = first_interval
+    elapsed = 0
+    while elapsed < max_duration:
         await transport.write(report)
-        await asyncio.sleep(1)
+        await asyncio.sleep(interval)
+        elapsed += interval
+        interval = min(max_interval, interval * 2)
+
+
+async def _connect_l2cap(address, psm, timeout, adapter_address=None):
+    sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP)
+    sock.setblocking(False)
+    try:
+        if adapter_address is not None:
+            # connect through the given adapter instead of the default one
+            sock.bind((adapter_address, 0))
+        await asyncio.wait_for(asyncio.get_event_loop().sock_connect(sock, (address, psm)), timeout)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+async def reconnect(address, ctl_psm=17, itr_psm=19, timeout=5.0, retries=3, retry_delay=0.5, device_id=None):
+    """
+    Connects the hid control and interrupt channels to a previously paired console without blocking the event loop.
+    The interrupt channel is connected after the control channel, as required by the HID specification.
+    :param address: Bluetooth address of the console
+    :param timeout: seconds to wait for each channel to connect
+    :param retries: number of connection attempts
+    :param retry_delay: seconds to wait before the second attempt, doubled for each further attempt
+    :param device_id: ID of the bluetooth adapter to connect through, see create_hid_server.
+                      If None, the default adapter is used.
+    :returns (control socket, interrupt socket)
+    """
+    adapter_address = None if device_id is None else HidDevice(device_id=device_id).address
+    for attempt in range(1, retries + 1):
+        try:
+            client_ctl = await _connect_l2cap(address, ctl_psm, timeout, adapter_address=adapter_address)
+            try:
+                client_itr = await _connect_l2cap(address, itr_psm, timeout, adapter_address=adapter_address)
+            except BaseException:
+                client_ctl.close()
+                raise
+            return client_ctl, client_itr
+        except (OSError, asyncio.TimeoutError) as err:
+            if attempt == retries:
+                raise
+            logger.warning(f'Reconnecting to {address} failed ({err or "timeout"}), '
+                           f'retrying in {retry_delay} seconds...')
+            await asyncio.sleep(retry_delay)
+            retry_delay *= 2
 
 
 async def create_hid_server(protocol_factory, ctl_psm=17, itr_psm=19, device_id=None, reconnect_bt_addr=None,
-                            capture_file=None):
+                            capture_file=None, reconnect_timeout=5.0, reconnect_retries=3):
     """
     :param protocol_factory: Factory function returning a ControllerProtocol instance
     :param ctl_psm: hid control channel port
@@ -36,7 +106,9 @@ async def create_hid_server(protocol_factory, ctl_psm=17, itr_psm=19, device_id=
                       If None, a new hid server will be started for the initial paring.
                       Otherwise, the function assumes an initial pairing with the console was already done
                       and reconnects to the provided Bluetooth address.
-    :param capture_file: opened file to log incoming and outgoing messages
+    :param capture_file: opened file or joycontrol.capture.CaptureWriter to log incoming and outgoing messages
+    :param reconnect_timeout: seconds to wait for each channel when reconnecting
+    :param reconnect_retries: number of reconnection attempts
     :returns transport for input reports and protocol which handles incoming output reports
     """
     protocol = protocol_factory()
@@ -80,12 +152,7 @@ async def create_hid_server(protocol_factory, ctl_psm=17, itr_psm=19, device_id=
         # setting bluetooth adapter name to the device we wish to emulate
         await hid.set_name(protocol.controller.device_name())
 
-        logger.info('Advertising the Bluetooth SDP record...')
-        try:
-            HidDevice.register_sdp_record(PROFILE_PATH)
-        except dbus.exceptions.DBusException as dbus_err:
-            # Already registered (If multiple controllers are being emulated and this method is called consecutive times)
-            logger.debug(dbus_err)
+        _register_sdp_record()
 
         # set the device class to "Gamepad/joystick"
         await hid.set_class()
@@ -108,26 +175,24 @@ async def create_hid_server(protocol_factory, ctl_psm=17, itr_psm=19, device_id=
 
     else:
         # Reconnection to reconnect_bt_addr
-        client_ctl = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP)
-        client_itr = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP)
-        client_ctl.connect((reconnect_bt_addr, ctl_psm))
-        client_itr.connect((reconnect_bt_addr, itr_psm))
-        client_ctl.setblocking(False)
-        client_itr.setblocking(False)
+        client_ctl, client_itr = await reconnect(reconnect_bt_addr, ctl_psm=ctl_psm, itr_psm=itr_psm,
+                                                 timeout=reconnect_timeout, retries=reconnect_retries,
+                                                 device_id=device_id)
 
     # create transport for the established connection and activate the HID protocol
-    transport = L2CAP_Transport(asyncio.get_event_loop(), protocol, client_itr, client_ctl, 50, capture_file=capture_file)
+    transport = L2CAP_Transport(asyncio.get_event_loop(), protocol, client_itr, client_ctl, 50, capture_file=capture_file,
+                                metrics=protocol.metrics)
     protocol.connection_made(transport)
 
     # HACK: send some empty input reports until the Switch decides to reply
     future = asyncio.ensure_future(_send_empty_input_reports(transport))
-    await protocol.wait_for_output_report()
-    """
-    future.cancel()
     try:
-        await future
-    except asyncio.CancelledError:
-        pass
-    """
+        await protocol.wait_for_output_report()
+    finally:
+        future.cancel()
+        try:
+            await future
+        except asyncio.CancelledError:
+            pass
 
     return protocol.transport, protocol
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+
+from joycontrol import utils
+from joycontrol.server import create_hid_server
+from joycontrol.transport import NotConnectedError
+
+logger = logging.getLogger(__name__)
+
+"""
+Keeps an emulated controller connected during long unattended runs.
+
+The supervisor waits for the connection to the console to be lost and reconnects the same protocol to the last
+console address. Since the protocol and its controller state are kept, held buttons and stick positions are send
+again with the first report after reconnecting. The input report mode and player lights negotiated before are
+restored (see ControllerProtocol.restore_link_state), so full rate reporting starts without waiting for the console.
+
+Tick hooks are suspended while disconnected instead of being cancelled: a running macro (see joycontrol.macro) or
+stick trajectory continues at the tick it was interrupted at, callers waiting for it just see a delay.
+
+Example:
+    transport, protocol = await create_hid_server(factory, reconnect_bt_addr=console_address)
+    supervisor = SessionSupervisor(protocol, console_address)
+    supervisor.start()
+    ...
+    await supervisor.stop()
+"""
+
+
+class SessionSupervisor:
+    def __init__(self, protocol, console_address=None, ctl_psm=17, itr_psm=19, capture_file=None,
+                 reconnect_delay=1.0, max_reconnect_delay=30.0, max_attempts=None, handshake_timeout=15.0,
+                 device_id=None):
+        """
+        :param protocol: connected ControllerProtocol
+        :param console_address: Bluetooth address of the console. If None, the address of the current connection
+                                is used.
+        :param ctl_psm: hid control channel port
+        :param itr_psm: hid interrupt channel port
+        :param capture_file: joycontrol.capture.CaptureWriter shared by all connections, see create_hid_server
+        :param reconnect_delay: seconds to wait before the second reconnection attempt, doubled for each further
+                                attempt up to max_reconnect_delay
+        :param max_attempts: number of reconnection attempts per disconnect, None to try until stopped
+        :param handshake_timeout: seconds to wait for the console to answer after connecting the channels
+        :param device_id: ID of the bluetooth adapter the console was paired with, see create_hid_server.
+                          If None, the default adapter is used.
+        """
+        if console_address is None:
+            if protocol.transport is None:
+                raise ValueError('Protocol is not connected, a console address is required')
+            console_address = protocol.transport.get_extra_info('peername')[0]
+
+        self.protocol = protocol
+        self.console_address = console_address
+        self.ctl_psm = ctl_psm
+        self.itr_psm = itr_psm
+        self.capture_file = capture_file
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_attempts = max_attempts
+        self.handshake_timeout = handshake_timeout
+        self.device_id = device_id
+
+        # link state negotiated with the console, restored after reconnecting
+        self._input_report_mode = protocol.get_input_report_mode()
+        self._player_lights = protocol.get_player_lights()
+
+        self._task = None
+        self._is_connected = asyncio.Event()
+        if protocol.transport is not None:
+            self._is_connected.set()
+
+        # statistics
+        self.disconnects = 0
+        self.reconnects = 0
+        self.failed_attempts = 0
+
+    def start(self):
+        """
+        Starts supervising the protocol in the background.
+        :returns the supervising task
+        """
+        if self._task is not None:
+            raise ValueError('Supervisor is already running.')
+        self.protocol.is_supervised = True
+        self._task = asyncio.ensure_future(self.run())
+        self._task.add_done_callback(utils.create_error_check_callback(ignore=asyncio.CancelledError))
+        return self._task
+
+    async def stop(self):
+        """
+        Stops supervising. If the connection is lost at this point, suspended tick hooks are cancelled.
+        """
+        task, self._task = self._task, None
+        if task is not None and task.cancel():
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._release()
+
+    def _release(self):
+        self.protocol.is_supervised = False
+        if self.protocol.transport is None:
+            # nobody resumes the full input report mode anymore
+            self.protocol.get_controller_state().clear_tick_hooks()
+
+    def is_connected(self):
+        return self._is_connected.is_set()
+
+    async def wait_for_connection(self):
+        """
+        Waits until the protocol is connected, returns immediately if it is.
+        """
+        await self._is_connected.wait()
+
+    async def run(self):
+        """
+        Reconnects the protocol whenever the connection is lost.
+        Raises the last connection error if the console could not be reached within max_attempts.
+        """
+        self.protocol.is_supervised = True
+        try:
+            while True:
+                if self.protocol.transport is not None:
+                    await self._record_link_state()
+                    await self.protocol.wait_for_connection_lost()
+
+                self._is_connected.clear()
+                self.disconnects += 1
+                logger.warning(f'Connection to {self.console_address} lost, reconnecting...')
+                await self._reconnect()
+                self._is_connected.set()
+                self.reconnects += 1
+                self.protocol.metrics.reconnects += 1
+        except BaseException:
+            self._release()
+            raise
+
+    async def _record_link_state(self):
+        # the console sets the input report mode before the player lights
+        set_player_lights = asyncio.ensure_future(self.protocol.sig_set_player_lights.wait())
+        connection_lost = asyncio.ensure_future(self.protocol.wait_for_connection_lost())
+        try:
+            await asyncio.wait((set_player_lights, connection_lost), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            set_player_lights.cancel()
+            connection_lost.cancel()
+
+        if self.protocol.get_input_report_mode() is not None:
+            self._input_report_mode = self.protocol.get_input_report_mode()
+        if self.protocol.get_player_lights() is not None:
+            self._player_lights = self.protocol.get_player_lights()
+
+    async def _reconnect(self):
+        delay = self.reconnect_delay
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await self._connect()
+                logger.info(f'Reconnected to {self.console_address} after {attempt} attempt(s)')
+                return
+            except (OSError, asyncio.TimeoutError) as err:
+                self.failed_attempts += 1
+                if self.max_attempts is not None and attempt >= self.max_attempts:
+                    raise
+                logger.warning(f'Reconnecting to {self.console_address} failed ({err or "timeout"}), '
+                               f'retrying in {delay} seconds...')
+            await asyncio.sleep(delay)
+            delay = min(self.max_reconnect_delay, delay * 2)
+
+    async def _connect(self):
+        protocol = self.protocol
+        try:
+            # the protocol is reused, it keeps the controller state and the suspended tick hooks
+            await asyncio.wait_for(create_hid_server(lambda: protocol, ctl_psm=self.ctl_psm, itr_psm=self.itr_psm,
+                                                     device_id=self.device_id, reconnect_bt_addr=self.console_address,
+                                                     capture_file=self.capture_file, reconnect_retries=1),
+                                   self.handshake_timeout)
+        except BaseException:
+            # the channels may be connected while the console did not answer
+            if protocol.transport is not None:
+                protocol.connection_lost()
+            raise
+
+        if protocol.transport is None:
+            raise NotConnectedError('Connection lost during the handshake.')
+
+        protocol.restore_link_state(input_report_mode=self._input_report_mode, player_lights=self._player_lights)
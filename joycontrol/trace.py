@@ -0,0 +1,224 @@
+import array
+import asyncio
+import functools
+import json
+import time
+
+from joycontrol.protocol import ControllerProtocol
+from joycontrol.report import InputReport
+from joycontrol.scheduler import TickScheduler
+from joycontrol.transport import L2CAP_Transport
+
+"""
+Opt-in tracing of the report hot paths.
+
+While a Tracer is installed, the traced methods are replaced by wrappers recording the start and end time of every
+call into a preallocated ring buffer. Uninstalling restores the original methods, so tracing costs nothing when it
+is not in use. The buffer can be exported to the Chrome trace event format and viewed in chrome://tracing or
+https://ui.perfetto.dev, one track per asyncio task.
+
+In sampling mode only every n-th tick of the full input report mode is recorded (a tick starts when
+TickScheduler.wait_next returns), the calls of a sampled tick are recorded completely.
+
+Example:
+    with Tracer(sample_interval=10) as tracer:
+        await asyncio.sleep(60)
+    with open('trace.json', 'w') as trace_file:
+        tracer.save(trace_file)
+"""
+
+
+def _input_report_setters():
+    return tuple(name for name in vars(InputReport) if name.startswith('set_')) + ('update_controller_status',)
+
+
+# (class, method names) traced by default
+DEFAULT_TARGETS = (
+    (ControllerProtocol, ('_full_mode_prepare', '_send_report', 'write', '_reply_to_sub_command')),
+    (InputReport, _input_report_setters()),
+    (L2CAP_Transport, ('write', 'read')),
+)
+
+
+_installed = None
+
+
+def _current_task_id():
+    try:
+        return id(asyncio.current_task())
+    except RuntimeError:
+        # no running event loop
+        return 0
+
+
+class Tracer:
+    def __init__(self, capacity=1 << 16, sample_interval=1, targets=DEFAULT_TARGETS, clock=time.perf_counter):
+        """
+        :param capacity: number of calls kept in the ring buffer, the oldest calls are overwritten
+        :param sample_interval: record every n-th tick of the full input report mode
+        :param targets: sequence of (class, method names) to trace
+        :param clock: clock function returning seconds
+        """
+        if capacity < 1 or sample_interval < 1:
+            raise ValueError('Capacity and sample interval must be positive')
+        self.capacity = capacity
+        self.sample_interval = sample_interval
+        self.targets = targets
+        self._clock = clock
+
+        # ring buffer, allocated once
+        self._names = [None] * capacity
+        self._starts = array.array('d', bytes(8 * capacity))
+        self._ends = array.array('d', bytes(8 * capacity))
+        self._tasks = array.array('Q', bytes(8 * capacity))
+        self._index = 0
+        # number of recorded calls, including overwritten ones
+        self.recorded = 0
+
+        self._ticks = 0
+        self._is_sampling = True
+        self._originals = []
+
+    def record(self, name, start, end, task_id=0):
+        """
+        Adds a call to the ring buffer.
+        :param start: start time, see clock
+        :param end: end time, see clock
+        """
+        i = self._index
+        self._names[i] = name
+        self._starts[i] = start
+        self._ends[i] = end
+        self._tasks[i] = task_id
+        self._index = (i + 1) % self.capacity
+        self.recorded += 1
+
+    def _wrap(self, cls, name, function):
+        span_name = f'{cls.__name__}.{name}'
+        clock = self._clock
+        record = self.record
+
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def traced(*args, **kwargs):
+                if not self._is_sampling:
+                    return await function(*args, **kwargs)
+                start = clock()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    record(span_name, start, clock(), _current_task_id())
+        else:
+            @functools.wraps(function)
+            def traced(*args, **kwargs):
+                if not self._is_sampling:
+                    return function(*args, **kwargs)
+                start = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    record(span_name, start, clock(), _current_task_id())
+        return traced
+
+    def _wrap_tick(self, function):
+        @functools.wraps(function)
+        async def wait_next(*args, **kwargs):
+            result = await function(*args, **kwargs)
+            # the work of the tick starts now
+            self._is_sampling = self._ticks % self.sample_interval == 0
+            self._ticks += 1
+            return result
+        return wait_next
+
+    def install(self):
+        """
+        Replaces the traced methods. Only one tracer can be installed at a time.
+        """
+        global _installed
+        if _installed is not None:
+            raise ValueError('A tracer is already installed.')
+
+        for cls, names in self.targets:
+            for name in names:
+                function = vars(cls).get(name)
+                if function is None:
+                    raise ValueError(f'{cls.__name__} has no method {name}')
+                self._originals.append((cls, name, function))
+                setattr(cls, name, self._wrap(cls, name, function))
+
+        if self.sample_interval > 1:
+            function = vars(TickScheduler)['wait_next']
+            self._originals.append((TickScheduler, 'wait_next', function))
+            TickScheduler.wait_next = self._wrap_tick(function)
+        _installed = self
+
+    def uninstall(self):
+        """
+        Restores the traced methods.
+        """
+        global _installed
+        for cls, name, function in reversed(self._originals):
+            setattr(cls, name, function)
+        self._originals.clear()
+        self._is_sampling = True
+        if _installed is self:
+            _installed = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+
+    def get_calls(self):
+        """
+        :returns list of recorded (name, start, end, task id) tuples, oldest first
+        """
+        count = min(self.recorded, self.capacity)
+        first = (self._index - count) % self.capacity
+        calls = []
+        for j in range(count):
+            i = (first + j) % self.capacity
+            calls.append((self._names[i], self._starts[i], self._ends[i], self._tasks[i]))
+        return calls
+
+    def clear(self):
+        self._index = 0
+        self.recorded = 0
+        self._ticks = 0
+
+    def to_chrome_trace(self):
+        """
+        :returns dict in the Chrome trace event format, times are in microseconds
+        """
+        calls = self.get_calls()
+        # calls are recorded when they end, the first call in the buffer may not be the first to start
+        origin = min(start for _, start, _, _ in calls) if calls else 0
+
+        # small thread ids, one per asyncio task
+        tids = {}
+        events = []
+        for name, start, end, task_id in calls:
+            tid = tids.setdefault(task_id, len(tids) + 1)
+            events.append({
+                'name': name,
+                'cat': name.split('.')[0],
+                'ph': 'X',
+                'ts': (start - origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': 1,
+                'tid': tid
+            })
+        for task_id, tid in tids.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                           'args': {'name': f'task {tid}' if task_id else 'no task'}})
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'recorded': self.recorded, 'sample_interval': self.sample_interval}}
+
+    def save(self, file):
+        """
+        :param file: file opened for text writing
+        """
+        json.dump(self.to_chrome_trace(), file)
@@ -0,0 +1,230 @@
+import asyncio
+import bisect
+import math
+
+"""
+Analog stick trajectories.
+
+Positions are given in raw 12 bit stick units (0 - 0xFFF) as (horizontal, vertical) tuples, times in seconds.
+Trajectories are compiled into one position per input report tick, the report loop then applies one position per
+tick (see ControllerState.play_trajectory).
+
+Example:
+    circle = Circle(center=(0x800, 0x800), radius=0x600, duration=2)
+    await controller_state.play_trajectory(circle, stick='l')
+"""
+
+STICK_MIN = 0
+STICK_MAX = 0xFFF
+
+
+def _clamp(value):
+    return min(STICK_MAX, max(STICK_MIN, int(round(value))))
+
+
+class Trajectory:
+    """
+    Base class of trajectories. Sub classes implement get_position.
+    """
+    def __init__(self, duration):
+        """
+        :param duration: duration of the trajectory in seconds
+        """
+        if duration < 0:
+            raise ValueError('Duration must not be negative')
+        self.duration = duration
+
+    def get_position(self, t):
+        """
+        :param t: seconds since the start of the trajectory in [0, duration]
+        :returns (h, v) position in stick units, may be fractional
+        """
+        raise NotImplementedError()
+
+    def compile(self, period):
+        """
+        Samples the trajectory once per tick.
+        :param period: seconds between ticks, see TickScheduler.get_period
+        :returns tuple of integer (h, v) positions, the last one is the end position of the trajectory
+        """
+        if period <= 0:
+            raise ValueError('Period must be positive')
+        ticks = max(1, math.ceil(self.duration / period))
+        positions = []
+        for tick in range(1, ticks + 1):
+            h, v = self.get_position(min(tick * period, self.duration))
+            positions.append((_clamp(h), _clamp(v)))
+        return tuple(positions)
+
+
+class LinearRamp(Trajectory):
+    """
+    Moves on a straight line from start to end.
+    """
+    def __init__(self, start, end, duration):
+        """
+        :param start: (h, v) start position
+        :param end: (h, v) end position
+        :param duration: seconds
+        """
+        super().__init__(duration)
+        self.start = start
+        self.end = end
+
+    def get_position(self, t):
+        f = 1 if self.duration == 0 else t / self.duration
+        return (self.start[0] + (self.end[0] - self.start[0]) * f,
+                self.start[1] + (self.end[1] - self.start[1]) * f)
+
+
+class Arc(Trajectory):
+    """
+    Moves with constant angular speed on a circular arc around the center.
+    Angles are in radians, 0 points to the right, pi / 2 up.
+    """
+    def __init__(self, center, radius, start_angle, end_angle, duration):
+        """
+        :param center: (h, v) center of the circle, e.g. the calibrated stick center
+        :param radius: radius in stick units
+        :param start_angle: angle of the start position
+        :param end_angle: angle of the end position, smaller than start_angle for clockwise motion
+        :param duration: seconds
+        """
+        super().__init__(duration)
+        self.center = center
+        self.radius = radius
+        self.start_angle = start_angle
+        self.end_angle = end_angle
+
+    def get_position(self, t):
+        f = 1 if self.duration == 0 else t / self.duration
+        angle = self.start_angle + (self.end_angle - self.start_angle) * f
+        return (self.center[0] + self.radius * math.cos(angle),
+                self.center[1] + self.radius * math.sin(angle))
+
+
+class Circle(Arc):
+    """
+    Full counter clockwise circles around the center.
+    """
+    def __init__(self, center, radius, duration, turns=1, start_angle=0):
+        """
+        :param turns: number of circles, negative for clockwise motion
+        """
+        super().__init__(center, radius, start_angle, start_angle + 2 * math.pi * turns, duration)
+
+
+class Bezier(Trajectory):
+    """
+    Bézier curve of any order given by its control points.
+    """
+    def __init__(self, points, duration):
+        """
+        :param points: sequence of at least two (h, v) control points, e.g. four for a cubic curve
+        :param duration: seconds
+        """
+        super().__init__(duration)
+        if len(points) < 2:
+            raise ValueError('Bezier curves require at least two control points')
+        self.points = tuple(tuple(point) for point in points)
+
+    def get_position(self, t):
+        f = 1 if self.duration == 0 else t / self.duration
+        # De Casteljau's algorithm
+        points = list(self.points)
+        while len(points) > 1:
+            points = [(a[0] + (b[0] - a[0]) * f, a[1] + (b[1] - a[1]) * f) for a, b in zip(points, points[1:])]
+        return points[0]
+
+
+class SampledTrajectory(Trajectory):
+    """
+    Linear interpolation of precomputed samples.
+    """
+    def __init__(self, samples):
+        """
+        :param samples: sequence of (t, h, v) samples sorted by time, e.g. a (N, 3) numpy array.
+                        The trajectory starts at time 0, positions before the first sample are the first sample.
+        """
+        if not len(samples):
+            raise ValueError('No samples given')
+        self._times = [float(sample[0]) for sample in samples]
+        if any(t1 < t0 for t0, t1 in zip(self._times, self._times[1:])):
+            raise ValueError('Samples must be sorted by time')
+        self._positions = [(float(sample[1]), float(sample[2])) for sample in samples]
+        super().__init__(max(0.0, self._times[-1]))
+
+    def get_position(self, t):
+        i = bisect.bisect_right(self._times, t)
+        if i == 0:
+            return self._positions[0]
+        if i == len(self._times):
+            return self._positions[-1]
+
+        t0, t1 = self._times[i - 1], self._times[i]
+        (h0, v0), (h1, v1) = self._positions[i - 1], self._positions[i]
+        f = (t - t0) / (t1 - t0)
+        return h0 + (h1 - h0) * f, v0 + (v1 - v0) * f
+
+
+class Concatenation(Trajectory):
+    """
+    Plays several trajectories one after another.
+    """
+    def __init__(self, *trajectories):
+        if not trajectories:
+            raise ValueError('No trajectories given')
+        super().__init__(sum(trajectory.duration for trajectory in trajectories))
+        self.trajectories = trajectories
+
+    def get_position(self, t):
+        for trajectory in self.trajectories:
+            if t <= trajectory.duration:
+                return trajectory.get_position(t)
+            t -= trajectory.duration
+        last = self.trajectories[-1]
+        return last.get_position(last.duration)
+
+    def compile(self, period):
+        # compile the parts separately, so every part ends exactly on its end position
+        positions = []
+        for trajectory in self.trajectories:
+            positions.extend(trajectory.compile(period))
+        return tuple(positions)
+
+
+class TrajectoryPlayer:
+    """
+    Applies compiled positions to a stick, one position per call of advance.
+    Used as tick hook of the controller state, see ControllerState.play_trajectory.
+    """
+    def __init__(self, stick_state, positions, loop=None):
+        """
+        :param stick_state: StickState to move
+        :param positions: compiled positions, see Trajectory.compile
+        """
+        self._stick_state = stick_state
+        self._positions = positions
+        self._index = 0
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        # resolved after the last position was written into an input report
+        self.future = loop.create_future()
+
+    def advance(self):
+        """
+        :returns True if the player is finished and can be removed
+        """
+        if self.future.done():
+            return True
+        if self._index == len(self._positions):
+            self.future.set_result(None)
+            return True
+
+        self._stick_state.set_position(*self._positions[self._index])
+        self._index += 1
+        return False
+
+    def cancel(self):
+        self.future.cancel()
@@ -1,10 +1,11 @@
 import asyncio
 import logging
-import struct
-import time
 from typing import Any
 
 from joycontrol import utils
+from joycontrol.capture import CaptureWriter
+from joycontrol.metrics import LinkMetrics
+from joycontrol.report import InputReport
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +15,13 @@ class NotConnectedError(ConnectionResetError):
 
 
 class L2CAP_Transport(asyncio.Transport):
-    def __init__(self, loop, protocol, itr_sock, ctr_sock, read_buffer_size, capture_file=None) -> None:
+    def __init__(self, loop, protocol, itr_sock, ctr_sock, read_buffer_size, capture_file=None,
+                 metrics=None) -> None:
+        """
+        :param capture_file: Optional file opened for binary writing or CaptureWriter to record all reports.
+                             A CaptureWriter is not closed with the transport and can be shared across connections.
+        :param metrics: LinkMetrics updated by this transport, usually the metrics of the protocol
+        """
         super(L2CAP_Transport, self).__init__()
 
         self._loop = loop
@@ -25,6 +32,8 @@ class L2CAP_Transport(asyncio.Transport):
 
         self._read_buffer_size = read_buffer_size
 
+        self.metrics = LinkMetrics() if metrics is None else metrics
+
         self._extra_info = {
             'peername': self._itr_sock.getpeername(),
             'sockname': self._itr_sock.getsockname(),
@@ -34,7 +43,12 @@ class L2CAP_Transport(asyncio.Transport):
         self._is_closing = False
         self._is_reading = asyncio.Event()
 
-        self._capture_file = capture_file
+        if capture_file is None or isinstance(capture_file, CaptureWriter):
+            self._capture = capture_file
+            self._owns_capture = False
+        else:
+            self._capture = CaptureWriter(capture_file)
+            self._owns_capture = True
 
         # start underlying reader
         self._read_thread = None
@@ -49,7 +63,7 @@ class L2CAP_Transport(asyncio.Transport):
                 self._read_thread = None
                 break
 
-            await self._protocol.report_received(data, self._itr_sock.getpeername())
+            await self._protocol.report_received(data, self._extra_info['peername'])
 
     def start_reader(self):
         """
@@ -96,7 +110,13 @@ class L2CAP_Transport(asyncio.Transport):
         :returns bytes
         """
         await self._is_reading.wait()
-        data = await self._loop.sock_recv(self._itr_sock, self._read_buffer_size)
+        try:
+            data = await self._loop.sock_recv(self._itr_sock, self._read_buffer_size)
+        except OSError as err:
+            # e.g. link supervision timeout of the Bluetooth controller
+            logger.error(err)
+            self._protocol.connection_lost()
+            raise NotConnectedError(err)
 
         # logger.debug(f'received "{list(data)}"')
 
@@ -106,11 +126,14 @@ class L2CAP_Transport(asyncio.Transport):
             self._protocol.connection_lost()
             raise NotConnectedError('No data received.')
 
-        if self._capture_file is not None:
-            # write data to log file
-            _time = struct.pack('d', time.time())
-            size = struct.pack('i', len(data))
-            self._capture_file.write(_time + size + data)
+        metrics = self.metrics
+        metrics.last_receive_time = metrics.clock()
+        metrics.bytes_received += len(data)
+        if len(data) > 1:
+            metrics.output_reports_received[data[1]] += 1
+
+        if self._capture is not None:
+            self._capture.write_output(data)
 
         return data
 
@@ -136,30 +159,39 @@ class L2CAP_Transport(asyncio.Transport):
         self._read_buffer_size = size
 
     async def write(self, data: Any) -> None:
-        if isinstance(data, bytes):
+        if isinstance(data, (bytes, bytearray, memoryview)):
             _bytes = data
+        elif isinstance(data, InputReport):
+            # send directly from the report buffer
+            _bytes = data.get_view()
         else:
             _bytes = bytes(data)
 
-        if self._capture_file is not None:
-            # write data to log file
-            _time = struct.pack('d', time.time())
-            size = struct.pack('i', len(_bytes))
-            self._capture_file.write(_time + size + _bytes)
+        if self._capture is not None:
+            self._capture.write_input(_bytes)
 
         # logger.debug(f'sending "{_bytes}"')
 
+        metrics = self.metrics
+        start = metrics.clock()
         try:
             await self._loop.sock_sendall(self._itr_sock, _bytes)
         except OSError as err:
+            metrics.send_errors += 1
             logger.error(err)
             self._protocol.connection_lost()
             raise NotConnectedError(err)
         except ConnectionResetError as err:
+            metrics.send_errors += 1
             logger.error(err)
             self._protocol.connection_lost()
             raise err
 
+        metrics.send_latency.observe(metrics.clock() - start)
+        metrics.bytes_sent += len(_bytes)
+        if len(_bytes) > 1:
+            metrics.input_reports_sent[_bytes[1]] += 1
+
     def abort(self) -> None:
         raise NotImplementedError
 
@@ -176,7 +208,8 @@ class L2CAP_Transport(asyncio.Transport):
         if not self._is_closing:
             # was not already closed
             self._is_closing = True
-            if self._read_thread.cancel():
+            # the reader is None if it stopped after a disconnect
+            if self._read_thread is not None and self._read_thread.cancel():
                 # wait for reader to cancel
                 try:
                     await self._read_thread
@@ -187,6 +220,9 @@ class L2CAP_Transport(asyncio.Transport):
             self._itr_sock.close()
             self._ctr_sock.close()
 
+            if self._owns_capture:
+                self._capture.close()
+
     def set_protocol(self, protocol: asyncio.BaseProtocol) -> None:
         self._protocol = protocol
 
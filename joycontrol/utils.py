@@ -2,26 +2,39 @@ import asyncio
 import logging
 from contextlib import contextmanager
 
-import hid
-
 logger = logging.getLogger(__name__)
 
 
-class AsyncHID(hid.Device):
-    def __init__(self, *args, loop=asyncio.get_event_loop(), **kwargs):
-        super().__init__(*args, **kwargs)
-        self._loop = loop
+def _create_async_hid_class():
+    # hid needs the native hidapi library, only import it if AsyncHID is used
+    import hid
+
+    class AsyncHID(hid.Device):
+        def __init__(self, *args, loop=asyncio.get_event_loop(), **kwargs):
+            super().__init__(*args, **kwargs)
+            self._loop = loop
+
+            self._write_lock = asyncio.Lock()
+            self._read_lock = asyncio.Lock()
+
+        async def read(self, size, timeout=None):
+            async with self._read_lock:
+                return await self._loop.run_in_executor(None, hid.Device.read, self, size, timeout)
+
+        async def write(self, data):
+            async with self._write_lock:
+                return await self._loop.run_in_executor(None, hid.Device.write, self, data)
 
-        self._write_lock = asyncio.Lock()
-        self._read_lock = asyncio.Lock()
+    return AsyncHID
 
-    async def read(self, size, timeout=None):
-        async with self._read_lock:
-            return await self._loop.run_in_executor(None, hid.Device.read, self, size, timeout)
 
-    async def write(self, data):
-        async with self._write_lock:
-            return await self._loop.run_in_executor(None, hid.Device.write, self, data)
+def __getattr__(name):
+    # creates AsyncHID on first access, e.g. "from joycontrol.utils import AsyncHID"
+    if name == 'AsyncHID':
+        async_hid = _create_async_hid_class()
+        globals()['AsyncHID'] = async_hid
+        return async_hid
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 @contextmanager
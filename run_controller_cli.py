@@ -8,12 +8,18 @@ import os
 from aioconsole import ainput
 
 from joycontrol import logging_default as log, utils
+from joycontrol.capture import BufferedCaptureWriter
 from joycontrol.command_line_interface import ControllerCLI
 from joycontrol.controller import Controller
 from joycontrol.controller_state import ControllerState, button_push, button_press, button_release
+from joycontrol.link_cache import LinkCache
 from joycontrol.memory import FlashMemory
+from joycontrol.metrics import MetricsRegistry, MetricsServer
 from joycontrol.protocol import controller_protocol_factory
+from joycontrol.scheduler import RATE_66HZ
 from joycontrol.server import create_hid_server
+from joycontrol.supervisor import SessionSupervisor
+from joycontrol.trace import Tracer
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +33,11 @@ Usage:
                                        [--reconnect_bt_addr | -r <console_bluetooth_address>]
                                        [--log | -l <communication_log_file>]
                                        [--nfc <nfc_data_file>]
+                                       [--report_rate <hz>]
+                                       [--link_cache <link_cache_file>]
+                                       [--auto_reconnect]
+                                       [--metrics_socket <unix_socket_path>]
+                                       [--trace <trace_file>] [--trace_sample <n>]
     run_controller_cli.py -h | --help
 
 Arguments:
@@ -51,6 +62,26 @@ Options:
 
     --nfc <nfc_data_file>                   Sets the nfc data of the controller to a given nfc dump upon initial
                                             connection.
+
+    --report_rate <hz>                      Rate of input reports in full input report mode, e.g. 60, 66 or 120.
+                                            Default is 66.67 Hz.
+
+    --link_cache <link_cache_file>          Stores the console address, input report mode and player lights of the
+                                            connection. If no reconnect address is given, the cached console is
+                                            reconnected and the cached link state restored, so full rate input
+                                            reports are send without waiting for the console handshake.
+
+    --auto_reconnect                        Reconnect to the console if the connection is lost. Held buttons,
+                                            stick positions and running macros are resumed after reconnecting.
+
+    --metrics_socket <unix_socket_path>     Serve runtime metrics over HTTP on a Unix socket, e.g.
+                                            curl --unix-socket <unix_socket_path> http://localhost/metrics
+                                            (Prometheus text format) or .../metrics.json
+
+    --trace <trace_file>                    Record the timing of the report hot paths and write them to a Chrome
+                                            trace event file on exit (open in chrome://tracing or ui.perfetto.dev).
+
+    --trace_sample <n>                      Only trace every n-th input report tick. Default is 1 (all ticks).
 """
 
 
@@ -143,7 +174,7 @@ def ensure_valid_button(controller_state, *buttons):
     :param buttons: Any number of buttons to check (see ButtonState.get_available_buttons)
     """
     for button in buttons:
-        if button not in controller_state.button_state.get_available_buttons():
+        if not controller_state.button_state.has_button(button):
             raise ValueError(f'Button {button} does not exist on {controller_state.get_controller()}')
 
 
@@ -268,8 +299,7 @@ def _register_commands_with_controller_state(controller_state, cli):
 async def _main(args):
     # parse the spi flash
     if args.spi_flash:
-        with open(args.spi_flash, 'rb') as spi_flash_file:
-            spi_flash = FlashMemory(spi_flash_file.read())
+        spi_flash = FlashMemory.from_file(args.spi_flash)
     else:
         # Create memory containing default controller stick calibration
         spi_flash = FlashMemory()
@@ -277,15 +307,52 @@ async def _main(args):
     # Get controller name to emulate from arguments
     controller = Controller.from_arg(args.controller)
 
+    tracer = None
+    if args.trace is not None:
+        # the ring buffer keeps the latest calls
+        tracer = Tracer(sample_interval=args.trace_sample)
+        tracer.install()
+
     with utils.get_output(path=args.log, default=None) as capture_file:
+        # write the capture from a background thread to keep file I/O away from the report loop
+        capture = None if capture_file is None else BufferedCaptureWriter(capture_file)
+
         # prepare the the emulated controller
-        factory = controller_protocol_factory(controller, spi_flash=spi_flash)
+        factory = controller_protocol_factory(controller, spi_flash=spi_flash, report_rate=args.report_rate)
         ctl_psm, itr_psm = 17, 19
-        transport, protocol = await create_hid_server(factory, reconnect_bt_addr=args.reconnect_bt_addr,
+
+        reconnect_bt_addr = args.reconnect_bt_addr
+        link_cache = entry = None
+        if args.link_cache is not None:
+            link_cache = LinkCache(args.link_cache, key=f'{args.device_id or "default"}/{controller.name}')
+            entry = link_cache.load()
+            if reconnect_bt_addr is None and entry is not None:
+                reconnect_bt_addr = entry['console_address']
+                logger.info(f'Reconnecting to cached console {reconnect_bt_addr}')
+
+        transport, protocol = await create_hid_server(factory, reconnect_bt_addr=reconnect_bt_addr,
                                                       ctl_psm=ctl_psm,
-                                                      itr_psm=itr_psm, capture_file=capture_file,
+                                                      itr_psm=itr_psm, capture_file=capture,
                                                       device_id=args.device_id)
 
+        if link_cache is not None:
+            # the cached state is only valid for the console it was negotiated with
+            if entry is not None and entry['console_address'] == reconnect_bt_addr:
+                link_cache.restore(protocol)
+            asyncio.ensure_future(link_cache.record(protocol)).add_done_callback(utils.create_error_check_callback())
+
+        supervisor = None
+        if args.auto_reconnect:
+            supervisor = SessionSupervisor(protocol, ctl_psm=ctl_psm, itr_psm=itr_psm, capture_file=capture,
+                                           device_id=args.device_id)
+            supervisor.start()
+
+        metrics_server = None
+        if args.metrics_socket is not None:
+            registry = MetricsRegistry()
+            registry.add(protocol.metrics, controller=controller.name)
+            metrics_server = await MetricsServer(registry, args.metrics_socket).start()
+
         controller_state = protocol.get_controller_state()
 
         # Create command line interface and add some extra commands
@@ -302,7 +369,19 @@ async def _main(args):
             await cli.run()
         finally:
             logger.info('Stopping communication...')
-            await transport.close()
+            if supervisor is not None:
+                await supervisor.stop()
+            if metrics_server is not None:
+                await metrics_server.close()
+            # the transport is replaced on reconnection
+            if protocol.transport is not None:
+                await protocol.transport.close()
+            if capture is not None:
+                capture.close()
+            if tracer is not None:
+                tracer.uninstall()
+                with open(args.trace, 'w') as trace_file:
+                    tracer.save(trace_file)
 
 
 if __name__ == '__main__':
@@ -322,6 +401,18 @@ if __name__ == '__main__':
     parser.add_argument('-r', '--reconnect_bt_addr', type=str, default=None,
                         help='The Switch console Bluetooth address, for reconnecting as an already paired controller')
     parser.add_argument('--nfc', type=str, default=None)
+    parser.add_argument('--report_rate', type=float, default=RATE_66HZ,
+                        help='Rate of input reports in Hz in full input report mode')
+    parser.add_argument('--link_cache', type=str, default=None,
+                        help='File storing the link state for fast reconnection')
+    parser.add_argument('--auto_reconnect', action='store_true',
+                        help='Reconnect to the console if the connection is lost')
+    parser.add_argument('--metrics_socket', type=str, default=None,
+                        help='Unix socket path serving runtime metrics')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='Chrome trace event file receiving the timing of the report hot paths')
+    parser.add_argument('--trace_sample', type=int, default=1,
+                        help='Trace every n-th input report tick')
     args = parser.parse_args()
 
     loop = asyncio.get_event_loop()
@@ -0,0 +1,36 @@
+import argparse
+
+from joycontrol.macro import Timeline
+from joycontrol.scheduler import RATE_66HZ
+
+""" Converts the input reports of a capture into a binary macro timeline.
+
+The timeline can be replayed using the "macro" command of run_controller_cli.py.
+
+Usage:
+    capture_to_macro.py <capture_file> <timeline_file> [--start <seconds>] [--end <seconds>]
+                                                       [--report_rate <hz>] [--stick_tolerance <units>]
+    capture_to_macro.py -h | --help
+"""
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('capture_file')
+    parser.add_argument('timeline_file')
+    parser.add_argument('--start', type=float, default=None, help='skip reports before this time in seconds')
+    parser.add_argument('--end', type=float, default=None, help='skip reports after this time in seconds')
+    parser.add_argument('--report_rate', type=float, default=RATE_66HZ,
+                        help='rate in Hz of the timeline, timelines are resampled on playback if the rate differs')
+    parser.add_argument('--stick_tolerance', type=int, default=0,
+                        help='ignore stick changes up to this value in raw units to filter noise of real sticks')
+    args = parser.parse_args()
+
+    with open(args.capture_file, 'rb') as capture:
+        timeline = Timeline.from_capture(capture, 1 / args.report_rate, start=args.start, end=args.end,
+                                         stick_tolerance=args.stick_tolerance)
+
+    with open(args.timeline_file, 'wb') as timeline_file:
+        timeline.save(timeline_file)
+
+    print(f'Extracted {len(timeline)} key frames, {timeline.get_duration():.2f} seconds.')
@@ -1,29 +1,23 @@
 import argparse
-import struct
 
+from joycontrol.capture import CaptureReader, INPUT, OUTPUT
 from joycontrol.report import InputReport, OutputReport, SubCommand
 
 """ joycontrol capture parsing example.
 
 Usage:
-    parse_capture.py <capture_file>
+    parse_capture.py <capture_file> [--start <seconds>] [--end <seconds>] [--analyze]
     parse_capture.py -h | --help
 """
 
 
-def _eof_read(file, size):
-    """
-    Raises EOFError if end of file is reached.
-    """
-    data = file.read(size)
-    if not data:
-        raise EOFError()
-    return data
-
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('capture_file')
+    parser.add_argument('--start', type=float, default=None, help='skip reports before this time in seconds')
+    parser.add_argument('--end', type=float, default=None, help='skip reports after this time in seconds')
+    parser.add_argument('--analyze', action='store_true',
+                        help='print report timing statistics of the whole capture, requires numpy')
     args = parser.parse_args()
 
     # list of time, report tuples
@@ -31,34 +25,24 @@ if __name__ == '__main__':
     output_reports = []
 
     with open(args.capture_file, 'rb') as capture:
-        try:
-            start_time = None
-            while True:
-                # parse capture time
-                time = struct.unpack('d', _eof_read(capture, 8))[0]
-                if start_time is None:
-                    start_time = time
-
-                # parse data size
-                size = struct.unpack('i', _eof_read(capture, 4))[0]
-                # parse data
-                data = list(_eof_read(capture, size))
-
-                if data[0] == 0xA1:
-                    report = InputReport(data)
-                    # normalise time
-                    input_reports.append((time - start_time, report))
-                elif data[0] == 0xA2:
-                    report = OutputReport(data)
-                    # normalise time
-                    output_reports.append((time - start_time, report))
-                else:
-                    raise ValueError(f'Unexpected data.')
-        except EOFError:
-            pass
+        # records are streamed from the file
+        for record in CaptureReader(capture).records(start=args.start, end=args.end):
+            if record.direction == INPUT:
+                input_reports.append((record.time, InputReport(record.data)))
+            elif record.direction == OUTPUT:
+                output_reports.append((record.time, OutputReport(record.data)))
+            else:
+                raise ValueError(f'Unexpected data.')
 
     print('Finished parsing reports.')
     print('Input reports:', len(input_reports))
     print('Output reports:', len(output_reports))
 
     # Do some investigation...
+    if args.analyze:
+        from joycontrol import analysis
+
+        records = analysis.load_capture(args.capture_file)
+        print()
+        for key, value in analysis.summary(records).items():
+            print(f'{key}:', value)
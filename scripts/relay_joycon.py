@@ -3,12 +3,11 @@ import asyncio
 import logging
 import os
 import socket
-import struct
-import time
 
 import hid
 
 from joycontrol import logging_default as log, utils
+from joycontrol.capture import CaptureWriter
 from joycontrol.device import HidDevice
 from joycontrol.server import PROFILE_PATH
 from joycontrol.utils import AsyncHID
@@ -23,7 +22,11 @@ PRODUCT_ID_PC = 8201
 
 class Relay:
     def __init__(self, capture_file=None):
-        self._capture_file = capture_file
+        self._capture = None if capture_file is None else CaptureWriter(capture_file)
+
+    def close(self):
+        if self._capture is not None:
+            self._capture.close()
 
     async def relay_input(self, hid_device, client_itr):
         loop = asyncio.get_event_loop()
@@ -33,11 +36,8 @@ class Relay:
             # add adding byte for input report
             data = b'\xa1' + data
 
-            if self._capture_file is not None:
-                # write data to log file
-                current_time = struct.pack('d', time.time())
-                size = struct.pack('i', len(data))
-                self._capture_file.write(current_time + size + data)
+            if self._capture is not None:
+                self._capture.write_input(data)
 
             await loop.sock_sendall(client_itr, data)
             await asyncio.sleep(0)
@@ -48,11 +48,8 @@ class Relay:
         while True:
             data = await loop.sock_recv(client_itr, 50)
 
-            if self._capture_file is not None:
-                # write data to log file
-                current_time = struct.pack('d', time.time())
-                size = struct.pack('i', len(data))
-                self._capture_file.write(current_time + size + data)
+            if self._capture is not None:
+                self._capture.write_output(data)
 
             # remove padding byte for output report (not required when using the hid driver)
             data = data[1:]
@@ -157,6 +154,7 @@ async def _main(capture_file=None, reconnect_bt_addr=None):
         logger.info('Stopping communication...')
         client_itr.close()
         client_ctl.close()
+        relay.close()
 
 
 if __name__ == '__main__':
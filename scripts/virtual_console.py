@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import logging
+
+from joycontrol import logging_default as log
+from joycontrol.controller import Controller
+from joycontrol.loopback import create_loopback_connection
+from joycontrol.memory import FlashMemory
+from joycontrol.protocol import controller_protocol_factory
+from joycontrol.scheduler import RATE_66HZ
+
+logger = logging.getLogger(__name__)
+
+""" Pairs an emulated controller with a virtual console and measures the input report rate, no Bluetooth required.
+
+Usage:
+    virtual_console.py [<controller>] [--duration <seconds>] [--report_rate <hz>] [--spi_flash <spi_flash_memory_file>]
+                       [--rumble]
+    virtual_console.py -h | --help
+"""
+
+
+async def _main(args):
+    spi_flash = FlashMemory.from_file(args.spi_flash) if args.spi_flash else FlashMemory()
+    factory = controller_protocol_factory(Controller.from_arg(args.controller), spi_flash=spi_flash,
+                                          report_rate=args.report_rate)
+    transport, protocol, console = await create_loopback_connection(factory)
+    try:
+        await console.pair()
+        print(f'Paired: {sum(console.reports.values())} reports received, '
+              f'mean reply latency {console.reply_latency.get_mean() * 1000:.3f} ms, '
+              f'max {console.reply_latency.max * 1000:.3f} ms, {console.repeated_requests} repeated requests')
+
+        if args.rumble:
+            console.start_rumble(1 / args.report_rate)
+        console.reset_statistics()
+        await console.consume(args.duration)
+
+        intervals = console.report_intervals
+        print(f'Full mode: {console.get_report_rate():.2f} Hz, '
+              f'mean interval {intervals.get_mean() * 1000:.3f} ms, max {intervals.max * 1000:.3f} ms, '
+              f'99% below {intervals.get_quantile(0.99) * 1000:.3f} ms')
+        print(f'Tick timing: {protocol.scheduler.statistics}')
+    finally:
+        await console.close()
+        await transport.close()
+
+
+if __name__ == '__main__':
+    log.configure(console_level=logging.WARNING)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('controller', nargs='?', default='PRO_CONTROLLER',
+                        help='JOYCON_R, JOYCON_L or PRO_CONTROLLER')
+    parser.add_argument('--duration', type=float, default=5, help='seconds to receive full mode input reports')
+    parser.add_argument('--report_rate', type=float, default=RATE_66HZ,
+                        help='Rate of input reports in Hz in full input report mode')
+    parser.add_argument('--spi_flash')
+    parser.add_argument('--rumble', action='store_true', help='send rumble output reports like a Switch')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(_main(args))
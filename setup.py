@@ -6,11 +6,14 @@ setup(name='joycontrol',
       author='Robert Martin',
       author_email='martinro@informatik.hu-berlin.de',
       description='Emulate Nintendo Switch Controllers over Bluetooth',
-      packages=find_packages(),
+      packages=find_packages(exclude=('benchmarks', 'benchmarks.*')),
       package_data={'joycontrol': ['profile/sdp_record_hid.xml']},
       zip_safe=False,
       install_requires=[
           'hid', 'aioconsole', 'dbus-python'
-      ]
+      ],
+      extras_require={
+          'analysis': ['numpy']
+      }
       )
 
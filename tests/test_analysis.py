@@ -0,0 +1,45 @@
+import io
+import os
+
+import pytest
+
+from joycontrol.capture import CaptureReader, CaptureWriter
+
+np = pytest.importorskip('numpy')
+
+from joycontrol.analysis import load_capture
+
+"""
+Loading captures into numpy arrays.
+"""
+
+
+class _UnseekableFile(io.BytesIO):
+    def seekable(self):
+        return False
+
+
+def _report(report_id, timer):
+    return bytes((0xA1, report_id, timer)) + bytes(47)
+
+
+def test_load_capture_without_index_offset(tmp_path):
+    # the index offset can't be stored in the header of a not seekable file
+    file = _UnseekableFile()
+    writer = CaptureWriter(file, index_interval=2)
+    for timer in range(5):
+        writer.write_input(_report(0x30, timer))
+    writer.close()
+
+    path = os.path.join(str(tmp_path), 'capture.jcap')
+    with open(path, 'wb') as capture_file:
+        capture_file.write(file.getvalue())
+
+    with open(path, 'rb') as capture_file:
+        assert CaptureReader(capture_file).get_record_range()[1] is None
+
+    records = load_capture(path)
+    # the index must not be decoded as a record
+    assert len(records) == 5
+    assert list(records['report_id']) == [0x30] * 5
+    assert list(records['timer']) == list(range(5))
@@ -0,0 +1,172 @@
+import io
+import struct
+
+import pytest
+
+from joycontrol.capture import CaptureReader, CaptureWriter, BufferedCaptureWriter, OverflowPolicy, CaptureRecord, \
+    INPUT, OUTPUT
+
+"""
+Writing and reading capture files.
+"""
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _input_report(timer):
+    return bytes((0xA1, 0x30, timer)) + bytes(47)
+
+
+def _output_report(timer):
+    return bytes((0xA2, 0x10, timer)) + bytes(8)
+
+
+def _write_capture(writer, clock, start=0, stop=10):
+    """
+    Writes alternating input and output reports, record i at time i * 0.1.
+    :returns written records
+    """
+    records = []
+    for i in range(start, stop):
+        clock.now = 100.0 + i * 0.1
+        if i % 2 == 0:
+            data = _input_report(i)
+            writer.write_input(data)
+        else:
+            data = _output_report(i)
+            writer.write_output(data)
+        records.append(CaptureRecord(pytest.approx(i * 0.1), i % 2, data))
+    return records
+
+
+def test_round_trip():
+    file = io.BytesIO()
+    clock = _Clock()
+    writer = CaptureWriter(file, index_interval=3, clock=clock)
+    records = _write_capture(writer, clock)
+    writer.close()
+    assert writer.get_record_count() == 10
+
+    file.seek(0)
+    reader = CaptureReader(file)
+    assert reader.version == 2
+    assert list(reader) == records
+
+    # an entry every 3 records
+    index = reader.get_index()
+    assert [offset for _, offset in index] == sorted(offset for _, offset in index)
+    assert [_time for _time, _ in index] == [pytest.approx(i * 0.1) for i in (0, 3, 6, 9)]
+    first, last = reader.get_record_range()
+    assert index[0][1] == first
+    assert last is not None and last > index[-1][1]
+
+
+def test_records_filter():
+    file = io.BytesIO()
+    clock = _Clock()
+    writer = CaptureWriter(file, index_interval=3, clock=clock)
+    records = _write_capture(writer, clock)
+    writer.close()
+
+    file.seek(0)
+    reader = CaptureReader(file)
+    # start seeks using the index
+    assert list(reader.records(start=0.35, end=0.75)) == records[4:8]
+    assert list(reader.records(start=0, end=0)) == records[:1]
+    assert list(reader.records(start=0.45)) == records[5:]
+    assert list(reader.records(end=0.25)) == records[:3]
+    assert list(reader.records(direction=OUTPUT)) == records[1::2]
+    assert list(reader.records(start=0.2, direction=INPUT, report_ids=(0x30,))) == records[2::2]
+    assert list(reader.records(report_ids=(0x21,))) == []
+
+
+def test_read_without_index_offset():
+    # e.g. the capture was written to a pipe, the index offset is missing in the header
+    class UnseekableFile(io.BytesIO):
+        def seekable(self):
+            return False
+
+    file = UnseekableFile()
+    clock = _Clock()
+    writer = CaptureWriter(file, index_interval=3, clock=clock)
+    records = _write_capture(writer, clock)
+    writer.close()
+
+    reader = CaptureReader(io.BytesIO(file.getvalue()))
+    assert reader.get_record_range()[1] is None
+    assert reader.get_index() == []
+    # the records end at the index
+    assert list(reader) == records
+
+
+def test_read_truncated_capture():
+    file = io.BytesIO()
+    clock = _Clock()
+    writer = CaptureWriter(file, clock=clock)
+    records = _write_capture(writer, clock)
+    # the process was killed, the last record is incomplete and there is no index
+    data = file.getvalue()[:-5]
+
+    assert list(CaptureReader(io.BytesIO(data))) == records[:-1]
+
+
+def test_buffered_writer():
+    file = io.BytesIO()
+    clock = _Clock()
+    writer = BufferedCaptureWriter(file, flush_interval=10, index_interval=3, clock=clock)
+    records = _write_capture(writer, clock, stop=4)
+
+    # written by the background thread
+    writer.flush()
+    assert writer.batches_written > 0
+    assert list(CaptureReader(io.BytesIO(file.getvalue()))) == records
+
+    records += _write_capture(writer, clock, start=4)
+    writer.close()
+    assert writer.dropped_records == 0
+
+    file.seek(0)
+    reader = CaptureReader(file)
+    assert list(reader) == records
+    assert len(reader.get_index()) == 4
+    # closing twice does nothing
+    writer.close()
+
+
+def test_buffered_writer_drops_records_if_full():
+    file = io.BytesIO()
+    clock = _Clock()
+    # the header fills the buffer until the writer thread runs
+    writer = BufferedCaptureWriter(file, max_buffer_size=1, overflow_policy=OverflowPolicy.DROP, flush_interval=10,
+                                   clock=clock)
+    for timer in range(100):
+        writer.write_input(_input_report(timer))
+    writer.close()
+
+    file.seek(0)
+    written = list(CaptureReader(file))
+    assert writer.dropped_records > 0
+    assert len(written) + writer.dropped_records == 100
+    assert writer.get_record_count() == len(written)
+
+
+def test_read_v1_capture():
+    v1_record = struct.Struct('di')
+    start_time = 1600000000.0
+    reports = [(start_time, _output_report(0)), (start_time + 0.5, _input_report(1)),
+               (start_time + 1.0, _output_report(2))]
+    file = io.BytesIO(b''.join(v1_record.pack(_time, len(data)) + data for _time, data in reports))
+
+    reader = CaptureReader(file)
+    assert reader.version == 1
+    assert reader.start_time == start_time
+    # the direction is derived from the HID prefix
+    assert list(reader) == [CaptureRecord(0.0, OUTPUT, reports[0][1]), CaptureRecord(0.5, INPUT, reports[1][1]),
+                            CaptureRecord(1.0, OUTPUT, reports[2][1])]
+    assert list(reader.records(start=0.25, direction=OUTPUT)) == [CaptureRecord(1.0, OUTPUT, reports[2][1])]
@@ -0,0 +1,135 @@
+import pytest
+
+from joycontrol.controller import Controller
+from joycontrol.controller_state import ButtonState
+
+"""
+Button states, compared to the three byte layout of the button methods before the 24 bit state.
+"""
+
+# button -> (byte, bit) as set by the generated methods of the original ButtonState
+_BYTE_1 = {'y': (0, 0), 'x': (0, 1), 'b': (0, 2), 'a': (0, 3), 'r': (0, 6), 'zr': (0, 7)}
+_BYTE_2 = {'minus': (1, 0), 'plus': (1, 1), 'r_stick': (1, 2), 'l_stick': (1, 3)}
+_BYTE_3 = {'down': (2, 0), 'up': (2, 1), 'right': (2, 2), 'left': (2, 3), 'l': (2, 6), 'zl': (2, 7)}
+
+LAYOUTS = {
+    Controller.PRO_CONTROLLER: {**_BYTE_1, **_BYTE_2, 'home': (1, 4), 'capture': (1, 5), **_BYTE_3},
+    Controller.JOYCON_R: {**_BYTE_1, 'sr': (0, 4), 'sl': (0, 5), **_BYTE_2, 'home': (1, 4)},
+    Controller.JOYCON_L: {**_BYTE_2, 'capture': (1, 5), **_BYTE_3, 'sr': (2, 4), 'sl': (2, 5)},
+}
+
+# buttons of the other Joy-Con, their bits are part of the report but they can't be set by name
+HIDDEN = {
+    Controller.PRO_CONTROLLER: set(),
+    Controller.JOYCON_R: {'minus', 'l_stick'},
+    Controller.JOYCON_L: {'plus', 'r_stick'},
+}
+
+
+def _expected_bytes(controller, *buttons):
+    data = bytearray(3)
+    for button in buttons:
+        byte, bit = LAYOUTS[controller][button]
+        data[byte] |= 1 << bit
+    return bytes(data)
+
+
+@pytest.mark.parametrize('controller', LAYOUTS)
+def test_available_buttons(controller):
+    button_state = ButtonState(controller)
+    available = set(LAYOUTS[controller]) - HIDDEN[controller]
+    assert button_state.get_available_buttons() == available
+
+    for button in HIDDEN[controller]:
+        assert not button_state.has_button(button)
+        with pytest.raises(ValueError):
+            button_state.set_button(button)
+    for button in {'home', 'capture', 'sl', 'sr'} - set(LAYOUTS[controller]):
+        assert not hasattr(button_state, button)
+        assert not hasattr(button_state, f'{button}_is_set')
+        with pytest.raises(ValueError):
+            button_state.get_mask(button)
+
+
+@pytest.mark.parametrize('controller', LAYOUTS)
+def test_single_buttons(controller):
+    button_state = ButtonState(controller)
+    for button in sorted(LAYOUTS[controller]):
+        expected = _expected_bytes(controller, button)
+
+        # the generated methods work for the hidden buttons as well
+        getattr(button_state, button)()
+        assert getattr(button_state, f'{button}_is_set')()
+        assert bytes(button_state) == expected
+        assert list(button_state) == list(expected)
+        getattr(button_state, button)(pushed=False)
+        assert bytes(button_state) == bytes(3)
+
+        if button not in HIDDEN[controller]:
+            assert button_state.get_mask(button) == int.from_bytes(expected, 'little')
+            button_state.set_button(button)
+            assert button_state.get_button(button)
+            assert bytes(button_state) == expected
+            button_state.set_button(button, pushed=False)
+            assert not button_state.get_button(button)
+
+
+@pytest.mark.parametrize('controller', LAYOUTS)
+def test_all_buttons(controller):
+    button_state = ButtonState(controller)
+    buttons = sorted(button_state.get_available_buttons())
+    expected = _expected_bytes(controller, *buttons)
+
+    button_state.set_buttons(*buttons)
+    assert bytes(button_state) == expected
+    assert button_state.get_bits() == button_state.get_mask(*buttons) == int.from_bytes(expected, 'little')
+
+    button_state.set_buttons(*buttons[1:], pushed=False)
+    assert bytes(button_state) == _expected_bytes(controller, buttons[0])
+    button_state.clear()
+    assert bytes(button_state) == bytes(3)
+
+
+@pytest.mark.parametrize('controller', LAYOUTS)
+def test_set_bits(controller):
+    button_state = ButtonState(controller)
+    # bits of hidden buttons can be set as well
+    bits = int.from_bytes(_expected_bytes(controller, *LAYOUTS[controller]), 'little')
+    button_state.set_bits(bits)
+    assert button_state.get_bits() == bits
+    assert all(button_state.get_button(button) for button in button_state.get_available_buttons())
+
+    # replaces the whole state
+    button_state.set_bits(0)
+    assert button_state.get_bits() == 0
+
+    for bits in (-1, 0x1000000):
+        with pytest.raises(ValueError):
+            button_state.set_bits(bits)
+    assert button_state.get_bits() == 0
+
+
+def test_revision():
+    button_state = ButtonState(Controller.PRO_CONTROLLER)
+    other = ButtonState(Controller.PRO_CONTROLLER)
+    # unique across states
+    assert button_state.get_revision() != other.get_revision()
+
+    revision = button_state.get_revision()
+    data = bytes(button_state)
+    # no change, the encoded bytes are reused
+    button_state.a(pushed=False)
+    button_state.set_bits(0)
+    assert button_state.get_revision() == revision
+    assert bytes(button_state) is data
+
+    button_state.a()
+    assert button_state.get_revision() != revision
+    assert bytes(button_state) == b'\x08\x00\x00'
+
+    revision = button_state.get_revision()
+    button_state.set_buttons('a')
+    assert button_state.get_revision() == revision
+    button_state.clear()
+    assert button_state.get_revision() != revision
+    assert bytes(button_state) == bytes(3)
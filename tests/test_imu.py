@@ -0,0 +1,41 @@
+import pytest
+
+from joycontrol.imu import ImuSource
+
+"""
+Packing of IMU samples.
+"""
+
+SAMPLES = [(0, 0, 4096, 0, 0, 0), (-32768, 32767, 1.4, -1.6, 10, -10)]
+
+
+@pytest.mark.parametrize('sample', [
+    (32768, 0, 0, 0, 0, 0),
+    (0, -32769, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 32767.5),
+])
+def test_out_of_range_sample(sample):
+    with pytest.raises(ValueError):
+        ImuSource.from_samples([sample])
+
+
+def test_numpy_samples_match_list_samples():
+    np = pytest.importorskip('numpy')
+
+    source = ImuSource.from_samples(SAMPLES)
+    array_source = ImuSource.from_samples(np.array(SAMPLES))
+    assert bytes(array_source.next_frame()) == bytes(source.next_frame())
+
+
+@pytest.mark.parametrize('sample', [
+    (32768, 0, 0, 0, 0, 0),
+    (0, -32769, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 32767.5),
+    (0, 0, float('nan'), 0, 0, 0),
+])
+def test_out_of_range_numpy_sample(sample):
+    np = pytest.importorskip('numpy')
+
+    # must not wrap around
+    with pytest.raises(ValueError):
+        ImuSource.from_samples(np.array([sample]))
@@ -0,0 +1,153 @@
+import asyncio
+
+from joycontrol.controller import Controller
+from joycontrol.loopback import create_loopback_connection, PAIRING_SEQUENCE
+from joycontrol.protocol import controller_protocol_factory
+from joycontrol.report import OutputReport, OutputReportID, SubCommand, SPI_FLASH_READ_REQUEST, \
+    create_sub_command_reply
+
+"""
+Pairing and the full input report mode over the loopback transport, no Bluetooth required.
+"""
+
+
+def _run(coroutine_function):
+    async def run():
+        transport, protocol, console = await create_loopback_connection(
+            controller_protocol_factory(Controller.PRO_CONTROLLER))
+        try:
+            await coroutine_function(protocol, console)
+        finally:
+            await console.close()
+            await transport.close()
+
+    asyncio.run(run())
+
+
+def test_pairing_adapts_pacer():
+    async def check(protocol, console):
+        pacer = protocol.pacer
+        initial_hold = pacer.get_hold()
+
+        # the requests following SET_INPUT_REPORT_MODE are handled in the full input report mode
+        index = next(i for i, (sub_command, _) in enumerate(PAIRING_SEQUENCE)
+                     if sub_command is SubCommand.SET_INPUT_REPORT_MODE)
+        await console.pair(PAIRING_SEQUENCE[:index + 1])
+        mean_latency = pacer.mean_latency
+        await console.pair(PAIRING_SEQUENCE[index + 1:])
+
+        assert protocol.get_input_report_mode() == 0x30
+        # requests of the Switch arriving while holding are answered right away and measured
+        assert pacer.mean_latency is not None
+        assert pacer.mean_latency != mean_latency
+        assert pacer.get_hold() != initial_hold
+        assert pacer.repeated_requests == 0
+        assert console.repeated_requests == 0
+
+    _run(check)
+
+
+def test_repeated_request_increases_hold():
+    async def check(protocol, console):
+        pacer = protocol.pacer
+        await console.pair()
+
+        request = SPI_FLASH_READ_REQUEST.pack(0x6000, 0x10)
+        await console.send_sub_command(SubCommand.SPI_FLASH_READ, request)
+        hold = pacer.get_hold()
+        # a repetition of the last request right after the reply means the reply got lost
+        await console.send_sub_command(SubCommand.SPI_FLASH_READ, request)
+
+        assert pacer.repeated_requests == 1
+        assert pacer.get_hold() > hold
+
+    _run(check)
+
+
+def test_repeated_request_after_hold_increases_hold():
+    async def check(protocol, console):
+        pacer = protocol.pacer
+        await console.pair()
+
+        request = SPI_FLASH_READ_REQUEST.pack(0x6020, 0x18)
+        await console.send_sub_command(SubCommand.SPI_FLASH_READ, request)
+        hold = pacer.get_hold()
+        # 0x30 reports resumed in the meantime, the reply got lost between them
+        await asyncio.sleep(hold + 2 * protocol.scheduler.get_period())
+        assert not pacer.is_holding()
+        await console.send_sub_command(SubCommand.SPI_FLASH_READ, request)
+
+        assert pacer.repeated_requests == 1
+        assert pacer.get_hold() > hold
+
+    _run(check)
+
+
+def test_full_mode_reports():
+    async def check(protocol, console):
+        await console.pair()
+        await asyncio.sleep(0.2)
+
+        console.reset_statistics()
+        assert await console.consume(0.5) > 0
+        assert console.reports[0x30] > 0
+
+    _run(check)
+
+
+def test_cancelled_sender_does_not_cancel_others():
+    async def check(protocol, console):
+        await console.pair()
+        controller_state = protocol.get_controller_state()
+
+        cancelled = asyncio.ensure_future(controller_state.send())
+        sender = asyncio.ensure_future(controller_state.send())
+        # both wait for the same report
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        sequence = await asyncio.wait_for(sender, 1)
+        assert cancelled.cancelled()
+        assert isinstance(sequence, int) and sequence > 0
+
+    _run(check)
+
+
+def test_sub_command_latency_starts_at_request():
+    handler_delay = 0.03
+
+    async def run():
+        # at a low report rate requests wait long for the next tick, which is part of the latency
+        transport, protocol, console = await create_loopback_connection(
+            controller_protocol_factory(Controller.PRO_CONTROLLER, report_rate=5))
+        try:
+            await console.pair()
+
+            reply = create_sub_command_reply(0x80, SubCommand.SET_PLAYER_LIGHTS)
+
+            async def slow_handler(sub_command_data):
+                # output reports received meanwhile must not restart the latency of this request
+                await asyncio.sleep(handler_delay)
+                await protocol.write(reply)
+
+            protocol.register_sub_command_handler(SubCommand.SET_PLAYER_LIGHTS, slow_handler)
+            rumble = OutputReport()
+            rumble.set_output_report_id(OutputReportID.RUMBLE_ONLY)
+            protocol.metrics.sub_command_latency.reset()
+
+            for _ in range(3):
+                request = asyncio.ensure_future(console.send_sub_command(SubCommand.SET_PLAYER_LIGHTS, b'\x01'))
+                await asyncio.sleep(0)
+                # received while the request waits for the next tick
+                await console.send_output_report(rumble)
+                await request
+
+            latency = protocol.metrics.sub_command_latency
+            assert latency.count == 3
+            # includes the wait for the next tick
+            assert latency.get_mean() > handler_delay + protocol.scheduler.get_period() / 4
+        finally:
+            await console.close()
+            await transport.close()
+
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+import asyncio
+
+from joycontrol.controller import Controller
+from joycontrol.controller_state import ControllerState
+from joycontrol.macro import Macro, MacroPlayer
+
+"""
+Compilation of macros into timelines and their playback per tick.
+"""
+
+PERIOD = 0.015
+A = 0x08
+
+
+def _compile(macro):
+    return macro.compile(Controller.PRO_CONTROLLER, PERIOD)
+
+
+def _play(timeline):
+    """
+    :returns list of the button state after every tick
+    """
+    async def run():
+        controller_state = ControllerState(None, Controller.PRO_CONTROLLER)
+        player = MacroPlayer(controller_state, timeline)
+        states = []
+        while not player.advance():
+            states.append(controller_state.button_state.get_bits())
+        assert player.future.done()
+        return states
+
+    return asyncio.run(run())
+
+
+def _count_pushes(states, mask):
+    pushes = 0
+    previous = 0
+    for bits in states:
+        if bits & mask and not previous & mask:
+            pushes += 1
+        previous = bits
+    return pushes
+
+
+def test_push():
+    timeline = _compile(Macro().push('a', sec=0.15))
+    assert [(k.tick, k.press, k.release) for k in timeline] == [(0, A, 0), (10, 0, A)]
+    assert _play(timeline) == [A] * 10 + [0]
+
+
+def test_consecutive_pushes_are_released_in_between():
+    timeline = _compile(Macro().push('a').push('a'))
+    for keyframe in timeline:
+        # a press and release of the same button in one key frame would keep it held
+        assert not keyframe.press & keyframe.release
+    ticks = [(k.tick, k.press, k.release) for k in timeline]
+    assert ticks == [(0, A, 0), (7, 0, A), (8, A, 0), (15, 0, A)]
+
+    states = _play(timeline)
+    assert _count_pushes(states, A) == 2
+    assert states[7] == 0
+
+
+def test_repeated_pushes():
+    timeline = _compile(Macro.parse('''
+        repeat 3
+            push a
+        end
+    '''))
+    for keyframe in timeline:
+        assert not keyframe.press & keyframe.release
+
+    states = _play(timeline)
+    assert _count_pushes(states, A) == 3
+    assert states[-1] == 0
+
+
+def test_repeat_with_wait():
+    timeline = _compile(Macro().repeat(2, Macro().push('a', sec=0.03).wait(0.03)))
+    assert [(k.tick, k.press, k.release) for k in timeline] == [(0, A, 0), (2, 0, A), (4, A, 0), (6, 0, A)]
+    assert _count_pushes(_play(timeline), A) == 2
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from joycontrol.controller import Controller
+from joycontrol.loopback import create_loopback_connection
+from joycontrol.memory import FlashMemory
+from joycontrol.protocol import controller_protocol_factory
+from joycontrol.report import SubCommand, SPI_FLASH_READ_REQUEST
+
+"""
+SPI flash memory. Expected bytes are the ones read from the list based FlashMemory.
+"""
+
+# (offset, size, read without, read with default stick calibration)
+READS = [
+    # end of the OTA region up to the factory configuration
+    (0x5FF8, 0x10, '6786a5c4e3022140607f9ebddcfb1a39', None),
+    # serial number
+    (0x6000, 0x10, '607f9ebddcfb1a39587796b5d4f31231', None),
+    # factory 6-axis calibration
+    (0x6020, 0x18, '405f7e9dbcdbfa1938577695b4d3f211304f6e8daccbea09', None),
+    # factory stick calibration
+    (0x603D, 0x12, 'c3e201203f5e7d9cbbdaf91837567594b3d2', '000770000880000770000880000770000770'),
+    # stick parameters
+    (0x6080, 0x18, 'e0ff1e3d5c7b9ab9d8f71635547392b1d0ef0e2d4c6b8aa9', None),
+    # user stick calibration
+    (0x8010, 0x16, 'b2a1aecdec0b2a496887a6b2a1032241607f9ebddcfb', None),
+    # user 6-axis calibration
+    (0x8026, 0x1A, '1a39587796b5d4f31231506f8eadcceb0a29486786a5c4e30221', None),
+    # end of the memory
+    (0x7FFE3, 0x1D, '7c9bbad9f81736557493b2d1f00f2e4d6c8baac9e80726456483a2c1e0', None),
+]
+
+
+def _dump():
+    data = bytearray((i * 31 + (i >> 8)) & 0xFF for i in range(0x80000))
+    # user calibration is available
+    data[0x8010:0x8012] = b'\xB2\xA1'
+    data[0x801B:0x801D] = b'\xB2\xA1'
+    return bytes(data)
+
+
+def _expected(default_stick_cal):
+    return [(offset, size, bytes.fromhex(with_cal if default_stick_cal and with_cal else without_cal))
+            for offset, size, without_cal, with_cal in READS]
+
+
+@pytest.mark.parametrize('default_stick_cal', [False, True])
+def test_reads(default_stick_cal):
+    memory = FlashMemory(_dump(), default_stick_cal=default_stick_cal)
+    assert len(memory) == 0x80000
+    for offset, size, expected in _expected(default_stick_cal):
+        assert bytes(memory[offset:offset + size]) == expected
+        assert memory[offset] == expected[0]
+
+
+@pytest.mark.parametrize('default_stick_cal', [False, True])
+def test_calibration(default_stick_cal):
+    memory = FlashMemory(_dump(), default_stick_cal=default_stick_cal)
+    if default_stick_cal:
+        assert memory.get_factory_l_stick_calibration() == bytes.fromhex('000770000880000770')
+        assert memory.get_factory_r_stick_calibration() == bytes.fromhex('000880000770000770')
+    else:
+        assert memory.get_factory_l_stick_calibration() == bytes.fromhex('c3e201203f5e7d9cbb')
+        assert memory.get_factory_r_stick_calibration() == bytes.fromhex('daf91837567594b3d2')
+    assert memory.get_user_l_stick_calibration() == bytes.fromhex('aecdec0b2a496887a6')
+    assert memory.get_user_r_stick_calibration() == bytes.fromhex('032241607f9ebddcfb')
+
+
+def test_blank_memory():
+    memory = FlashMemory()
+    assert bytes(memory[0x6000:0x6010]) == b'\xFF' * 0x10
+    assert memory.get_factory_l_stick_calibration() == bytes.fromhex('000770000880000770')
+    assert memory.get_user_l_stick_calibration() is None
+    assert memory.get_user_r_stick_calibration() is None
+
+    with pytest.raises(ValueError):
+        FlashMemory(bytes(0x1000))
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / 'spi_flash.bin'
+    path.write_bytes(_dump())
+
+    memory = FlashMemory.from_file(path, default_stick_cal=True)
+    for offset, size, expected in _expected(True):
+        assert bytes(memory[offset:offset + size]) == expected
+
+    # the calibration is not written back to the file
+    view = memory[0x603D:0x6046]
+    memory.close()
+    assert bytes(view) == bytes.fromhex('000770000880000770')
+    assert path.read_bytes() == _dump()
+    view.release()
+
+    path.write_bytes(bytes(0x1000))
+    with pytest.raises(ValueError):
+        FlashMemory.from_file(path)
+
+
+@pytest.mark.parametrize('default_stick_cal', [False, True])
+def test_spi_flash_read(default_stick_cal):
+    async def run():
+        memory = FlashMemory(_dump(), default_stick_cal=default_stick_cal)
+        transport, protocol, console = await create_loopback_connection(
+            controller_protocol_factory(Controller.PRO_CONTROLLER, spi_flash=memory))
+        try:
+            for offset, size, expected in _expected(default_stick_cal):
+                request = SPI_FLASH_READ_REQUEST.pack(offset, size)
+                reply = await console.send_sub_command(SubCommand.SPI_FLASH_READ, request)
+                # ACK, sub command, offset and size are followed by the data
+                assert bytes(reply[14:21]) == b'\x90\x10' + request
+                assert bytes(reply[21:21 + size]) == expected
+                assert not any(reply[21 + size:51])
+        finally:
+            await console.close()
+            await transport.close()
+
+    asyncio.run(run())
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from joycontrol.controller import Controller
+from joycontrol.loopback import create_loopback_connection
+from joycontrol.protocol import controller_protocol_factory
+from joycontrol.report import SubCommand, SPI_FLASH_READ_REQUEST, create_sub_command_reply
+
+"""
+Sub command replies of the controller protocol. Expected bytes are the ones produced by the if/elif dispatcher
+before the sub command registry, starting at the ACK byte (offset 14) of the 0x21 reply.
+"""
+
+
+def _run(coroutine_function, controller=Controller.PRO_CONTROLLER, **console_args):
+    async def run():
+        transport, protocol, console = await create_loopback_connection(controller_protocol_factory(controller),
+                                                                        **console_args)
+        try:
+            await coroutine_function(protocol, console)
+        finally:
+            await console.close()
+            await transport.close()
+
+    asyncio.run(run())
+
+
+def _reply_data(reply, length):
+    assert reply[1] == 0x21
+    return bytes(reply[14:51]).rstrip(b'\x00').ljust(length, b'\x00')
+
+
+ACK_REPLIES = [
+    (SubCommand.SET_SHIPMENT_STATE, b'\x00', '8008'),
+    (SubCommand.ENABLE_6AXIS_SENSOR, b'\x01', '8040'),
+    (SubCommand.ENABLE_VIBRATION, b'\x01', '8048'),
+    (SubCommand.SET_NFC_IR_MCU_STATE, b'\x01', '8022'),
+    (SubCommand.SET_NFC_IR_MCU_STATE, b'\x00', '8022'),
+    (SubCommand.SET_NFC_IR_MCU_CONFIG, b'\x21\x00\x01',
+     'a0210100ff0008001b0100000000000000000000000000000000000000000000000000c8'),
+    (SubCommand.SET_PLAYER_LIGHTS, b'\x01', '8030'),
+]
+
+
+@pytest.mark.parametrize('sub_command, data, expected', ACK_REPLIES)
+def test_reply(sub_command, data, expected):
+    async def check(protocol, console):
+        for _ in range(2):
+            # prebuilt replies are reused
+            reply = await console.send_sub_command(sub_command, data)
+            assert _reply_data(reply, 37) == bytes.fromhex(expected).ljust(37, b'\x00')
+        assert protocol.metrics.sub_commands[sub_command.value] == 2
+
+    _run(check)
+
+
+@pytest.mark.parametrize('controller, expected', [
+    (Controller.JOYCON_L, '8202040001027cbb8a0000010101'),
+    (Controller.JOYCON_R, '8202040002027cbb8a0000010101'),
+    (Controller.PRO_CONTROLLER, '8202040003027cbb8a0000010101'),
+])
+def test_device_info_reply(controller, expected):
+    async def check(protocol, console):
+        reply = await console.send_sub_command(SubCommand.REQUEST_DEVICE_INFO)
+        assert _reply_data(reply, 37) == bytes.fromhex(expected).ljust(37, b'\x00')
+
+    _run(check, controller=controller)
+
+
+@pytest.mark.parametrize('controller, expected', [
+    (Controller.JOYCON_L, '830400000000000000002c012c01'),
+    (Controller.JOYCON_R, '830400000000000000002c012c01'),
+    (Controller.PRO_CONTROLLER, '83042c012c01'),
+])
+def test_trigger_buttons_elapsed_time_reply(controller, expected):
+    async def check(protocol, console):
+        reply = await console.send_sub_command(SubCommand.TRIGGER_BUTTONS_ELAPSED_TIME)
+        assert _reply_data(reply, 37) == bytes.fromhex(expected).ljust(37, b'\x00')
+
+    _run(check, controller=controller)
+
+
+def test_spi_flash_read_reply_is_cleared():
+    async def check(protocol, console):
+        # without flash memory, zeros are read
+        reply = await console.send_sub_command(SubCommand.SPI_FLASH_READ, SPI_FLASH_READ_REQUEST.pack(0x6000, 0x1D))
+        assert _reply_data(reply, 37) == bytes.fromhex('9010006000001d').ljust(37, b'\x00')
+
+        # the reply is reused, no data of the longer read is left
+        protocol.spi_flash = bytes(range(0x100)) * 0x800
+        reply = await console.send_sub_command(SubCommand.SPI_FLASH_READ, SPI_FLASH_READ_REQUEST.pack(0x6010, 0x02))
+        assert _reply_data(reply, 37) == bytes.fromhex('901010600000021011').ljust(37, b'\x00')
+
+    _run(check)
+
+
+def test_set_input_report_mode_reply():
+    async def check(protocol, console):
+        reply = await console.send_sub_command(SubCommand.SET_INPUT_REPORT_MODE, b'\x30')
+        assert _reply_data(reply, 37) == bytes.fromhex('8003').ljust(37, b'\x00')
+        await asyncio.wait_for(protocol.wait_for_full_input_report_mode(), 1)
+        assert protocol.get_input_report_mode() == 0x30
+
+        # answered in the full input report mode as well
+        reply = await console.send_sub_command(SubCommand.SET_SHIPMENT_STATE, b'\x00')
+        assert _reply_data(reply, 37) == bytes.fromhex('8008').ljust(37, b'\x00')
+
+    _run(check)
+
+
+def test_registered_handler():
+    async def check(protocol, console):
+        requests = []
+        reply = create_sub_command_reply(0x80, 0x50)
+
+        async def handler(sub_command_data):
+            requests.append(bytes(sub_command_data[:2]))
+            await protocol.write(reply)
+
+        # raw ids of unknown sub commands can be registered
+        protocol.register_sub_command_handler(0x50, handler)
+        assert _reply_data(await console.send_sub_command(0x50, b'\x01\x02'), 37) == b'\x80\x50'.ljust(37, b'\x00')
+        assert requests == [b'\x01\x02']
+
+        # replaces the default handler
+        protocol.register_sub_command_reply(SubCommand.SET_PLAYER_LIGHTS, ack=0x81)
+        reply = await console.send_sub_command(SubCommand.SET_PLAYER_LIGHTS, b'\x01')
+        assert _reply_data(reply, 37) == b'\x81\x30'.ljust(37, b'\x00')
+
+        # not answered anymore
+        protocol.unregister_sub_command_handler(0x50)
+        with pytest.raises(asyncio.TimeoutError):
+            await console.send_sub_command(0x50, b'\x01\x02')
+        assert protocol.metrics.sub_commands[0x50] == 2
+        assert requests == [b'\x01\x02']
+
+    _run(check, reply_timeout=0.1, retries=0)
@@ -0,0 +1,170 @@
+import pytest
+
+from joycontrol.controller import Controller
+from joycontrol.report import InputReport, OutputReport, OutputReportID, SubCommand, IMU_DATA_SIZE, \
+    classify_output_report, get_sub_command_id, lookup_sub_command
+
+"""
+Input and output reports. Expected bytes are the ones produced by the list based reports before the reports were
+backed by a bytearray.
+"""
+
+
+def _expected(data_hex, length):
+    return bytes.fromhex(data_hex).ljust(length, b'\x00')
+
+
+def _input_report(_id):
+    report = InputReport()
+    report.set_input_report_id(_id)
+    report.set_timer(0x142)
+    report.set_misc()
+    report.set_button_status([0x08, 0x10, 0x80])
+    report.set_left_analog_stick(b'\x01\x02\x03')
+    report.set_right_analog_stick(b'\xAA\xBB\xCC')
+    report.set_vibrator_input()
+    return report
+
+
+def test_spi_flash_read_reply():
+    report = _input_report(0x21)
+    report.set_ack(0x90)
+    report.sub_0x10_spi_flash_read(0x6050, 0x0D, bytes(range(1, 14)))
+    assert bytes(report) == _expected('a121428e081080010203aabbcc809010506000000d0102030405060708090a0b0c0d', 51)
+
+
+def test_device_info_reply():
+    report = _input_report(0x21)
+    report.set_ack(0x82)
+    report.sub_0x02_device_info(bytes.fromhex('94585cb3a1c2'), controller=Controller.PRO_CONTROLLER)
+    assert bytes(report) == _expected('a121428e081080010203aabbcc8082020400030294585cb3a1c20101', 51)
+
+
+def test_trigger_buttons_elapsed_time_reply():
+    report = _input_report(0x21)
+    report.set_ack(0x83)
+    report.reply_to_subcommand_id(0x04)
+    report.sub_0x04_trigger_buttons_elapsed_time(L_ms=3000, ZR_ms=655350, HOME_ms=10)
+    assert bytes(report) == _expected('a121428e081080010203aabbcc8083042c0100000000ffff0000000001', 51)
+
+    report.clear_sub_command()
+    assert bytes(report) == _expected('a121428e081080010203aabbcc80', 51)
+
+
+def test_standard_full_report():
+    report = _input_report(0x30)
+    report.set_6axis_data(None)
+    assert bytes(report) == _expected('a130428e081080010203aabbcc80', 14)
+    assert report.get_view() == bytes(report)
+
+
+def test_standard_full_report_with_imu_data():
+    report = _input_report(0x30)
+    imu_data = bytes(range(1, IMU_DATA_SIZE + 1))
+    report.set_6axis_data(imu_data)
+    assert bytes(report) == bytes.fromhex('a130428e081080010203aabbcc80') + imu_data
+
+    # back to the short report
+    report.set_6axis_data(None)
+    assert bytes(report) == _expected('a130428e081080010203aabbcc80', 14)
+    report.set_input_report_id(0x21)
+    assert bytes(report) == _expected('a121428e081080010203aabbcc80', 51)
+
+    with pytest.raises(ValueError):
+        report.set_6axis_data(imu_data[1:])
+
+
+def test_nfc_ir_report():
+    report = _input_report(0x31)
+    report.set_ir_nfc_data(bytes(range(1, 0x20)))
+    assert bytes(report) == _expected('a131428e081080010203aabbcc80' + '00' * 36 + bytes(range(1, 0x20)).hex(), 363)
+
+    with pytest.raises(ValueError):
+        report.set_ir_nfc_data(bytes(315))
+
+
+def test_unknown_report_id():
+    report = _input_report(0x3F)
+    assert bytes(report) == _expected('a13f428e081080010203aabbcc80', 51)
+
+
+def test_view_reflects_changes():
+    report = _input_report(0x21)
+    view = report.get_view()
+    report.set_ack(0x80)
+    assert view[14] == 0x80
+    assert bytes(InputReport(bytes(report))) == bytes(report)
+
+    with pytest.raises(ValueError):
+        InputReport(b'\xA2\x21')
+
+
+@pytest.mark.parametrize('output_report_id', OutputReportID)
+def test_classify_output_report(output_report_id):
+    data = bytes((0xA2, output_report_id.value, 0x05)) + bytes(47)
+    assert classify_output_report(data) is output_report_id
+    assert classify_output_report(memoryview(data)) is output_report_id
+    assert OutputReport(data).get_output_report_id() is output_report_id
+
+
+@pytest.mark.parametrize('data', [
+    b'', b'\xA2\x01', b'\xA1\x01\x00', b'\xA2\x3F\x00' + bytes(47),
+])
+def test_classify_malformed_output_report(data):
+    assert classify_output_report(data) is None
+
+
+def test_sub_command_request():
+    report = OutputReport()
+    report.sub_0x10_spi_flash_read(0x6050, 0x0D)
+    report.set_timer(0x13)
+    assert bytes(report) == _expected('a20103000000000000000010506000000d', 50)
+    assert report.get_timer() == 0x03
+
+    data = bytes(report)
+    assert get_sub_command_id(data) == 0x10
+    assert lookup_sub_command(get_sub_command_id(data)) is SubCommand.SPI_FLASH_READ
+    assert OutputReport(data).get_sub_command() is SubCommand.SPI_FLASH_READ
+    assert bytes(OutputReport(data).get_sub_command_data()[:5]) == bytes.fromhex('506000000d')
+
+    with pytest.raises(ValueError):
+        report.sub_0x10_spi_flash_read(0x6050, 0x1E)
+    with pytest.raises(ValueError):
+        report.sub_0x10_spi_flash_read(0x7FFF0, 0x11)
+
+
+def test_sub_command_data():
+    report = OutputReport()
+    report.set_output_report_id(0x01)
+    report.set_sub_command(0x30)
+    report.set_sub_command_data([0x01, 0x02])
+    assert bytes(report) == _expected('a201000000000000000000300102', 50)
+
+    # the sub command data is not copied
+    data = bytearray(report.data)
+    sub_command_data = OutputReport(data).get_sub_command_data()
+    data[12] = 0x0F
+    assert sub_command_data[0] == 0x0F
+
+
+def test_unknown_ids():
+    data = bytes((0xA2, 0x3F, 0x00)) + bytes(8) + b'\xEE' + bytes(38)
+    with pytest.raises(NotImplementedError):
+        OutputReport(data).get_output_report_id()
+    with pytest.raises(NotImplementedError):
+        OutputReport(data).get_sub_command()
+    assert get_sub_command_id(data) == 0xEE
+    assert lookup_sub_command(0xEE) is None
+
+    # too short for a sub command
+    assert get_sub_command_id(b'\xA2\x01\x00') is None
+    assert OutputReport(b'\xA2\x01\x00').get_sub_command_data() is None
+
+    with pytest.raises(ValueError):
+        OutputReport(b'\xA1\x01\x00')
+
+
+def test_rumble_data():
+    rumble_data = bytes((0x00, 0x01, 0x40, 0x40, 0x80, 0xC9, 0x20, 0x72))
+    data = bytes((0xA2, 0x10, 0x0A)) + rumble_data + bytes(39)
+    assert bytes(OutputReport(data).get_rumble_data()) == rumble_data
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from joycontrol.controller import Controller
+from joycontrol.loopback import create_loopback_connection
+from joycontrol.protocol import controller_protocol_factory
+from joycontrol.report import OutputReport, OutputReportID
+from joycontrol.rumble import decode_vibration, decode_rumble, is_vibrating, RumbleDecoder, Vibration, \
+    NEUTRAL_RUMBLE_DATA, RUMBLE_DATA_OFFSET
+
+"""
+Decoding of HD rumble data and rumble subscriptions.
+Encodings from https://github.com/dekuNukem/Nintendo_Switch_Reverse_Engineering/blob/master/rumble_data_table.md
+"""
+
+VIBRATIONS = [
+    # motor at rest
+    (bytes((0x00, 0x01, 0x40, 0x40)), Vibration(320, 0, 160, 0)),
+    # amplitude code 100 (0xC8 high, 0x8072 low)
+    (bytes((0x80, 0xC9, 0x20, 0x72)), Vibration(640, 1.003, 80, 1.003)),
+    # amplitude code 1 (0x02 high, 0x8040 low), lowest bit of the low amplitude in byte 2
+    (bytes((0x80, 0x02, 0xA0, 0x40)), Vibration(160, 0.00994, 80, 0.00994)),
+    # amplitude code 16 (0x20 high, 0x0048 low), first code of the second segment
+    (bytes((0x00, 0x20, 0x60, 0x48)), Vibration(80, 0.1176, 320, 0.1176)),
+    # low amplitude bytes below 0x40 are invalid
+    (bytes((0x00, 0x01, 0x40, 0x00)), Vibration(320, 0, 160, 0)),
+]
+
+_RUMBLE = bytes((0x80, 0xC9, 0x20, 0x72)) * 2
+
+
+def _output_report(rumble_data, report_id=OutputReportID.RUMBLE_ONLY, timer=0):
+    return bytes((0xA2, report_id.value, timer)) + rumble_data + bytes(39)
+
+
+@pytest.mark.parametrize('data, vibration', VIBRATIONS)
+def test_decode_vibration(data, vibration):
+    # the table values are rounded
+    assert tuple(decode_vibration(data)) == pytest.approx(tuple(vibration), rel=1e-3)
+    assert decode_vibration(b'\xFF' + data, offset=1) == decode_vibration(data)
+
+
+def test_decode_rumble():
+    rumble = decode_rumble(NEUTRAL_RUMBLE_DATA)
+    assert rumble.left == rumble.right == Vibration(320, 0, 160, 0)
+    assert not is_vibrating(rumble.left)
+
+    rumble = decode_rumble(VIBRATIONS[0][0] + VIBRATIONS[2][0])
+    assert not is_vibrating(rumble.left)
+    assert is_vibrating(rumble.right)
+
+
+def test_decoder_publishes_changes():
+    decoder = RumbleDecoder()
+    subscription = decoder.subscribe()
+
+    # the Switch repeats the rumble data at the report rate
+    decoder.feed(_output_report(NEUTRAL_RUMBLE_DATA))
+    assert subscription.get_nowait() is None
+
+    decoder.feed(_output_report(_RUMBLE, report_id=OutputReportID.SUB_COMMAND))
+    decoder.feed(_output_report(_RUMBLE, timer=1))
+    assert decoder.reports == 3
+    assert decoder.changes == 1
+    assert subscription.get_nowait() == decode_rumble(_RUMBLE)
+    assert subscription.get_nowait() is None
+
+    # only the latest change is kept
+    decoder.feed(_output_report(NEUTRAL_RUMBLE_DATA))
+    decoder.feed(_output_report(_RUMBLE))
+    assert subscription.coalesced == 1
+    assert subscription.get_nowait() == decoder.get_rumble() == decode_rumble(_RUMBLE)
+
+    subscription.close()
+    decoder.feed(_output_report(NEUTRAL_RUMBLE_DATA))
+    assert subscription.get_nowait() is None
+
+
+def test_subscription_iteration():
+    async def run():
+        decoder = RumbleDecoder()
+        subscription = decoder.subscribe()
+
+        async def receive():
+            return [rumble async for rumble in subscription]
+
+        receiver = asyncio.ensure_future(receive())
+        await asyncio.sleep(0)
+        # delivered to the waiting receiver
+        decoder.feed(_output_report(_RUMBLE))
+        await asyncio.sleep(0)
+        decoder.close()
+
+        assert await asyncio.wait_for(receiver, 1) == [decode_rumble(_RUMBLE)]
+
+    asyncio.run(run())
+
+
+def test_subscribe_rumble_of_controller_state():
+    async def run():
+        transport, protocol, console = await create_loopback_connection(
+            controller_protocol_factory(Controller.PRO_CONTROLLER))
+        try:
+            await console.pair()
+            subscription = protocol.get_controller_state().subscribe_rumble()
+
+            await console.send_output_report(OutputReport(bytearray(_output_report(_RUMBLE))))
+            rumble = await asyncio.wait_for(subscription.get(), 1)
+            assert rumble == decode_rumble(_RUMBLE)
+            assert is_vibrating(rumble.left) and is_vibrating(rumble.right)
+        finally:
+            await console.close()
+            await transport.close()
+
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from joycontrol.scheduler import TickEngine
+
+"""
+Tick engine shared by several protocols.
+"""
+
+
+class _Protocol:
+    def __init__(self, cancelled=False):
+        self.cancelled = cancelled
+        self.reports = 0
+
+    async def _full_mode_prepare(self):
+        if self.cancelled:
+            # e.g. the read future of a closed transport
+            future = asyncio.get_event_loop().create_future()
+            future.cancel()
+            await future
+        return object()
+
+    async def _send_report(self, report):
+        self.reports += 1
+
+
+def test_cancelled_protocol_does_not_stop_engine():
+    async def run():
+        engine = TickEngine(rate=200)
+        bad, good = _Protocol(cancelled=True), _Protocol()
+        bad_task = asyncio.ensure_future(engine.attach(bad))
+        good_task = asyncio.ensure_future(engine.attach(good))
+        await asyncio.sleep(0.1)
+
+        assert isinstance(bad_task.exception(), RuntimeError)
+        assert not good_task.done()
+        assert good.reports > 1
+        assert engine.get_attached_count() == 1
+
+        engine.stop()
+        await asyncio.wait_for(good_task, 1)
+
+    asyncio.run(run())
+
+
+def test_engine_failure_stops_all_protocols():
+    async def run():
+        engine = TickEngine(rate=200)
+
+        async def fail():
+            raise ValueError('Scheduler failed')
+
+        engine.scheduler.wait_next = fail
+        with pytest.raises(ValueError):
+            await asyncio.wait_for(asyncio.gather(engine.attach(_Protocol()), engine.attach(_Protocol())), 1)
+
+    asyncio.run(run())